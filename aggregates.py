@@ -0,0 +1,314 @@
+"""
+Pre-aggregated sales summaries over the staged star schema, so the sales queries don't re-join and re-sum the whole of
+orders_table on every call.
+
+Each summary groups the orders by some dimension columns and keeps three measures: total_sales
+(SUM(product_quantity * product_price)), product_quantity (SUM(product_quantity)) and number_of_sales (COUNT(date_uuid)).
+A query over orders_table that only groups or filters by a summary's columns, and only uses those measures, is rewritten
+to read the summary instead.
+"""
+import glob
+import json
+import os
+import re
+import time
+
+# the dimension table joined to the orders for each summary's columns. dim_products is left joined for the price of
+# every other summary, so their counts include orders whatever product they are for
+AGGREGATES = {
+    'sales_by_month': {'columns': ['year', 'month'], 'joins': ['dim_date_times']},
+    'sales_by_store_type': {'columns': ['store_type', 'country_code'], 'joins': ['dim_store_details']},
+    'sales_by_category': {'columns': ['category'], 'joins': ['dim_products']}
+}
+
+JOIN_KEYS = {
+    'dim_products': 'product_code',
+    'dim_store_details': 'store_code',
+    'dim_date_times': 'date_uuid',
+    'dim_card_details': 'card_number',
+    'dim_users': 'user_uuid'
+}
+
+# each measure expression the queries use, the expression that computes it from a summary and whether it is weighted by price
+MEASURES = [
+    (r'SUM\(\s*product_quantity\s*\*\s*product_price\s*\)', 'SUM(total_sales)', True),
+    (r'SUM\(\s*product_price\s*\*\s*product_quantity\s*\)', 'SUM(total_sales)', True),
+    (r'SUM\(\s*product_quantity\s*\)', 'SUM(product_quantity)', False),
+    (r'COUNT\(\s*(?:orders_table\.)?date_uuid\s*\)', 'CAST(SUM(number_of_sales) AS BIGINT)', False)
+]
+
+FROM_ORDERS = re.compile(
+    r'\bFROM\s+orders_table((?:\s+(?:INNER\s+)?JOIN\s+\w+\s+ON\s+[\w.]+\s*=\s*[\w.]+)*)',
+    re.IGNORECASE
+)
+JOIN = re.compile(r'JOIN\s+(\w+)\s+ON\s+([\w.]+)\s*=\s*([\w.]+)', re.IGNORECASE)
+
+
+def sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def innermost_subquery(sql):
+    """
+    Returns the start and end of the last '(SELECT ...)' in the query, which can't contain another, or None
+    """
+    matches = list(re.finditer(r'\(\s*SELECT\b', sql, re.IGNORECASE))
+    if not matches:
+        return None
+
+    start = matches[-1].start()
+    depth = 0
+    for position in range(start, len(sql)):
+        if sql[position] == '(':
+            depth += 1
+        elif sql[position] == ')':
+            depth -= 1
+            if depth == 0:
+                return start, position + 1
+
+    return None
+
+
+class SalesAggregates:
+    """
+    Materialises the AGGREGATES as Parquet in <staging_dir>/aggregates/ and routes queries to them.
+
+    refresh() aggregates only the orders files staged since the last refresh and merges them into the summaries. If a
+    staged dimension has changed, or orders_table was replaced, the summaries are rebuilt from scratch. Queries are only
+    routed while the summaries are up to date with the staged tables.
+
+    conn is a DuckDB connection with a view over each staged table, see sales_queries.SalesQueries.
+    """
+
+    def __init__(self, staging, conn):
+        self.staging = staging
+        self.conn = conn
+        self.aggregates_dir = os.path.join(staging.staging_dir, 'aggregates')
+
+    def _state_path(self):
+        return os.path.join(self.aggregates_dir, 'state.json')
+
+    def _read_state(self):
+        if not os.path.exists(self._state_path()):
+            return None
+
+        with open(self._state_path(), 'r') as f:
+            return json.load(f)
+
+    def _write_state(self, state):
+        temp_path = f'{self._state_path()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f, indent=4)
+        os.replace(temp_path, self._state_path())
+
+    def aggregate_path(self, name):
+        return os.path.join(self.aggregates_dir, f'{name}.parquet')
+
+    def orders_files(self):
+        """
+        Returns the staged orders files, relative to the orders_table directory
+        """
+        orders_path = self.staging.table_path('orders_table')
+        files = glob.glob(os.path.join(orders_path, '**', '*.parquet'), recursive=True)
+
+        return sorted(os.path.relpath(file, orders_path) for file in files)
+
+    def dimension_versions(self):
+        """
+        Returns when each dimension the summaries are built from was last staged
+        """
+        manifest = self.staging._read_manifest()
+        dimensions = {'dim_products'} | {table for aggregate in AGGREGATES.values() for table in aggregate['joins']}
+
+        missing = sorted((dimensions | {'orders_table'}) - set(manifest))
+        if missing:
+            raise ValueError(f'{missing} must be staged before the sales aggregates can be built')
+
+        return {table: manifest[table]['written_at'] for table in sorted(dimensions)}
+
+    def is_fresh(self):
+        """
+        Returns whether the summaries cover exactly the staged orders and dimensions
+        """
+        state = self._read_state()
+        if state is None:
+            return False
+
+        try:
+            return state['dimensions'] == self.dimension_versions() and state['orders_files'] == self.orders_files()
+        except ValueError:
+            return False
+
+    def aggregate_sql(self, name, orders_files):
+        """
+        Returns the query that summarises the given orders files
+        """
+        aggregate = AGGREGATES[name]
+        orders_path = self.staging.table_path('orders_table')
+        files = ', '.join(sql_string(os.path.join(orders_path, file)) for file in orders_files)
+
+        joins = [f'INNER JOIN {table} ON orders_table.{JOIN_KEYS[table]} = {table}.{JOIN_KEYS[table]}' for table in aggregate['joins']]
+        if 'dim_products' not in aggregate['joins']:
+            joins.append('LEFT JOIN dim_products ON orders_table.product_code = dim_products.product_code')
+
+        columns = ', '.join(aggregate['columns'])
+        joins = '\n'.join(joins)
+
+        return f"""
+            SELECT {columns},
+                SUM(orders_table.product_quantity * dim_products.product_price) AS total_sales,
+                CAST(SUM(orders_table.product_quantity) AS BIGINT) AS product_quantity,
+                COUNT(orders_table.date_uuid) AS number_of_sales
+            FROM read_parquet([{files}], hive_partitioning = false) AS orders_table
+            {joins}
+            GROUP BY {columns}
+        """
+
+    def merge_sql(self, name, delta_sql):
+        """
+        Returns the query that adds a summary of new orders to the existing summary
+        """
+        columns = ', '.join(AGGREGATES[name]['columns'])
+
+        return f"""
+            SELECT {columns},
+                SUM(total_sales) AS total_sales,
+                CAST(SUM(product_quantity) AS BIGINT) AS product_quantity,
+                CAST(SUM(number_of_sales) AS BIGINT) AS number_of_sales
+            FROM (
+                SELECT * FROM read_parquet({sql_string(self.aggregate_path(name))})
+                UNION ALL BY NAME
+                {delta_sql}
+            )
+            GROUP BY {columns}
+        """
+
+    def write_aggregate(self, name, sql):
+        temp_path = f'{self.aggregate_path(name)}.tmp'
+        self.conn.execute(f"COPY ({sql}) TO {sql_string(temp_path)} (FORMAT parquet, COMPRESSION zstd)")
+        os.replace(temp_path, self.aggregate_path(name))
+
+    def refresh(self):
+        """
+        Brings the summaries up to date with the staged tables, returning 'rebuilt', 'updated' or 'unchanged'
+        """
+        os.makedirs(self.aggregates_dir, exist_ok=True)
+
+        state = self._read_state()
+        dimensions = self.dimension_versions()
+        orders_files = self.orders_files()
+
+        if state is not None and state['dimensions'] == dimensions and set(state['orders_files']) <= set(orders_files) \
+                and all(os.path.exists(self.aggregate_path(name)) for name in AGGREGATES):
+            new_files = sorted(set(orders_files) - set(state['orders_files']))
+            if not new_files:
+                return 'unchanged'
+
+            for name in AGGREGATES:
+                self.write_aggregate(name, self.merge_sql(name, self.aggregate_sql(name, new_files)))
+            status = 'updated'
+        else:
+            for name in AGGREGATES:
+                self.write_aggregate(name, self.aggregate_sql(name, orders_files))
+            status = 'rebuilt'
+
+        self._write_state({'dimensions': dimensions, 'orders_files': orders_files, 'refreshed_at': time.time()})
+        self.create_views()
+
+        return status
+
+    def create_views(self):
+        """
+        Creates a view over each materialised summary, named after it
+        """
+        for name in AGGREGATES:
+            if os.path.exists(self.aggregate_path(name)):
+                self.conn.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM read_parquet({sql_string(self.aggregate_path(name))})')
+
+    def base_columns(self, tables):
+        columns = set()
+        for table in tables:
+            columns.update(column[0].lower() for column in self.conn.execute(f'SELECT * FROM "{table}" LIMIT 0').description)
+
+        return columns
+
+    def route_select(self, sql):
+        """
+        Rewrites a single SELECT over orders_table, without subqueries, to read the smallest summary that can answer it.
+        Returns None if no summary can
+        """
+        from_clauses = FROM_ORDERS.findall(sql)
+        if len(from_clauses) != 1 or len(re.findall(r'\bFROM\b', sql, re.IGNORECASE)) != 1:
+            return None
+
+        joined = []
+        for table, left, right in JOIN.findall(from_clauses[0]):
+            table = table.lower()
+            key = JOIN_KEYS.get(table)
+            if key is None or {left.lower(), right.lower()} != {f'orders_table.{key}', f'{table}.{key}'}:
+                return None
+            joined.append(table)
+
+        measures_used = [weighted for pattern, _, weighted in MEASURES if re.search(pattern, sql, re.IGNORECASE)]
+        if not measures_used:
+            return None
+
+        # whatever is left once the FROM clause and the measures are taken out must be a summary column
+        remainder = FROM_ORDERS.sub(' ', sql)
+        for pattern, _, _ in MEASURES:
+            remainder = re.sub(pattern, ' ', remainder, flags=re.IGNORECASE)
+        remainder = re.sub(r"'[^']*'", ' ', remainder).lower()
+        if re.search(r'\b[a-z_]\w*\.\w+', remainder):
+            return None
+
+        identifiers = set(re.findall(r'\b[a-z_][a-z0-9_]*\b', remainder))
+        needed = identifiers & self.base_columns(['orders_table'] + joined)
+
+        for name, aggregate in sorted(AGGREGATES.items(), key=lambda item: len(item[1]['columns'])):
+            if not needed <= set(aggregate['columns']):
+                continue
+            if set(joined) - {'dim_products'} != set(aggregate['joins']) - {'dim_products'}:
+                continue
+            if 'dim_products' in aggregate['joins'] and 'dim_products' not in joined:
+                continue
+            # the summary counts orders without a matching product, a query that inner joins dim_products doesn't
+            if 'dim_products' in joined and 'dim_products' not in aggregate['joins'] and not all(measures_used):
+                continue
+
+            routed = FROM_ORDERS.sub(f'FROM "{name}"', sql)
+            for pattern, replacement, _ in MEASURES:
+                routed = re.sub(pattern, replacement, routed, flags=re.IGNORECASE)
+            return routed
+
+        return None
+
+    def route(self, sql):
+        """
+        Rewrites a query to read the summaries, one subquery at a time. Returns None if any part of it can't be, or if
+        the summaries are out of date
+        """
+        if re.search(r'\b(WITH|OVER|UNION)\b', sql, re.IGNORECASE) or not self.is_fresh():
+            return None
+
+        subqueries = []
+        while True:
+            span = innermost_subquery(sql)
+            if span is None:
+                break
+
+            start, end = span
+            routed = self.route_select(sql[start + 1:end - 1])
+            if routed is None:
+                return None
+
+            subqueries.append(routed)
+            sql = f'{sql[:start]}__subquery_{len(subqueries) - 1}__{sql[end:]}'
+
+        sql = self.route_select(sql)
+        if sql is None:
+            return None
+
+        for number, routed in reversed(list(enumerate(subqueries))):
+            sql = sql.replace(f'__subquery_{number}__', f'({routed})')
+
+        return sql
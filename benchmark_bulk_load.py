@@ -0,0 +1,181 @@
+"""
+Benchmarks DatabaseConnector.upload_to_db's to_sql path against the COPY-based bulk path.
+
+Runs against a throwaway local PostgreSQL started with pgserver (pip install pgserver), or against an existing
+server when a credentials file is passed with --creds:
+
+    python benchmark_bulk_load.py --rows 10000 100000 --creds local_postgres_creds.yaml
+
+--workers also times DataCleaning.clean_orders_data's partitioned mode, which extracts, cleans and loads orders_table
+with that many processes, on a synthetic orders_table of each size:
+
+    python benchmark_bulk_load.py --rows 120000 1000000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import yaml
+from sqlalchemy import text
+
+from data_cleaning import DataCleaning
+from database_utils import DatabaseConnector
+from synthetic_data import make_orders_table
+
+
+def make_orders_frame(rows, seed=0):
+    """Builds a cleaned orders_table-shaped DataFrame with the given number of rows"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'date_uuid': [str(uuid.UUID(int=int(value))) for value in rng.integers(0, 2 ** 63, rows)],
+        'user_uuid': [str(uuid.UUID(int=int(value))) for value in rng.integers(0, 2 ** 63, rows)],
+        'card_number': rng.integers(10 ** 15, 10 ** 16, rows).astype(str),
+        'store_code': rng.choice(['WEB-1388012W', 'BL-8387506C', 'HI-9B97EE4E', 'CH-01D85C8D'], rows),
+        'product_code': rng.choice(['R7-3126933h', 'C2-7287916l', 'S7-1175877v', 'D8-8421505n'], rows),
+        'product_quantity': rng.integers(1, 14, rows)
+    })
+
+
+def start_local_postgres():
+    """Starts a local PostgreSQL with pgserver and writes a credentials file for it"""
+    import pgserver
+
+    pgdata = tempfile.mkdtemp(prefix='benchmark_pgdata_')
+    server = pgserver.get_server(pgdata, cleanup_mode='delete')
+
+    creds_file = f'{pgdata}_creds.yaml'
+    with open(creds_file, 'w') as f:
+        yaml.dump({'RDS_USER': 'postgres', 'RDS_PASSWORD': '', 'RDS_HOST': pgdata, 'RDS_PORT': 5432, 'RDS_DATABASE': 'postgres'}, f)
+
+    return server, creds_file
+
+
+def benchmark_upload(connector, df, bulk, repeats, batch_size):
+    """Returns the best of `repeats` upload times for one load path"""
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        connector.upload_to_db(df, 'benchmark_orders', bulk=bulk, batch_size=batch_size)
+        times.append(time.perf_counter() - start_time)
+
+    return min(times)
+
+
+def run_benchmarks(creds_file, row_counts, repeats=3, batch_size=100000):
+    """Times both load paths for each row count and checks they load the same number of rows"""
+    connector = DatabaseConnector(target_creds_file=creds_file)
+    engine = connector.get_engine(creds_file)
+    results = {
+        'rows': [],
+        'to_sql_time': [],
+        'copy_time': [],
+        'speedup': []
+    }
+
+    for rows in row_counts:
+        df = make_orders_frame(rows)
+
+        to_sql_time = benchmark_upload(connector, df, False, repeats, batch_size)
+        copy_time = benchmark_upload(connector, df, True, repeats, batch_size)
+
+        with engine.connect() as connection:
+            loaded_rows = connection.execute(text('SELECT COUNT(*) FROM benchmark_orders')).scalar()
+        assert loaded_rows == rows, f'COPY loaded {loaded_rows} rows, expected {rows}'
+
+        results['rows'].append(rows)
+        results['to_sql_time'].append(to_sql_time)
+        results['copy_time'].append(copy_time)
+        results['speedup'].append(to_sql_time / copy_time if copy_time > 0 else float('inf'))
+
+        print(f"{rows} rows - to_sql: {to_sql_time:.4f}s, COPY: {copy_time:.4f}s, Speedup: {to_sql_time / copy_time:.2f}x")
+
+    return results
+
+
+def run_partitioned_benchmarks(creds_file, row_counts, worker_counts, repeats=3):
+    """Times the partitioned orders load with each number of workers, reading a synthetic orders_table from a second database on the same server"""
+    with open(creds_file, 'r') as f:
+        creds = yaml.safe_load(f)
+
+    connector = DatabaseConnector(target_creds_file=creds_file)
+    with connector.get_engine(creds_file).connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('DROP DATABASE IF EXISTS benchmark_orders_source WITH (FORCE)'))
+        connection.execute(text('CREATE DATABASE benchmark_orders_source'))
+
+    source_creds_file = f'{os.path.splitext(creds_file)[0]}_orders_source.yaml'
+    with open(source_creds_file, 'w') as f:
+        yaml.dump(dict(creds, RDS_DATABASE='benchmark_orders_source'), f)
+
+    connector = DatabaseConnector(source_creds_file=source_creds_file, target_creds_file=creds_file)
+    cleaner = DataCleaning(connector)
+    results = {
+        'rows': [],
+        'workers': [],
+        'time': [],
+        'speedup': [],
+        'efficiency': []
+    }
+
+    for rows in row_counts:
+        make_orders_table(rows).to_sql('orders_table', connector.init_db_engine(), if_exists='replace', index=False, chunksize=50000)
+        single_worker_time = None
+
+        # one worker is always timed first, it is what the speedups are measured against
+        for workers in sorted(set(worker_counts) | {1}):
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                loaded_rows = cleaner.clean_orders_data(workers=workers)
+                times.append(time.perf_counter() - start_time)
+            assert loaded_rows == rows, f'the partitioned load loaded {loaded_rows} rows, expected {rows}'
+
+            best_time = min(times)
+            if workers == 1:
+                single_worker_time = best_time
+            speedup = single_worker_time / best_time
+
+            results['rows'].append(rows)
+            results['workers'].append(workers)
+            results['time'].append(best_time)
+            results['speedup'].append(speedup)
+            results['efficiency'].append(speedup / workers)
+
+            print(f"{rows} rows, {workers} workers - {best_time:.4f}s, Speedup over 1 worker: {speedup:.2f}x")
+
+    connector.close()
+    os.remove(source_creds_file)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark to_sql against COPY-based bulk loading')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 120000, 500000])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=100000)
+    parser.add_argument('--creds', help='credentials file of an existing PostgreSQL server, a local one is started with pgserver if omitted')
+    parser.add_argument('--output', default='bulk_load_benchmark_results.csv')
+    parser.add_argument('--workers', type=int, nargs='+', help='also time the partitioned orders load with each of these numbers of worker processes')
+    parser.add_argument('--partitioned-output', default='partitioned_load_benchmark_results.csv')
+    args = parser.parse_args()
+
+    server = None
+    creds_file = args.creds
+    if creds_file is None:
+        server, creds_file = start_local_postgres()
+
+    try:
+        results = run_benchmarks(creds_file, args.rows, args.repeats, args.batch_size)
+        pd.DataFrame(results).to_csv(args.output, index=False)
+        print(f"\nResults saved to '{args.output}'")
+
+        if args.workers:
+            results = run_partitioned_benchmarks(creds_file, args.rows, args.workers, args.repeats)
+            pd.DataFrame(results).to_csv(args.partitioned_output, index=False)
+            print(f"\nResults saved to '{args.partitioned_output}'")
+    finally:
+        if server is not None:
+            server.cleanup()
@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import tabula
 import numpy as np
+import duckdb
+import pyarrow as pa
 
 # Import original pandas implementations
 from data_cleaning import DataCleaning as PandasDataCleaning
@@ -12,6 +14,16 @@ from data_extraction import DataExtractor as PandasDataExtractor
 # Import DuckDB implementations
 from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
 from duckdb_data_extraction import DataExtractor as DuckDBDataExtractor
+from local_store_api import make_store
+from s3_ingest import read_csv_table
+from source_cache import SourceCache
+from database_utils import DatabaseConnector
+from sales_queries import load_queries
+from schema_registry import ENUMS
+from date_parsing import DateParser
+from memory_profiling import measure_memory
+from synthetic_data import make_raw_frames
+from benchmark_suite import CLEANERS
 
 def benchmark_function(func, *args, **kwargs):
     """Measure the execution time of a function"""
@@ -21,18 +33,39 @@ def benchmark_function(func, *args, **kwargs):
     execution_time = end_time - start_time
     return execution_time, result
 
+def benchmark_memory(func, *args, **kwargs):
+    """Measure the memory used by a function: its tracemalloc and peak RSS peaks and the size of its input and output tables"""
+    _, memory = measure_memory(func, *args, **kwargs)
+    return memory
+
+def cold_extractors():
+    """A pandas and a DuckDB extractor that bypass the source cache, so each of their calls downloads and parses its source again"""
+    return PandasDataExtractor(cache=SourceCache(bypass=True)), DuckDBDataExtractor(cache=SourceCache(bypass=True))
+
+# the memory measurements recorded for each implementation, see memory_profiling.measure_memory
+MEMORY_COLUMNS = ['python_peak_mb', 'peak_rss_mb', 'input_mb', 'output_mb']
+
+def record_memory(results, pandas_memory, duckdb_memory):
+    """Append the memory measurements of both implementations to the results"""
+    for column in MEMORY_COLUMNS:
+        results[f'pandas_{column}'].append(pandas_memory[column])
+        results[f'duckdb_{column}'].append(duckdb_memory[column])
+
 def run_benchmarks():
     """Run benchmarks for comparable methods in both implementations"""
     results = {
         'method': [],
         'pandas_time': [],
         'duckdb_time': [],
-        'speedup': []
+        'speedup': [],
+        **{f'{implementation}_{column}': [] for implementation in ('pandas', 'duckdb') for column in MEMORY_COLUMNS}
     }
     
-    # initalise extractors and cleaners
-    pandas_extractor = PandasDataExtractor()
-    duckdb_extractor = DuckDBDataExtractor()
+    # initalise extractors and cleaners, both bypass the source cache so neither is served the files (or the parsed PDF) the other one cached
+    pandas_extractor, duckdb_extractor = cold_extractors()
+    # memory is measured on a second, untimed call, made by separate extractors that bypass the cache as well, so it
+    # profiles the same cold download and parse as the timed call rather than a warm cache or Parquet read
+    pandas_memory_extractor, duckdb_memory_extractor = cold_extractors()
     pandas_cleaner = PandasDataCleaning()
     duckdb_cleaner = DuckDBDataCleaning()
     
@@ -42,11 +75,14 @@ def run_benchmarks():
     
     pandas_time, pandas_result = benchmark_function(pandas_extractor.retrieve_pdf_data, pdf_link)
     duckdb_time, duckdb_result = benchmark_function(duckdb_extractor.retrieve_pdf_data, pdf_link)
+    pandas_memory = benchmark_memory(pandas_memory_extractor.retrieve_pdf_data, pdf_link)
+    duckdb_memory = benchmark_memory(duckdb_memory_extractor.retrieve_pdf_data, pdf_link)
     
     results['method'].append('PDF Data Extraction')
     results['pandas_time'].append(pandas_time)
     results['duckdb_time'].append(duckdb_time)
     results['speedup'].append(pandas_time / duckdb_time if duckdb_time > 0 else float('inf'))
+    record_memory(results, pandas_memory, duckdb_memory)
     
     print(f"PDF Data Extraction - Pandas: {pandas_time:.4f}s, DuckDB: {duckdb_time:.4f}s, Speedup: {pandas_time/duckdb_time:.2f}x")
     
@@ -57,11 +93,14 @@ def run_benchmarks():
     try:
         pandas_time, pandas_result = benchmark_function(pandas_extractor.extract_from_s3, s3_address)
         duckdb_time, duckdb_result = benchmark_function(duckdb_extractor.extact_from_s3, s3_address)
+        pandas_memory = benchmark_memory(pandas_memory_extractor.extract_from_s3, s3_address)
+        duckdb_memory = benchmark_memory(duckdb_memory_extractor.extact_from_s3, s3_address)
         
         results['method'].append('S3 Data Extraction')
         results['pandas_time'].append(pandas_time)
         results['duckdb_time'].append(duckdb_time)
         results['speedup'].append(pandas_time / duckdb_time if duckdb_time > 0 else float('inf'))
+        record_memory(results, pandas_memory, duckdb_memory)
         
         print(f"S3 Data Extraction - Pandas: {pandas_time:.4f}s, DuckDB: {duckdb_time:.4f}s, Speedup: {pandas_time/duckdb_time:.2f}x")
         
@@ -70,11 +109,14 @@ def run_benchmarks():
         
         pandas_time, _ = benchmark_function(pandas_cleaner.convert_product_weights, pandas_result.copy())
         duckdb_time, _ = benchmark_function(duckdb_cleaner.convert_product_weights, duckdb_result.copy())
+        pandas_memory = benchmark_memory(pandas_cleaner.convert_product_weights, pandas_result.copy())
+        duckdb_memory = benchmark_memory(duckdb_cleaner.convert_product_weights, duckdb_result.copy())
         
         results['method'].append('Product Weight Conversion')
         results['pandas_time'].append(pandas_time)
         results['duckdb_time'].append(duckdb_time)
         results['speedup'].append(pandas_time / duckdb_time if duckdb_time > 0 else float('inf'))
+        record_memory(results, pandas_memory, duckdb_memory)
         
         print(f"Product Weight Conversion - Pandas: {pandas_time:.4f}s, DuckDB: {duckdb_time:.4f}s, Speedup: {pandas_time/duckdb_time:.2f}x")
     except Exception as e:
@@ -87,11 +129,14 @@ def run_benchmarks():
     try:
         pandas_time, _ = benchmark_function(pandas_extractor.retrieve_stores_data, api_endpoint)
         duckdb_time, _ = benchmark_function(duckdb_extractor.retrieve_stores_data, api_endpoint)
+        pandas_memory = benchmark_memory(pandas_memory_extractor.retrieve_stores_data, api_endpoint)
+        duckdb_memory = benchmark_memory(duckdb_memory_extractor.retrieve_stores_data, api_endpoint)
         
         results['method'].append('Store Data API Retrieval')
         results['pandas_time'].append(pandas_time)
         results['duckdb_time'].append(duckdb_time)
         results['speedup'].append(pandas_time / duckdb_time if duckdb_time > 0 else float('inf'))
+        record_memory(results, pandas_memory, duckdb_memory)
         
         print(f"Store Data API Retrieval - Pandas: {pandas_time:.4f}s, DuckDB: {duckdb_time:.4f}s, Speedup: {pandas_time/duckdb_time:.2f}x")
     except Exception as e:
@@ -113,11 +158,14 @@ def run_benchmarks():
         
         pandas_time, _ = benchmark_function(pandas_json_read)
         duckdb_time, _ = benchmark_function(duckdb_json_read)
+        pandas_memory = benchmark_memory(pandas_json_read)
+        duckdb_memory = benchmark_memory(duckdb_json_read)
         
         results['method'].append('JSON Processing')
         results['pandas_time'].append(pandas_time)
         results['duckdb_time'].append(duckdb_time)
         results['speedup'].append(pandas_time / duckdb_time if duckdb_time > 0 else float('inf'))
+        record_memory(results, pandas_memory, duckdb_memory)
         
         print(f"JSON Processing - Pandas: {pandas_time:.4f}s, DuckDB: {duckdb_time:.4f}s, Speedup: {pandas_time/duckdb_time:.2f}x")
     except Exception as e:
@@ -125,17 +173,236 @@ def run_benchmarks():
     
     return results
 
+def measure_interchange(clean_frame, source):
+    """Times cleaning one Arrow source table and handing it over for upload, once through pandas DataFrames and once as Arrow throughout"""
+    # stands in for the connector's connection, upload_to_db registers the cleaned table and copies it into a new table
+    upload_conn = duckdb.connect(':memory:')
+
+    def upload(table):
+        upload_conn.register('upload_df', table)
+        upload_conn.execute("CREATE OR REPLACE TABLE uploaded AS SELECT * FROM upload_df")
+        upload_conn.unregister('upload_df')
+
+    # DataFrame path: the extractor hands over pandas and the cleaner's .df() result is registered again for the upload
+    start_time = time.perf_counter()
+    source_df = source.to_pandas()
+    cleaned_df = clean_frame(source_df)
+    upload(cleaned_df)
+    dataframe_time = time.perf_counter() - start_time
+    dataframe_bytes = source_df.memory_usage(deep=True).sum() + cleaned_df.memory_usage(deep=True).sum()
+
+    # Arrow path: the source is scanned in place and the cleaned Arrow table is handed straight to the upload
+    start_time = time.perf_counter()
+    cleaned_table = clean_frame(source, as_arrow=True)
+    upload(cleaned_table)
+    arrow_time = time.perf_counter() - start_time
+    arrow_bytes = cleaned_table.nbytes
+
+    upload_conn.close()
+
+    return dataframe_time, arrow_time, dataframe_bytes, arrow_bytes
+
+def run_interchange_benchmarks(products_csv='products.csv', number_of_stores=451):
+    """Reports the time and memory saved per table by passing Arrow tables between the DuckDB stages instead of DataFrames"""
+    results = {
+        'table': [],
+        'dataframe_time': [],
+        'arrow_time': [],
+        'time_saved': [],
+        'dataframe_mb': [],
+        'arrow_mb': [],
+        'memory_saved_mb': []
+    }
+
+    duckdb_extractor = DuckDBDataExtractor()
+    duckdb_cleaner = DuckDBDataCleaning()
+
+    # products and stores come from the local products.csv and the store API stand-in, so they run offline
+    sources = {}
+    with open(products_csv, 'rb') as f:
+        sources['dim_products'] = (duckdb_cleaner.clean_products_frame, read_csv_table(pa.BufferReader(pa.py_buffer(f.read())), as_arrow=True))
+    sources['dim_store_details'] = (duckdb_cleaner.clean_store_frame, pa.Table.from_pylist([make_store(i) for i in range(number_of_stores)]))
+
+    try:
+        pdf_link = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf'
+        sources['dim_card_details'] = (duckdb_cleaner.clean_card_frame, duckdb_extractor.retrieve_pdf_data(pdf_link, as_arrow=True))
+        json_link = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json'
+        sources['dim_date_times'] = (duckdb_cleaner.clean_date_events_frame, duckdb_extractor.retrieve_json_data(json_link, as_arrow=True))
+    except Exception as e:
+        print(f"Skipping the card details and date events interchange benchmarks: {e}")
+
+    for table, (clean_frame, source) in sources.items():
+        dataframe_time, arrow_time, dataframe_bytes, arrow_bytes = measure_interchange(clean_frame, source)
+
+        results['table'].append(table)
+        results['dataframe_time'].append(dataframe_time)
+        results['arrow_time'].append(arrow_time)
+        results['time_saved'].append(dataframe_time - arrow_time)
+        results['dataframe_mb'].append(dataframe_bytes / 1024 ** 2)
+        results['arrow_mb'].append(arrow_bytes / 1024 ** 2)
+        results['memory_saved_mb'].append((dataframe_bytes - arrow_bytes) / 1024 ** 2)
+
+        print(f"{table} - DataFrame: {dataframe_time:.4f}s {dataframe_bytes / 1024 ** 2:.2f}MB, Arrow: {arrow_time:.4f}s {arrow_bytes / 1024 ** 2:.2f}MB")
+
+    pd.DataFrame(results).to_csv('arrow_interchange_benchmark_results.csv', index=False)
+
+    return results
+
+def time_sales_queries(engine, queries, repeats=5):
+    """Returns the median time of each sales query on PostgreSQL over repeats runs"""
+    timings = {}
+    with engine.connect() as connection:
+        for title, sql in queries.items():
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                connection.exec_driver_sql(sql).fetchall()
+                times.append(time.perf_counter() - start_time)
+            timings[title] = float(np.median(times))
+
+    return timings
+
+def run_index_benchmarks(db_connector=None, index_file='star_schema_indexes.sql', repeats=5):
+    """Times the sales queries before and after star_schema_indexes.sql is applied. Run it on freshly loaded tables, before the pipeline's indexes stage"""
+    db_connector = db_connector or DatabaseConnector()
+    engine = db_connector.get_engine(db_connector.target_creds_file)
+    queries = load_queries()
+
+    before = time_sales_queries(engine, queries, repeats)
+    build_time = sum(timing['seconds'] for timing in db_connector.run_sql_file(index_file))
+    after = time_sales_queries(engine, queries, repeats)
+
+    results = pd.DataFrame({
+        'query': list(queries),
+        'without_indexes': [before[title] for title in queries],
+        'with_indexes': [after[title] for title in queries]
+    })
+    results['speedup'] = results['without_indexes'] / results['with_indexes']
+
+    for row in results.itertuples():
+        print(f"{row.query} - without indexes: {row.without_indexes:.4f}s, with indexes: {row.with_indexes:.4f}s, Speedup: {row.speedup:.2f}x")
+    print(f"Index build and ANALYZE time: {build_time:.2f}s")
+
+    results.to_csv('index_benchmark_results.csv', index=False)
+
+    return results
+
+def run_categorical_benchmarks(rows=120123, seed=0):
+    """Measures the memory saved by keeping the low-cardinality columns as categoricals / Arrow dictionaries, on a frame with one row per order"""
+    rng = np.random.default_rng(seed)
+    # each enumerated column of the star schema, named after its enum
+    strings = pd.DataFrame({column: rng.choice(labels, size=rows).astype(object) for column, labels in ENUMS.items()})
+    categoricals = strings.astype({column: pd.CategoricalDtype(labels) for column, labels in ENUMS.items()})
+
+    results = {'column': [], 'object_mb': [], 'categorical_mb': [], 'arrow_string_mb': [], 'arrow_dictionary_mb': []}
+    for column in ENUMS:
+        results['column'].append(column)
+        results['object_mb'].append(strings[column].memory_usage(index=False, deep=True) / 1024 ** 2)
+        results['categorical_mb'].append(categoricals[column].memory_usage(index=False, deep=True) / 1024 ** 2)
+        results['arrow_string_mb'].append(pa.array(strings[column]).nbytes / 1024 ** 2)
+        results['arrow_dictionary_mb'].append(pa.array(categoricals[column]).nbytes / 1024 ** 2)
+
+    results = pd.DataFrame(results)
+    totals = results.drop(columns='column').sum()
+    print(f"{rows} rows - object: {totals['object_mb']:.2f}MB, categorical: {totals['categorical_mb']:.2f}MB, "
+          f"Arrow strings: {totals['arrow_string_mb']:.2f}MB, Arrow dictionaries: {totals['arrow_dictionary_mb']:.2f}MB")
+
+    results.to_csv('categorical_benchmark_results.csv', index=False)
+
+    return results
+
+def run_date_parsing_benchmarks(rows=120123, seed=0, repeats=5):
+    """Times the DateParser against the previous to_datetime(infer_datetime_format=True) + .dt.date parsing, on a column mixing the source data's date formats"""
+    rng = np.random.default_rng(seed)
+    days = pd.to_datetime('1990-01-01') + pd.to_timedelta(rng.integers(0, 12000, size=rows), unit='D')
+    formats = rng.choice(['%Y-%m-%d', '%Y/%m/%d', '%B %Y %d', '%Y %B %d'], size=rows, p=[0.97, 0.01, 0.01, 0.01])
+    dates = pd.Series([day.strftime(date_format) for day, date_format in zip(days, formats)])
+
+    def previous_parsing():
+        parsed = pd.to_datetime(dates, infer_datetime_format=True, errors='coerce')
+        return parsed.astype('datetime64[ns]').dt.date
+
+    cached_parser = DateParser()
+    cached_parser.parse(dates, 'benchmark')
+
+    methods = {
+        'to_datetime (inferred format)': previous_parsing,
+        'DateParser': lambda: DateParser().parse(dates),
+        'DateParser (cached formats)': lambda: cached_parser.parse(dates, 'benchmark')
+    }
+
+    results = {'method': [], 'seconds': [], 'dates_parsed': []}
+    for method, parse in methods.items():
+        times = []
+        for _ in range(repeats):
+            execution_time, parsed = benchmark_function(parse)
+            times.append(execution_time)
+        results['method'].append(method)
+        results['seconds'].append(float(np.median(times)))
+        results['dates_parsed'].append(int(pd.Series(parsed).notna().sum()))
+
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
+
+    results.to_csv('date_parsing_benchmark_results.csv', index=False)
+
+    return results
+
+def run_cleaning_memory_benchmarks(scale=1.0, seed=0):
+    """Measures the time and memory of every cleaner on synthetic sources: the deep memory of the DataFrame before and after cleaning, the tracemalloc peak and the peak RSS"""
+    frames = make_raw_frames(scale, seed)
+    cleaners = {'pandas': PandasDataCleaning(db_connector=object()), 'duckdb': DuckDBDataCleaning(db_connector=object())}
+
+    results = {'source': [], 'implementation': [], 'rows': [], 'seconds': [], **{column: [] for column in MEMORY_COLUMNS}}
+    for source, frame in frames.items():
+        for implementation, cleaner in cleaners.items():
+            clean_frame = getattr(cleaner, CLEANERS[source], None)
+            if clean_frame is None:
+                continue
+
+            execution_time, _ = benchmark_function(clean_frame, frame.copy())
+            memory = benchmark_memory(clean_frame, frame.copy())
+
+            results['source'].append(source)
+            results['implementation'].append(implementation)
+            results['rows'].append(len(frame))
+            results['seconds'].append(execution_time)
+            for column in MEMORY_COLUMNS:
+                results[column].append(memory[column])
+
+            print(f"{source} ({implementation}) - {execution_time:.4f}s, input: {memory['input_mb']:.1f}MB, output: {memory['output_mb']:.1f}MB, "
+                  f"tracemalloc peak: {memory['python_peak_mb']:.1f}MB, peak RSS: {memory['peak_rss_mb']:.1f}MB")
+
+    results = pd.DataFrame(results)
+    results.to_csv('cleaning_memory_benchmark_results.csv', index=False)
+
+    # peak RSS and the size of the cleaned tables for each cleaner
+    plt.figure(figsize=(14, 10))
+    sns.set_style("whitegrid")
+    for position, (column, title) in enumerate([('peak_rss_mb', 'Peak RSS while cleaning'), ('output_mb', 'Memory of the cleaned DataFrame')], start=1):
+        plt.subplot(2, 1, position)
+        sns.barplot(x='source', y=column, hue='implementation', data=results)
+        plt.title(f'{title}: Pandas vs DuckDB', fontsize=14)
+        plt.xlabel('Source', fontsize=12)
+        plt.ylabel('Memory (MB)', fontsize=12)
+        plt.legend(title='Implementation')
+    plt.tight_layout()
+    plt.savefig('cleaning_memory_benchmarks.png', dpi=300, bbox_inches='tight')
+    plt.close()
+
+    return results
+
 def create_visualisations(results):
     """Create visualisations comparing the performance of both implementations"""
     # Convert results to a DataFrame
     df = pd.DataFrame(results)
     
     # Set up the figure and style
-    plt.figure(figsize=(14, 10))
+    plt.figure(figsize=(14, 15))
     sns.set_style("whitegrid")
     
     # 1. Bar chart of execution times
-    plt.subplot(2, 1, 1)
+    plt.subplot(3, 1, 1)
     df_melted = pd.melt(df, id_vars=['method'], value_vars=['pandas_time', 'duckdb_time'],
                         var_name='implementation', value_name='execution_time')
     
@@ -159,7 +426,7 @@ def create_visualisations(results):
                 f'{height:.3f}s', ha="center", fontsize=9)
     
     # 2. Speedup factor bar chart
-    plt.subplot(2, 1, 2)
+    plt.subplot(3, 1, 2)
     speedup_bars = sns.barplot(x='method', y='speedup', data=df, color='green')
     plt.title('DuckDB Speedup over Pandas', fontsize=14)
     plt.xlabel('Method', fontsize=12)
@@ -171,6 +438,27 @@ def create_visualisations(results):
         height = p.get_height()
         speedup_bars.text(p.get_x() + p.get_width()/2., height + 0.1,
                          f'{height:.2f}x', ha="center", fontsize=9)
+
+    # 3. Peak RSS of each method
+    plt.subplot(3, 1, 3)
+    df_memory = pd.melt(df, id_vars=['method'], value_vars=['pandas_peak_rss_mb', 'duckdb_peak_rss_mb'],
+                        var_name='implementation', value_name='peak_rss_mb')
+    df_memory['implementation'] = df_memory['implementation'].replace({
+        'pandas_peak_rss_mb': 'Pandas',
+        'duckdb_peak_rss_mb': 'DuckDB'
+    })
+
+    memory_bars = sns.barplot(x='method', y='peak_rss_mb', hue='implementation', data=df_memory)
+    plt.title('Peak Memory (RSS) Comparison: Pandas vs DuckDB', fontsize=14)
+    plt.xlabel('Method', fontsize=12)
+    plt.ylabel('Peak RSS (MB)', fontsize=12)
+    plt.xticks(rotation=30, ha='right')
+    plt.legend(title='Implementation')
+
+    for i, p in enumerate(memory_bars.patches):
+        height = p.get_height()
+        memory_bars.text(p.get_x() + p.get_width()/2., height + 0.5,
+                         f'{height:.0f}MB', ha="center", fontsize=9)
     
     plt.tight_layout()
     plt.savefig('pandas_vs_duckdb_benchmarks.png', dpi=300, bbox_inches='tight')
@@ -178,7 +466,7 @@ def create_visualisations(results):
 
     # Create a summary table
     print("\nPerformance Summary:")
-    print(df[['method', 'pandas_time', 'duckdb_time', 'speedup']].to_string(index=False))
+    print(df[['method', 'pandas_time', 'duckdb_time', 'speedup', 'pandas_peak_rss_mb', 'duckdb_peak_rss_mb']].to_string(index=False))
     
     # Save results to CSV for further analysis
     df.to_csv('pandas_vs_duckdb_benchmark_results.csv', index=False)
@@ -187,4 +475,17 @@ if __name__ == "__main__":
     print("Starting benchmark of Pandas vs DuckDB implementations...")
     results = run_benchmarks()
     create_visualisations(results)
+    print("\nBenchmarking Arrow interchange between the DuckDB stages...")
+    run_interchange_benchmarks()
+    print("\nBenchmarking the memory of categorical columns...")
+    run_categorical_benchmarks()
+    print("\nBenchmarking date parsing...")
+    run_date_parsing_benchmarks()
+    print("\nBenchmarking the memory of each cleaner on synthetic data...")
+    run_cleaning_memory_benchmarks()
+    print("\nBenchmarking the sales queries with and without the star schema indexes...")
+    try:
+        run_index_benchmarks()
+    except Exception as e:
+        print(f"Skipping the index benchmarks: {e}")
     print("\nBenchmarking complete! visualisations saved to 'pandas_vs_duckdb_benchmarks.png'")
\ No newline at end of file
@@ -0,0 +1,410 @@
+"""
+A reproducible, offline benchmark suite for the extraction, cleaning and load stages of the pandas and DuckDB
+implementations.
+
+Every source is generated by synthetic_data.py at the chosen scale factors and served by a local stand-in (LocalServices):
+a local PostgreSQL for the RDS tables and the sales_data database, local_store_api.LocalStoreAPI for the store API, a
+local HTTP server for the date details JSON and moto for S3. Nothing goes over the network, so the numbers can be
+compared between runs and the suite can run in CI.
+
+Each case is run `warmup` times untimed and then `repeats` times timed with time.perf_counter, and the median, p95, mean,
+min and max are written to <output>.csv and <output>.json (which also records the settings and library versions). One
+more untimed run measures the case's tracemalloc and peak RSS peaks and the size of its input and output tables:
+
+    python benchmark_suite.py --scale 0.1 1 --repeats 7 --warmup 2
+    python benchmark_suite.py --stages clean --sources products date_events
+
+A local PostgreSQL is started with pgserver (pip install pgserver) unless a credentials file of an existing server is
+passed with --creds. Without either, the cases that need a database are reported as skipped. The card details PDF can't
+be parsed without Java, so its cases start from the rows tabula returns.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import duckdb
+import numpy as np
+import pandas as pd
+import yaml
+from sqlalchemy import text
+
+import synthetic_data
+from data_cleaning import DataCleaning as PandasDataCleaning
+from data_extraction import DataExtractor as PandasDataExtractor
+from database_utils import DatabaseConnector
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+from duckdb_data_extraction import DataExtractor as DuckDBDataExtractor
+from duckdb_database_utils import DatabaseConnector as DuckDBDatabaseConnector
+from local_store_api import LocalStoreAPI
+from memory_profiling import measure_memory
+from source_cache import SourceCache
+
+STAGES = ['extract', 'clean', 'load']
+
+# the table each source is cleaned into
+TARGETS = {
+    'legacy_users': 'dim_users',
+    'orders_table': 'orders_table',
+    'card_details': 'dim_card_details',
+    'store_details': 'dim_store_details',
+    'products': 'dim_products',
+    'date_events': 'dim_date_times'
+}
+
+# the clean_*_frame method of each source, DuckDBDataCleaning has no users or orders cleaning
+CLEANERS = {
+    'legacy_users': 'clean_user_frame',
+    'orders_table': 'clean_orders_frame',
+    'card_details': 'clean_card_frame',
+    'store_details': 'clean_store_frame',
+    'products': 'clean_products_frame',
+    'date_events': 'clean_date_events_frame'
+}
+
+S3_BUCKET = 'data-handling-public'
+
+
+class LocalFileServer:
+    """
+    Serves the files in a directory over HTTP on localhost, standing in for the public S3 URLs
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._server = None
+        self._thread = None
+
+    def url(self, file_name):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/{file_name}'
+
+    def start(self):
+        class Handler(SimpleHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=self.directory))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class LocalServices:
+    """
+    Generates every source at a scale factor and starts a local stand-in for each service the pipeline uses.
+
+    The RDS tables are loaded into a benchmark_source database and cleaned tables are loaded into benchmark_target, both
+    created on the server of creds_file or on a pgserver started for the run. While running, the working directory is
+    work_dir, which holds the api key file the extractors read and the files served over HTTP.
+    """
+
+    def __init__(self, scale=1.0, seed=0, creds_file=None, work_dir=None):
+        self.scale = scale
+        self.seed = seed
+        self.creds_file = creds_file
+        # a temporary work_dir is deleted when the services stop
+        self._temporary_work_dir = work_dir is None
+        self.work_dir = work_dir if work_dir is not None else tempfile.mkdtemp(prefix='benchmark_suite_')
+        self.source_creds = None
+        self.target_creds = None
+        self.store_api = None
+        self.file_server = None
+        self._postgres = None
+        self._mock_aws = None
+        self._previous_cwd = None
+
+    def rows(self, source):
+        return synthetic_data.rows_at_scale(source, self.scale)
+
+    def _create_databases(self):
+        """
+        Creates empty benchmark_source and benchmark_target databases and writes a credentials file for each
+        """
+        with open(self.creds_file, 'r') as f:
+            creds = yaml.safe_load(f)
+
+        connector = DatabaseConnector(source_creds_file=self.creds_file, target_creds_file=self.creds_file)
+        with connector.get_engine(self.creds_file).connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            for database in ['benchmark_source', 'benchmark_target']:
+                connection.execute(text(f'DROP DATABASE IF EXISTS {database} WITH (FORCE)'))
+                connection.execute(text(f'CREATE DATABASE {database}'))
+        connector.close()
+
+        for database in ['benchmark_source', 'benchmark_target']:
+            with open(os.path.join(self.work_dir, f'{database}_creds.yaml'), 'w') as f:
+                yaml.dump(dict(creds, RDS_DATABASE=database), f)
+
+        self.source_creds = os.path.join(self.work_dir, 'benchmark_source_creds.yaml')
+        self.target_creds = os.path.join(self.work_dir, 'benchmark_target_creds.yaml')
+
+    def start(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._previous_cwd = os.getcwd()
+        os.chdir(self.work_dir)
+
+        # the stand-in API doesn't check the key, but the extractors read it
+        with open('api_key.yaml', 'w') as f:
+            yaml.dump({'x-api-key': 'benchmark'}, f)
+
+        if self.creds_file is None:
+            try:
+                from benchmark_bulk_load import start_local_postgres
+                self._postgres, self.creds_file = start_local_postgres()
+            except ImportError:
+                print('pgserver is not installed, the cases that need a database are skipped')
+        if self.creds_file is not None:
+            self._create_databases()
+            with DatabaseConnector(source_creds_file=self.source_creds, target_creds_file=self.source_creds) as connector:
+                connector.upload_to_db(synthetic_data.make_legacy_users(self.rows('legacy_users'), self.seed), 'legacy_users', bulk=True)
+                connector.upload_to_db(synthetic_data.make_orders_table(self.rows('orders_table'), self.seed), 'orders_table', bulk=True)
+
+        self.store_api = LocalStoreAPI(number_of_stores=0)
+        self.store_api.stores = synthetic_data.make_store_records(self.rows('store_details'), self.seed)
+        self.store_api.start()
+
+        with open('date_details.json', 'wb') as f:
+            f.write(synthetic_data.make_date_events_json(self.rows('date_events'), self.seed))
+        self.file_server = LocalFileServer(self.work_dir).start()
+
+        try:
+            import boto3
+            import moto
+            self._mock_aws = moto.mock_aws()
+            self._mock_aws.start()
+            client = boto3.client('s3', region_name='eu-west-1')
+            client.create_bucket(Bucket=S3_BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+            client.put_object(Bucket=S3_BUCKET, Key='products.csv', Body=synthetic_data.make_products_csv(self.rows('products'), self.seed))
+        except ImportError:
+            self._mock_aws = None
+            print('moto is not installed, the S3 extraction cases are skipped')
+
+        return self
+
+    def stop(self):
+        if self._mock_aws is not None:
+            self._mock_aws.stop()
+        if self.file_server is not None:
+            self.file_server.stop()
+        if self.store_api is not None:
+            self.store_api.stop()
+        if self._postgres is not None:
+            self._postgres.cleanup()
+        if self._previous_cwd is not None:
+            os.chdir(self._previous_cwd)
+        if self._temporary_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class Case:
+    """
+    One benchmarked operation. setup builds a fresh argument for each run, outside the timing, skip_reason is set
+    when a stand-in the case needs isn't available
+    """
+
+    def __init__(self, source, stage, implementation, run, setup=None, skip_reason=None):
+        self.source = source
+        self.stage = stage
+        self.implementation = implementation
+        self.run = run
+        self.setup = setup
+        self.skip_reason = skip_reason
+
+
+def cleaned_once(clean_frame, frame):
+    """
+    Returns a setup for the load cases of a source, which cleans a copy of frame on its first call and hands back the
+    same cleaned table on every later one
+    """
+    cleaned = []
+
+    def setup():
+        if not cleaned:
+            cleaned.append(clean_frame(frame.copy()))
+        return cleaned[0]
+
+    return setup
+
+
+def build_cases(services, frames, stages=STAGES, sources=None):
+    """
+    Returns the cases of every stage of every source for both implementations
+    """
+    sources = sources if sources is not None else list(TARGETS)
+    has_database = services.source_creds is not None
+    cases = []
+
+    pandas_connector = DatabaseConnector(source_creds_file=services.source_creds, target_creds_file=services.target_creds)
+    duckdb_connector = DuckDBDatabaseConnector(source_creds_file=services.source_creds, target_creds_file=services.target_creds)
+    pandas_extractor = PandasDataExtractor(pandas_connector, cache=SourceCache(bypass=True))
+    duckdb_extractor = DuckDBDataExtractor(duckdb_connector, cache=SourceCache(bypass=True))
+    cleaners = {'pandas': PandasDataCleaning(db_connector=pandas_connector), 'duckdb': DuckDBDataCleaning(db_connector=duckdb_connector)}
+
+    if 'extract' in stages:
+        for implementation, extractor, connector, extract_s3 in [
+            ('pandas', pandas_extractor, pandas_connector, pandas_extractor.extract_from_s3),
+            ('duckdb', duckdb_extractor, duckdb_connector, duckdb_extractor.extact_from_s3)
+        ]:
+            no_database = None if has_database else 'no database'
+            extractions = {
+                'legacy_users': (functools.partial(extractor.read_dbs_table, connector, 'legacy_users'), no_database),
+                'orders_table': (functools.partial(extractor.read_dbs_table, connector, 'orders_table'), no_database),
+                'card_details': (None, 'parsing the PDF needs Java'),
+                'store_details': (functools.partial(extractor.retrieve_stores_data, services.store_api.store_details_url,
+                                                    number_stores_endpoint=services.store_api.number_stores_url), None),
+                'products': (functools.partial(extract_s3, f's3://{S3_BUCKET}/products.csv'), None if services._mock_aws else 'moto is not installed'),
+                'date_events': (functools.partial(extractor.retrieve_json_data, services.file_server.url('date_details.json')), None)
+            }
+            for source in sources:
+                run, skip_reason = extractions[source]
+                cases.append(Case(source, 'extract', implementation, run, skip_reason=skip_reason))
+
+    for implementation, cleaner in cleaners.items():
+        for source in sources:
+            clean_frame = getattr(cleaner, CLEANERS[source], None)
+            if clean_frame is None:
+                continue
+
+            frame = frames[source]
+            if 'clean' in stages:
+                cases.append(Case(source, 'clean', implementation, clean_frame, setup=functools.partial(frame.copy)))
+
+            if 'load' in stages:
+                # the table is only cleaned once the case runs, so a cleaner that raises is recorded as the load case's error
+                cleaned = cleaned_once(clean_frame, frame)
+                target = TARGETS[source]
+                skip_reason = None if has_database else 'no database'
+                if implementation == 'pandas':
+                    cases.append(Case(source, 'load', 'pandas', functools.partial(pandas_connector.upload_to_db, table_name=target), setup=cleaned,
+                                      skip_reason=skip_reason))
+                    cases.append(Case(source, 'load', 'pandas (COPY)', functools.partial(pandas_connector.upload_to_db, table_name=target, bulk=True),
+                                      setup=cleaned, skip_reason=skip_reason))
+                else:
+                    cases.append(Case(source, 'load', 'duckdb', functools.partial(duckdb_connector.upload_to_db, table_name=target), setup=cleaned,
+                                      skip_reason=skip_reason))
+
+    return cases
+
+
+def summarise(times):
+    """
+    Returns the median, p95, mean, min and max of a list of timings in seconds
+    """
+    times = np.asarray(times, dtype=float)
+
+    return {
+        'median_s': float(np.median(times)),
+        'p95_s': float(np.percentile(times, 95)),
+        'mean_s': float(times.mean()),
+        'min_s': float(times.min()),
+        'max_s': float(times.max())
+    }
+
+
+def time_case(case, repeats=5, warmup=1, profile_memory=True):
+    """
+    Runs a case warmup times untimed, then repeats times with perf_counter. Returns the summary of the timed runs and the
+    number of rows the last run returned. With profile_memory the case is run once more, untimed as tracemalloc slows it
+    down, to measure its memory with memory_profiling.measure_memory
+    """
+    def call(measure=None):
+        argument = case.setup() if case.setup is not None else None
+        arguments = (argument,) if case.setup is not None else ()
+        if measure is not None:
+            return measure(case.run, *arguments)
+        start_time = time.perf_counter()
+        result = case.run(*arguments)
+        return time.perf_counter() - start_time, result
+
+    for _ in range(warmup):
+        call()
+
+    times = []
+    for _ in range(repeats):
+        elapsed, result = call()
+        times.append(elapsed)
+
+    summary = dict(summarise(times), rows=len(result) if hasattr(result, '__len__') else None)
+    if profile_memory:
+        _, memory = call(measure_memory)
+        summary.update(memory)
+
+    return summary
+
+
+def run_suite(scales=(1.0,), repeats=5, warmup=1, stages=STAGES, sources=None, seed=0, creds_file=None, output='benchmark_suite_results'):
+    """
+    Runs every case at each scale factor and writes the results to <output>.csv and <output>.json
+    """
+    # the services change the working directory while they run
+    creds_file = os.path.abspath(creds_file) if creds_file is not None else None
+    output = os.path.abspath(output)
+
+    results = []
+    for scale in scales:
+        with LocalServices(scale, seed, creds_file) as services:
+            frames = synthetic_data.make_raw_frames(scale, seed)
+            for case in build_cases(services, frames, stages, sources):
+                result = {'scale': scale, 'source': case.source, 'stage': case.stage, 'implementation': case.implementation,
+                          'input_rows': len(frames[case.source]), 'repeats': repeats, 'status': 'ok'}
+                if case.skip_reason is not None:
+                    result['status'] = f'skipped: {case.skip_reason}'
+                else:
+                    try:
+                        result.update(time_case(case, repeats, warmup))
+                    except Exception as e:
+                        result['status'] = f'error: {type(e).__name__}: {str(e).splitlines()[0] if str(e) else ""}'
+
+                timing = f"median {result['median_s']:.4f}s, p95 {result['p95_s']:.4f}s" if 'median_s' in result else result['status']
+                print(f"scale {scale} {case.stage} {case.source} ({case.implementation}): {timing}")
+                results.append(result)
+
+    columns = ['scale', 'source', 'stage', 'implementation', 'input_rows', 'rows', 'repeats', 'median_s', 'p95_s', 'mean_s', 'min_s', 'max_s',
+               'python_peak_mb', 'peak_rss_mb', 'input_mb', 'output_mb', 'status']
+    results = pd.DataFrame(results).reindex(columns=columns).astype({'rows': 'Int64'})
+    results.to_csv(f'{output}.csv', index=False)
+
+    with open(f'{output}.json', 'w') as f:
+        json.dump({
+            'settings': {'scales': list(scales), 'repeats': repeats, 'warmup': warmup, 'seed': seed, 'stages': list(stages)},
+            'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'pandas': pd.__version__,
+                            'duckdb': duckdb.__version__, 'numpy': np.__version__},
+            'results': json.loads(results.to_json(orient='records'))
+        }, f, indent=4)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the extraction, cleaning and load stages offline on synthetic data')
+    parser.add_argument('--scale', type=float, nargs='+', default=[1.0], help='scale factors, 1 is about the size of the live sources')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--sources', nargs='+', choices=list(TARGETS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--creds', help='credentials file of an existing PostgreSQL server, a local one is started with pgserver if omitted')
+    parser.add_argument('--output', default='benchmark_suite_results', help='path of the results, without the .csv/.json extension')
+    args = parser.parse_args()
+
+    run_suite(args.scale, args.repeats, args.warmup, args.stages, args.sources, args.seed, args.creds, args.output)
+    print(f"\nResults saved to '{args.output}.csv' and '{args.output}.json'")
@@ -0,0 +1,119 @@
+"""
+Benchmarks the vectorised product weight conversion against the original row-by-row Series.apply version.
+
+products.csv is scaled up to millions of rows by repetition, the pandas str.extract engine and the DuckDB SQL engine
+are timed against the apply version and their results are checked against it:
+
+    python benchmark_weight_conversion.py --rows 1000000 5000000
+"""
+import argparse
+import re
+import time
+import numpy as np
+import pandas as pd
+
+from data_cleaning import DataCleaning as PandasDataCleaning
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+
+
+def convert_product_weights_apply(table):
+    """The original per-row implementation of DataCleaning.convert_product_weights, kept as the reference"""
+    table['weight'] = table['weight'].astype(str)
+
+    def convert_to_kg(value):
+        value = re.sub(r'[^0123456789\.kgmlx]', '', value)
+
+        if 'kg' in value:
+            value = value.replace('kg', '')
+        elif 'x' in value:
+            x_index = value.index('x')
+            value = value.replace('g', '')
+            value = int(value[:x_index]) * int(value[x_index + 1:])
+            value = float(value) / 1000
+        elif 'ml' in value:
+            value = value.replace('ml', '')
+            value = float(value) / 1000
+        elif 'g' in value and 'k' not in value:
+            value = value.replace('g', '')
+            value = float(value) / 1000
+
+        return value
+
+    table['weight'] = table['weight'].apply(convert_to_kg)
+    table['weight'] = table['weight'].astype(float)
+
+    return table
+
+
+def load_products(path='products.csv'):
+    """Loads products.csv and keeps the rows clean_products_data converts, i.e. those with a valid category"""
+    products = pd.read_csv(path, index_col=0)
+    categories = {'toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty', 'food-and-drink', 'diy'}
+
+    return products[products['category'].isin(categories)]
+
+
+def scale_products(products, rows):
+    """Repeats the products until the frame has the requested number of rows"""
+    repeats = int(np.ceil(rows / len(products)))
+
+    return pd.concat([products] * repeats, ignore_index=True).iloc[:rows]
+
+
+def time_conversion(func, table):
+    start_time = time.perf_counter()
+    result = func(table.copy())
+    return time.perf_counter() - start_time, result
+
+
+def run_benchmarks(row_counts, path='products.csv'):
+    """Times each engine at every scale and verifies they agree with the apply version"""
+    products = load_products(path)
+    # the apply version reads '16oz' as 16 kg, the vectorised engines convert ounces, so that row is left out of the comparison
+    products = products[products['weight'] != '16oz']
+
+    pandas_cleaner = PandasDataCleaning(db_connector=object())
+    duckdb_cleaner = DuckDBDataCleaning(db_connector=object())
+    results = {
+        'rows': [],
+        'apply_time': [],
+        'pandas_vectorised_time': [],
+        'duckdb_sql_time': [],
+        'pandas_speedup': [],
+        'duckdb_speedup': []
+    }
+
+    for rows in row_counts:
+        table = scale_products(products, rows)
+
+        apply_time, expected = time_conversion(convert_product_weights_apply, table)
+        pandas_time, pandas_result = time_conversion(pandas_cleaner.convert_product_weights, table)
+        duckdb_time, duckdb_result = time_conversion(duckdb_cleaner.convert_product_weights, table)
+
+        pd.testing.assert_series_equal(pandas_result['weight'], expected['weight'])
+        pd.testing.assert_series_equal(duckdb_result['weight'], expected['weight'])
+
+        results['rows'].append(rows)
+        results['apply_time'].append(apply_time)
+        results['pandas_vectorised_time'].append(pandas_time)
+        results['duckdb_sql_time'].append(duckdb_time)
+        results['pandas_speedup'].append(apply_time / pandas_time)
+        results['duckdb_speedup'].append(apply_time / duckdb_time)
+
+        print(f"{rows} rows - apply: {apply_time:.3f}s ({rows / apply_time:,.0f} rows/s), "
+              f"pandas str.extract: {pandas_time:.3f}s ({rows / pandas_time:,.0f} rows/s), "
+              f"DuckDB SQL: {duckdb_time:.3f}s ({rows / duckdb_time:,.0f} rows/s)")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the vectorised product weight conversion')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000, 5000000])
+    parser.add_argument('--products', default='products.csv')
+    parser.add_argument('--output', default='weight_conversion_benchmark_results.csv')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, args.products)
+    pd.DataFrame(results).to_csv(args.output, index=False)
+    print(f"\nResults saved to '{args.output}'")
@@ -1,62 +1,203 @@
 from database_utils import DatabaseConnector
 from data_extraction import DataExtractor
+from watermarks import WatermarkStore
+from schema_registry import conform_frame
+from date_parsing import DateParser, build_date_dimension
+from instrumentation import instrumented, record_dropped
+from validation import RULES
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import pandas as pd
+import numpy as np
 import re
 
 class DataCleaning:
+
+    # finds the weight in a lower-cased entry: an optional multipack count ('12 x'), the number and its unit. Anything around it, such as the stray ' .' in '77g .', is ignored
+    WEIGHT_PATTERN = re.compile(r'(?:(?P<count>\d+)\s*x\s*)?(?P<value>\d+(?:\.\d*)?|\.\d+)\s*(?P<unit>kg|g|ml|oz)?')
+
+    # what each unit is divided by to give kg. Entries without a unit are already in kg
+    WEIGHT_UNIT_DIVISORS = {'kg': 1, 'g': 1000, 'ml': 1000, 'oz': 35.27396194958041}
+
+    # every clean_* method extracts and uploads through the same connector, so the pooled database engines are created once per run.
+    # with a ParquetStaging every cleaned table is also staged as parquet, so it can be published again later without re-cleaning
+    def __init__(self, db_connector=None, staging=None):
+        self.db_connect = db_connector if db_connector is not None else DatabaseConnector()
+        self.extractor = DataExtractor(self.db_connect)
+        self.staging = staging
+        # remembers the date formats each source column uses across chunks and incremental runs, see date_parsing.py
+        self.date_parser = DateParser()
+        # the rows set aside by validate for each table, until they are loaded into its _rejected table
+        self.rejected = {}
+
+    # loads a cleaned table: stages it as parquet if a staging area is set, then uploads it to postgres.
+    # the rows its validity rules rejected are uploaded to <table_name>_rejected with their rejection reasons
+    def load(self, table, table_name, if_exists='replace'):
+
+        if self.staging is not None:
+            self.staging.write(table_name, table, if_exists=if_exists)
+
+        self.db_connect.upload_to_db(table, table_name, if_exists=if_exists)
+
+        rejected = self.rejected.pop(table_name, None)
+        if rejected is not None:
+            self.db_connect.upload_to_db(rejected, f'{table_name}_rejected', if_exists=if_exists)
+
+    # splits off the rows that break the validity rules of table_name in validation.py and keeps them until the table is loaded, returns the valid rows
+    def validate(self, table_name, table):
+
+        table, rejected = RULES[table_name].split(table)
+        record_dropped(len(rejected))
+        self.rejected[table_name] = rejected
+
+        return table
+
+    # cleans the legacy_users table and uploads it to postgres. With incremental=True only the users added since the last run are extracted, cleaned and appended to dim_users.
+    # with a chunksize the table is read, cleaned and uploaded chunksize rows at a time and the number of rows loaded is returned instead of the table
+    @instrumented('clean')
+    def clean_user_data(self, incremental=False, key='index', watermark_file='watermarks.json', chunksize=None):
     
-    def clean_user_data(self):
-    
-        db_connect = DatabaseConnector()
+        db_connect = self.db_connect
+
+        if incremental:
+            return self.load_incremental(db_connect, 'legacy_users', 'dim_users', self.clean_user_frame, key, watermark_file)
+
+        if chunksize:
+            return self.load_in_chunks(db_connect, 'legacy_users', 'dim_users', self.clean_user_frame, chunksize)
 
         # creates a DataExtractor instance and calls the relevent method to extract the users table
-        db_extract = DataExtractor()
+        db_extract = self.extractor
         table =  db_extract.read_dbs_table(db_connect, 'legacy_users')
 
-        # changes country_code and country columns data type to category and replaces mis-inputs to match the relevent categories.
-        table['country_code'] = table['country_code'].astype('category')
+        table = self.clean_user_frame(table)
+
+        # uploads the cleaned user details to the local postgres database
+        self.load(table, 'dim_users')
+
+        return table
+
+    # applies the user cleaning steps to a dataframe of rows from the legacy_users table
+    @instrumented('clean')
+    def clean_user_frame(self, table):
+
+        # replaces mis-inputs to match the relevent categories and changes country_code and country columns data type to category.
+        table['country_code'] = table['country_code'].replace('GGB', 'GB').astype('category')
         table['country'] = table['country'].astype('category')
-        table['country_code'].replace('GGB', 'GB', inplace=True)
 
-        # drops rows filled with nulls and the wrong values
-        country_codes = {'GB', 'US', 'DE'}
-        inconsistent_categories = set(table['country_code']) - country_codes
-        inconsistent_rows = table['country_code'].isin(inconsistent_categories)
-        table = table[~inconsistent_rows]
+        # sets aside rows filled with nulls and the wrong values, or with a malformed user_uuid, see validation.py
+        table = self.validate('dim_users', table)
 
-        # uses to_datetime() method to correct date entries for D.O.B column and join_date column and changes the datatype to datetime64
-        table['date_of_birth'] = pd.to_datetime(table['date_of_birth'], infer_datetime_format=True, errors='coerce')
-        table['date_of_birth'] = table['date_of_birth'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['date_of_birth'] = table['date_of_birth'].dt.date
+        # parses the D.O.B and join_date columns, which mix several date formats, into dates (date32) with the DateParser
+        table['date_of_birth'] = self.date_parser.parse(table['date_of_birth'], 'legacy_users.date_of_birth')
 
-        table['join_date'] = pd.to_datetime(table['join_date'], infer_datetime_format=True, errors='coerce')
-        table['join_date'] = table['join_date'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['join_date'] = table['join_date'].dt.date
+        table['join_date'] = self.date_parser.parse(table['join_date'], 'legacy_users.join_date')
 
         table.drop('index', axis='columns', inplace=True)
 
-        # uploads the cleaned user details to the local postgres database
-        db_connect.upload_to_db(table, 'dim_users')
+        # gives the columns the dtypes of their types in the database, see schema_registry.py
+        table = conform_frame('dim_users', table)
+
+        return table
+
+    # pulls the rows added to a source table since the last run, cleans them with clean_frame and appends them to the target table.
+    # the first run has no high-water mark so it replaces the target with the full table. The mark is only advanced once the upload has succeeded, so a failed run is simply retried next time
+    def load_incremental(self, db_connect, source_table, target_table, clean_frame, key='index', watermark_file='watermarks.json'):
+
+        watermarks = WatermarkStore(watermark_file)
+        watermark = watermarks.get(source_table, key)
+
+        extractor = self.extractor
+        table, new_watermark = extractor.read_dbs_table_incremental(db_connect, source_table, watermark, key)
+
+        if table.empty:
+            print(f"No new rows in {source_table} since {key} = {watermark}")
+            return table
+
+        table = clean_frame(table)
 
+        self.load(table, target_table, if_exists='replace' if watermark is None else 'append')
+        watermarks.set(source_table, new_watermark, key)
+
+        return table
+
+    # streams a source table through clean_frame one chunk at a time, uploading each cleaned chunk as soon as it is produced so peak memory is bounded by the chunk size.
+    # the first chunk replaces the target table (and its _rejected table) and the rest are appended to it, even when a chunk has no valid rows.
+    # an empty source table is read as a single empty chunk, so it still replaces a stale target
+    def load_in_chunks(self, db_connect, source_table, target_table, clean_frame, chunksize=50000):
+
+        extractor = self.extractor
+        rows_loaded = 0
+
+        for number, chunk in enumerate(extractor.read_dbs_table_chunks(db_connect, source_table, chunksize)):
+            chunk = clean_frame(chunk)
+            self.load(chunk, target_table, if_exists='replace' if number == 0 else 'append')
+            rows_loaded += len(chunk)
+
+        return rows_loaded
+
+    # cleans a source table in partitions of its key range, each read, cleaned and bulk loaded by a separate process with its own database connections.
+    # the processes copy their rows in parallel into one staging table, which is swapped in for the target only if it holds as many rows as the partitions loaded.
+    # the staging table is created up front from a clean of an empty range, so an empty source still replaces a stale target, as load_in_chunks does.
+    # the source is split into `partitions` ranges (one per worker by default) and the number of rows loaded is returned. With a staging area the cleaned partitions are sent back and staged in order
+    def load_partitioned(self, db_connect, source_table, target_table, clean_method, workers, key='index', partitions=None):
+
+        low, high, source_rows = self.extractor.read_key_range(db_connect, source_table, key)
+        ranges = key_ranges(low, high, partitions or workers)
+        staging_table = f'{target_table}__staging'
+
+        # spawned rather than forked, so a worker never inherits a pooled connection or a lock held by another thread
+        context = multiprocessing.get_context('spawn')
+        try:
+            empty_table = getattr(self, clean_method)(self.extractor.read_dbs_table_range(db_connect, source_table, low, low, key))
+            db_connect.upload_to_db(empty_table, staging_table, types_from=target_table)
+
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [
+                    executor.submit(clean_partition, db_connect.source_creds_file, db_connect.target_creds_file, source_table, target_table, staging_table,
+                                    clean_method, key, range_low, range_high, self.staging is not None)
+                    for range_low, range_high in ranges
+                ]
+                results = [future.result() for future in futures]
+
+            rows_read = sum(result[0] for result in results)
+            if rows_read != source_rows:
+                raise ValueError(f'the partitions of {source_table} read {rows_read} rows, the table had {source_rows}')
+
+            rows_loaded = db_connect.swap_table(target_table, staging_table, sum(result[1] for result in results))
+        finally:
+            db_connect.drop_tables([staging_table])
+
+        if self.staging is not None:
+            for number, (_, _, table) in enumerate(results):
+                self.staging.write(target_table, table, if_exists='replace' if number == 0 else 'append')
+
+        return rows_loaded
+
+    @instrumented('clean')
     def clean_card_details(self):
 
         # calls the retreive_pdf_data method with a link to the card_details pdf as an argument. This returns a df of the pdf. 
-        db_extract = DataExtractor()
+        db_extract = self.extractor
         link = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf'
         table = db_extract.retrieve_pdf_data(link)
 
+        table = self.clean_card_frame(table)
+
+        # uploads the cleaned user details to the local postgres database
+        self.load(table, 'dim_card_details')
+
+        return table
+
+    # applies the card cleaning steps to a dataframe of the card details pdf
+    @instrumented('clean')
+    def clean_card_frame(self, table):
 
         # changes card_provider columns data type to category
         table['card_provider'] = table['card_provider'].astype('category')
 
         
-        # defines a set of the valid card providers compares them against categories present in the table and removes the inconsistent rows. 
-        card_providers = {'Diners Club / Carte Blanche', 'Mastercard', 'VISA 13 digit', 'VISA 16 digit', 'Discover', 'American Express', 'Maestro', 'JCB 16 digit', 'VISA 19 digit', 'JCB 15 digit'}
-        inconsistent_categories = set(table['card_provider']) - card_providers
-        inconsistent_rows = table['card_provider'].isin(inconsistent_categories)
-        table = table[~inconsistent_rows]
+        # sets aside rows whose card provider is missing or isn't one of the valid card providers
+        table = self.validate('dim_card_details', table)
 
         
         # uses to_datetime() method to correct date entries and changes expiry_date and date_payment_confirmed columns to data type datetime
@@ -65,24 +206,32 @@ class DataCleaning:
         # changes the date format for the card expiry date to month/year as would be expected
         table['expiry_date'] = table['expiry_date'].dt.strftime('%m/%Y')
 
-        
-        table['date_payment_confirmed'] = pd.to_datetime(table['date_payment_confirmed'], infer_datetime_format=True, errors='coerce')
-        table['date_payment_confirmed'] = table['date_payment_confirmed'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['date_payment_confirmed'] = table['date_payment_confirmed'].dt.date
+        # parses date_payment_confirmed, which mixes several date formats, into dates
+        table['date_payment_confirmed'] = self.date_parser.parse(table['date_payment_confirmed'], 'card_details.date_payment_confirmed')
 
-        # uploads the cleaned user details to the local postgres database
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_card_details')
+        # gives the columns the dtypes of their types in the database, card numbers read from the pdf as numbers become strings
+        table = conform_frame('dim_card_details', table)
 
+        return table
 
     # cleans the store data retrieved through an API 
+    @instrumented('clean')
     def clean_store_data(self):
         
         # creates an instance of the DataExtractor class which includes the methods required to extract store data
-        data_extractor = DataExtractor()
+        data_extractor = self.extractor
         table = data_extractor.retrieve_stores_data('https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/{store_number}')
 
+        table = self.clean_store_frame(table)
+
+        # creates an instance of the DatabaseConnector class to upload the cleaned table to postgres
+        self.load(table, 'dim_store_details')
+
+        return table
+
+    # applies the store cleaning steps to a dataframe of store details from the API
+    @instrumented('clean')
+    def clean_store_frame(self, table):
 
         # sets the index of the pandas dataframe 
         table.set_index('index', inplace=True)
@@ -98,11 +247,8 @@ class DataCleaning:
         table['continent'] = table['continent'].astype('category')
         table['store_type'] = table['store_type'].astype('category')
 
-        # Defines a set of valid country codes and removes rows where the column entry does not match these. This removes rows filled with null values and incorrect data. 
-        country_codes = {'GB', 'US', 'DE'}
-        inconsistent_categories = set(table['country_code']) - country_codes
-        inconsistent_rows = table['country_code'].isin(inconsistent_categories)
-        table = table[~inconsistent_rows]   
+        # sets aside rows where the country code is missing or isn't a valid one. This removes rows filled with null values and incorrect data.
+        table = self.validate('dim_store_details', table)
 
         # removes any alphabetical characters from rows in the staff_numbers column using a regular expression so they are ready to be converted to data type int
         def remove_chars(value):
@@ -113,62 +259,57 @@ class DataCleaning:
         # changes the staff_numbers data type to numberic so it can used for calculations
         table['staff_numbers'] = pd.to_numeric(table['staff_numbers'])
 
-        # uses to_datetime() method to correct date entries in the opening_date column and changes the column data type to datetime
-        table['opening_date'] = pd.to_datetime(table['opening_date'], infer_datetime_format=True, errors='coerce')
-        table['opening_date'] = table['opening_date'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['opening_date'] = table['opening_date'].dt.date
+        # parses the opening_date column, written in several date formats, into dates
+        table['opening_date'] = self.date_parser.parse(table['opening_date'], 'store_details.opening_date')
 
-        # creates an instance of the DatabaseConnector class to upload the cleaned table to postgres
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_store_details')
+        # the web store has no physical location, so its location values are set to null
+        web_portal = table['store_type'] == 'Web Portal'
+        table.loc[web_portal, ['address', 'longitude', 'locality']] = None
+
+        # gives the columns the dtypes of their types in the database: longitude and latitude become floats and staff_numbers a smallint
+        table = conform_frame('dim_store_details', table)
+
+        return table
 
     #  A function to clean the weight series from the dataframe so it is usable for calculations.
+    # weights repeat a lot ('500g', '1kg'), so each distinct entry is parsed only once: factorize gives every row a code into the array of distinct entries,
+    # str.extract pulls the multipack count, number and unit out of all of them in one call and the kg weights are then gathered back onto the rows with the codes.
+    # multipack entries such as '12 x 100g' give the total weight of the pack, entries with no number become NaN
     def convert_product_weights(self, table):
-        
-        # sets the column data type to string because string methods are needed for some of the cleaning
-        table['weight'] = table['weight'].astype(str)
-        
-        # this is the method that will be used in the pd.apply() call
-        def convert_to_kg(value): 
-            
-            # there are some weight entries with decimal points in weird places e.g. '77  .' which causes an error when trying to treat the value as a float due to the spaces between the integer and the decimal point. This regular expression removes everything but digits, decimal points and the weight metrics from the string. 
-            value = re.sub('[^0123456789\.kgmlx]', '', value)
-            
-            # this if statement removes the weight metric and converts ml and g to kg.
-            if 'kg' in value:
-               value = value.replace('kg', '')
-
-            # some of the weight entries in the table dealing with multipack items are stored as '12 x 100g'. This if statement deals with them, first by removing the 'g' and then multiplying to get the total weight and then converting to kg
-            elif 'x' in value:
-                x_index = value.index('x')
-                value = value.replace('g', '')
-                value = int(value[:x_index]) * int(value[x_index + 1:])
-                value = float(value) / 1000
-
-            elif 'ml' in value:
-                value = value.replace('ml', '')
-                value = float(value) / 1000 
-
-            elif 'g' in value and 'k' not in value:
-                value = value.replace('g', '')
-                value = float(value) / 1000
-
-            
-            return value 
-
-        table['weight'] = table['weight'].apply(convert_to_kg)
-        table['weight'] = table['weight'].astype(float)
-    
+
+        codes, distinct_weights = pd.factorize(table['weight'])
+
+        weights = pd.Series(distinct_weights, dtype=object).astype(str).str.lower().str.extract(self.WEIGHT_PATTERN)
+
+        count = pd.to_numeric(weights['count']).fillna(1)
+        value = pd.to_numeric(weights['value'])
+        divisor = weights['unit'].map(self.WEIGHT_UNIT_DIVISORS).fillna(1)
+        distinct_kg = (count * value / divisor).to_numpy(dtype=float)
+
+        # missing weights have the code -1, which picks the NaN appended to the end of the array
+        table['weight'] = np.append(distinct_kg, np.nan)[codes]
+
         return table
 
     # cleans the products data and stores it in our local database.
+    @instrumented('clean')
     def clean_products_data(self):
 
         # creates a dataextractor instance which calls the extract_from_s3 method from that class
-        extractor = DataExtractor()
+        extractor = self.extractor
         table = extractor.extract_from_s3('s3://data-handling-public/products.csv')
 
+        table = self.clean_products_frame(table)
+
+        # uploads the cleaned table to postgres
+        self.load(table, 'dim_products')
+
+        return table
+
+    # applies the products cleaning steps to a dataframe of the products csv
+    @instrumented('clean')
+    def clean_products_frame(self, table):
+
         # original index was zero based, used this to change it to start at 1 
         table.index = table.index + 1
 
@@ -176,73 +317,126 @@ class DataCleaning:
         table['category'] = table['category'].astype('category')
         table['removed'] = table['removed'].astype('category')
 
-        # defines a set of valid product categories and removes rows with inconsistent values. 
-        categories = {'toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty', 'food-and-drink', 'diy'}
-        inconsistent_categories = set(table['category']) - categories
-        inconsistent_rows = table['category'].isin(inconsistent_categories)
-        table = table[~inconsistent_rows]
-
-        # uses to_datetime() method to correct date entries for 'date_added' column and changes the datatype to datetime64'
-        table['date_added'] = pd.to_datetime(table['date_added'], infer_datetime_format=True, errors='coerce')
-        table['date_added'] = table['date_added'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['date_added'] = table['date_added'].dt.date
+        # sets aside rows with a missing or invalid category or a malformed uuid
+        table = self.validate('dim_products', table)
+
+        # parses the 'date_added' column, written in several date formats, into dates
+        table['date_added'] = self.date_parser.parse(table['date_added'], 'products.date_added')
         
         # calls the method which cleans the weights column
         table = self.convert_product_weights(table)
-        
-        # uploads the cleaned table to postgres
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_products')
 
-    # cleans the orders_data table from the legacy database and uploads it to postgres
-    def clean_orders_data(self):
+        # removes the '£' sign from the prices so they can be stored as numbers
+        table['product_price'] = pd.to_numeric(table['product_price'].astype(str).str.replace('£', '', regex=False), errors='coerce')
+
+        # gives each product a weight class by its weight in kg: Light, Mid_Sized, Heavy or Truck_Required
+        table['weight_class'] = pd.cut(table['weight'], bins=[-np.inf, 2, 40, 140, np.inf], labels=['Light', 'Mid_Sized', 'Heavy', 'Truck_Required'], right=False)
+
+        # replaces the 'removed' column with a still_available boolean
+        table['removed'] = table['removed'] == 'Still_avaliable'
+        table.rename(columns={'removed': 'still_available'}, inplace=True)
+
+        # gives the columns the dtypes of their types in the database, see schema_registry.py
+        table = conform_frame('dim_products', table)
+
+        return table
+
+    # cleans the orders_data table from the legacy database and uploads it to postgres. With incremental=True only the orders added since the last run are extracted, cleaned and appended to orders_table.
+    # with a chunksize the table is read, cleaned and uploaded chunksize rows at a time, with workers it is cleaned and loaded by that many processes in index ranges (see load_partitioned).
+    # both return the number of rows loaded instead of the table
+    @instrumented('clean')
+    def clean_orders_data(self, incremental=False, key='index', watermark_file='watermarks.json', chunksize=None, workers=None, partitions=None):
         
         # creates an instance of the DatabaseConnector and DataExtractor class which will be used to extract the rds table and upload it to postgres
-        db_connect = DatabaseConnector()
-        extractor = DataExtractor()
+        db_connect = self.db_connect
+
+        if incremental:
+            return self.load_incremental(db_connect, 'orders_table', 'orders_table', self.clean_orders_frame, key, watermark_file)
+
+        if chunksize:
+            return self.load_in_chunks(db_connect, 'orders_table', 'orders_table', self.clean_orders_frame, chunksize)
+
+        if workers:
+            return self.load_partitioned(db_connect, 'orders_table', 'orders_table', 'clean_orders_frame', workers, key, partitions)
+
+        extractor = self.extractor
         table = extractor.read_dbs_table(db_connect, 'orders_table')
 
+        table = self.clean_orders_frame(table)
+
+        # uploads the cleaned data to postgres
+        self.load(table, 'orders_table')
+
+        return table
+
+    # applies the orders cleaning steps to a dataframe of rows from the orders_table
+    @instrumented('clean')
+    def clean_orders_frame(self, table):
+
         # there is already an index in the dataset so this sets the df index to that column
         table.set_index('index', inplace=True)
 
         # drops the 'level_0', 'first_name', 'last_name' and '1' columns which are not needed 
         table.drop(['level_0', 'first_name', 'last_name', '1'], axis='columns', inplace=True)
 
-        # uploads the cleaned data to postgres
-        db_connect.upload_to_db(table, 'orders_table')
+        # product_quantity becomes a smallint, see schema_registry.py
+        table = conform_frame('orders_table', table)
 
+        return table
+
+    @instrumented('clean')
     def clean_date_events_data(self):
         
         # reads in the json file as a pandas dataframe
-        table = pd.read_json('https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json')
+        table = self.extractor.retrieve_json_data('https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json')
+
+        table = self.clean_date_events_frame(table)
+
+        # uploads cleaned data to postgres
+        self.load(table, 'dim_date_times')
+
+        return table
+
+    # applies the date events cleaning steps to a dataframe of the date details json
+    @instrumented('clean')
+    def clean_date_events_frame(self, table):
 
         # changes the time_period column to category data type
         table['time_period'] = table['time_period'].astype('category')
 
-        # creates a valid list of categories and drops rows with values that aren't in the set. This removes rows with null and inconsistent values. 
-        categories = {'Evening', 'Midday', 'Morning', 'Late_Hours'}
-        inconsistent_categories = set(table['time_period']) - categories
-        inconsistent_rows = table['time_period'].isin(inconsistent_categories)
-        table = table[~inconsistent_rows]
+        # sets aside rows with a missing or invalid time period or a malformed date_uuid. This removes rows with null and inconsistent values.
+        table = self.validate('dim_date_times', table)
 
-        # changes the timestamp, month, day and year columns to datetime64[ns]
-        table['timestamp'] = pd.to_datetime(table['timestamp'], infer_datetime_format=True, errors='coerce')
-        table['timestamp'] = table['timestamp'].astype('datetime64[ns]')
-        table['timestamp'] = table['timestamp'].dt.time
+        # validates month, year and day as integers, parses timestamp as a time of day and composes the full_timestamp of each sale
+        table = build_date_dimension(table)
 
-        table['month'] = pd.to_datetime(table['month'], format='%m')
-        table['month'] = table['month'].astype('datetime64[ns]')
-        table['month'] = table['month'].dt.month
-        
-        table['year'] = pd.to_datetime(table['year'], format='%Y')
-        table['year'] = table['year'].astype('datetime64[ns]')
-        table['year'] = table['year'].dt.year
-        
-        table['day'] = pd.to_datetime(table['day'], format='%d')
-        table['day'] = table['day'].astype('datetime64[ns]')
-        table['day'] = table['day'].dt.day
+        # month, year and day become smallints, see schema_registry.py
+        table = conform_frame('dim_date_times', table)
 
-        # uploads cleaned data to postgres
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_date_times')
\ No newline at end of file
+        return table
+
+
+# splits the key values from low to high into `partitions` half-open [low, high) ranges of about the same width, in key order. An empty table (low is None) has no ranges
+def key_ranges(low, high, partitions):
+
+    if low is None:
+        return []
+
+    bounds = np.linspace(int(low), int(high) + 1, min(partitions, int(high) - int(low) + 1) + 1).round().astype(int)
+
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+# runs in a worker process of a partitioned load: reads the source rows with keys in [low, high), cleans them with the named DataCleaning method and appends them to the
+# shared staging_table with COPY, alongside the other workers. Returns the rows read, the rows loaded and, when return_table is set, the cleaned partition
+def clean_partition(source_creds_file, target_creds_file, source_table, target_table, staging_table, clean_method, key, low, high, return_table=False):
+
+    with DatabaseConnector(source_creds_file, target_creds_file, pool_size=1, max_overflow=0) as db_connect:
+        cleaner = DataCleaning(db_connect)
+        table = cleaner.extractor.read_dbs_table_range(db_connect, source_table, low, high, key)
+        rows_read = len(table)
+
+        table = getattr(cleaner, clean_method)(table)
+        db_connect.upload_to_db(table, staging_table, if_exists='append', bulk=True, types_from=target_table)
+
+    return rows_read, len(table), table if return_table else None
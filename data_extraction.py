@@ -1,27 +1,96 @@
 from database_utils import DatabaseConnector
+from store_api import fetch_store_details
+from source_cache import SourceCache
+from pdf_tables import read_pdf_tables
+from s3_ingest import read_s3_csv, read_csv_table
+from instrumentation import instrumented, record_bytes
 from sqlalchemy import create_engine, text, inspect
 import pandas as pd
 import tabula
 import requests
 import json
 import boto3
+import io
+import os
 
 class DataExtractor:
 
+    # the connector is used to read the api key, passing in a shared connector reuses its cached credentials.
+    # remote files and api responses are kept in a local SourceCache so unchanged sources aren't downloaded again, pass SourceCache(bypass=True) to always download
+    def __init__(self, db_connector=None, cache=None):
+        self.db_connector = db_connector if db_connector is not None else DatabaseConnector()
+        self.cache = cache if cache is not None else SourceCache()
+
     # reads in a specified table from the AWS database as a panda's dataframe
+    @instrumented('extract', table_arg='table')
     def read_dbs_table(self, db_connector, table):
         engine = db_connector.init_db_engine()
 
         query = (f"SELECT * FROM {table}")
-        table_df = pd.read_sql_query(sql=text(query), con=engine.connect())
+        # the connection is returned to the engine's pool once the query has been read
+        with engine.connect() as connection:
+            table_df = pd.read_sql_query(sql=text(query), con=connection)
         
         return table_df
+
+    # reads in a table in chunks of chunksize rows through a server-side cursor, yielding a dataframe per chunk so the whole table is never held in memory at once
+    @instrumented('extract', table_arg='table')
+    def read_dbs_table_chunks(self, db_connector, table, chunksize=50000):
+        engine = db_connector.init_db_engine()
+
+        query = (f"SELECT * FROM {table}")
+        with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as connection:
+            for chunk_df in pd.read_sql_query(sql=text(query), con=connection, chunksize=chunksize):
+                yield chunk_df
+
+    # reads in only the rows of a table whose key column is above the given high-water mark, returns the new rows and the new high-water mark. A watermark of None reads the whole table
+    @instrumented('extract', table_arg='table')
+    def read_dbs_table_incremental(self, db_connector, table, watermark=None, key='index'):
+        engine = db_connector.init_db_engine()
+
+        if watermark is None:
+            query = (f'SELECT * FROM {table} ORDER BY "{key}"')
+            params = {}
+        else:
+            query = (f'SELECT * FROM {table} WHERE "{key}" > :watermark ORDER BY "{key}"')
+            params = {'watermark': watermark}
+
+        with engine.connect() as connection:
+            table_df = pd.read_sql_query(sql=text(query), con=connection, params=params)
+
+        # the rows are ordered by the key so the last one holds the new high-water mark
+        new_watermark = table_df[key].iloc[-1] if len(table_df) else watermark
+
+        return table_df, new_watermark
+    
+    # returns the lowest and highest value of a table's key column and the number of rows, used to split the table into key ranges
+    def read_key_range(self, db_connector, table, key='index'):
+        engine = db_connector.init_db_engine()
+
+        with engine.connect() as connection:
+            low, high, rows = connection.execute(text(f'SELECT min("{key}"), max("{key}"), count(*) FROM {table}')).one()
+
+        return low, high, rows
+
+    # reads in the rows of a table whose key is in [low, high), ordered by the key. Each partition of a partitioned load reads its own range
+    @instrumented('extract', table_arg='table')
+    def read_dbs_table_range(self, db_connector, table, low, high, key='index'):
+        engine = db_connector.init_db_engine()
+
+        query = (f'SELECT * FROM {table} WHERE "{key}" >= :low AND "{key}" < :high ORDER BY "{key}"')
+        with engine.connect() as connection:
+            table_df = pd.read_sql_query(sql=text(query), con=connection, params={'low': low, 'high': high})
+
+        return table_df
     
-    # reads in data from a specified pdf file as a panda's  dataframe
-    def retrieve_pdf_data(self, link):
+    # reads in data from a specified pdf file as a panda's  dataframe, the pdf is read from the source cache when it hasn't changed.
+    # the pages are parsed by max_workers tabula processes and the parsed tables are cached as parquet, so an unchanged pdf is only parsed once
+    @instrumented('extract')
+    def retrieve_pdf_data(self, link, max_workers=4):
 
-        table = tabula.read_pdf(link, pages='all')
-        table_df = pd.concat(table)
+        pdf_bytes = self.cache.get_url(link)
+        record_bytes(len(pdf_bytes))
+        table_df = read_pdf_tables(pdf_bytes, max_workers, cache_dir=None if self.cache.bypass else os.path.join(self.cache.cache_dir, 'pdf_tables'))
 
         return table_df
 
@@ -31,38 +100,26 @@ class DataExtractor:
         url = endpoint 
 
         # reads in the x-api-key needed for authorisation and saves it as 'headers' which will be sent with the request
-        connect = DatabaseConnector()
-        headers = connect.read_db_creds('api_key.yaml')
+        headers = self.db_connector.read_db_creds('api_key.yaml')
 
-        response = requests.get(url, headers=headers)
-
-        data = response.json()
+        data = json.loads(self.cache.get_url(url, headers))
         number_of_stores = data['number_stores']
 
         return number_of_stores
     
-    # retrieves each stores data and saves them in a pandas dataframe
-    def retrieve_stores_data(self, endpoint):
+    # retrieves each stores data and saves them in a pandas dataframe. The requests are sent concurrently over a pooled keep-alive session, max_workers=1 fetches the stores one at a time
+    @instrumented('extract')
+    def retrieve_stores_data(self, endpoint, max_workers=16, timeout=10, retries=3, number_stores_endpoint='https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores'):
 
         url = endpoint
 
-        connect = DatabaseConnector()
-        headers = connect.read_db_creds('api_key.yaml')
+        headers = self.db_connector.read_db_creds('api_key.yaml')
 
         # calls the list_number_of_stores method to retrieve the amount of stores 
-        number_of_stores = self.list_number_of_stores('https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores')
+        number_of_stores = self.list_number_of_stores(number_stores_endpoint)
         
-        # empty list which will store each of the store details as a dictionory. This will be used to create the dataframe
-        stores_list = []
-
-        # sends a get request for each store 
-        for i in range(number_of_stores):
-            
-            # replaces the parameter '{store_number}' for i which is a store index
-            new_url = url.replace('{store_number}', str(i))
-            response = requests.get(new_url, headers=headers)
-            data = response.json() 
-            stores_list.append(data)
+        # list of each of the store details as a dictionary, in store index order. This will be used to create the dataframe
+        stores_list = fetch_store_details(url, headers, number_of_stores, max_workers=max_workers, timeout=timeout, retries=retries, cache=self.cache)
 
         # creates a pandas dataframe from the list of dictionaries storing store details 
         store_data_df = pd.DataFrame(stores_list)
@@ -70,24 +127,31 @@ class DataExtractor:
         return store_data_df
 
 
-    # uses the boto3 package to extract a csv file from an s3 bucket which is then used to create a dataframe of the products
-    def extract_from_s3(self, s3_address):
-        
-        # splits s3 address to retrieve the bucket name and object key 
-        address_list = s3_address.split('/')
-
-        s3 = boto3.client('s3')
-        s3.download_file(address_list[-2], address_list[-1], '/Users/damin/Developer/AiCore/AiCore-Final/multinational-retail-data-centralisation/products.csv')
+    # reads in a json file from a url as a pandas dataframe, the file is read from the source cache when it hasn't changed
+    @instrumented('extract')
+    def retrieve_json_data(self, url):
 
-        # creates pandas dataframe, specifying column 0 is to be used as the index
-        products_df = pd.read_csv('products.csv', index_col=0)
+        content = self.cache.get_url(url)
+        record_bytes(len(content))
+        json_df = pd.read_json(io.BytesIO(content))
 
-        return products_df
+        return json_df
 
+    # extracts a csv file from an s3 bucket as a dataframe of the products, or as an arrow table with as_arrow=True. The csv is parsed once, by arrow's csv reader, without a temporary file.
+    # the object is downloaded with parallel ranged reads into the source cache, and only again when its ETag has changed, with the cache bypassed it is streamed from s3 instead
+    @instrumented('extract')
+    def extract_from_s3(self, s3_address, as_arrow=False):
         
+        # splits s3 address to retrieve the bucket name and object key 
+        address_list = s3_address.split('/')
 
+        # column 0 is used as the index
+        if self.cache.bypass:
+            return read_s3_csv(address_list[-2], address_list[-1], index_col=0, as_arrow=as_arrow)
 
+        # the cached copy is downloaded in ranged parts straight to disk and parsed from a memory map of it
+        with self.cache.open_s3_object(address_list[-2], address_list[-1]) as source:
+            record_bytes(source.size())
+            products_df = read_csv_table(source, index_col=0, as_arrow=as_arrow)
 
-
-
-
+        return products_df
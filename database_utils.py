@@ -1,25 +1,83 @@
+import io
+import re
+import threading
+import time
 import yaml
 import psycopg2
 from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.engine import URL
 import numpy as np
 
+from schema_registry import sqlalchemy_types
+from instrumentation import instrumented
+
 
 class DatabaseConnector:
 
-    # opens yaml file containing db credentials and saves them in a python dict, returns the dict
+    # source_creds_file holds the credentials of the AWS database the data is extracted from, target_creds_file those of the local sales_data database it is uploaded to.
+    # engines are created once per credentials file and reused for every call, pool_size and max_overflow size their connection pools
+    def __init__(self, source_creds_file='aws_db_creds.yaml', target_creds_file='sales_data_creds.yaml', pool_size=5, max_overflow=10):
+        self.source_creds_file = source_creds_file
+        self.target_creds_file = target_creds_file
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self._creds = {}
+        self._engines = {}
+        # the pipeline's stages share a connector across threads, so each cache is filled under its own lock and each engine is only created once
+        self._creds_lock = threading.Lock()
+        self._engines_lock = threading.Lock()
+
+    # closes the pooled connections when used as a context manager
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # opens yaml file containing db credentials and saves them in a python dict, returns the dict. Each file is only read once per connector
     def read_db_creds(self, creds_file):
 
-        with open(creds_file, 'r')  as db_creds:
-            db_dict = yaml.safe_load(db_creds)
-        
+        with self._creds_lock:
+            if creds_file not in self._creds:
+                with open(creds_file, 'r')  as db_creds:
+                    self._creds[creds_file] = yaml.safe_load(db_creds)
+
+            # returns a copy so callers can't change the cached credentials
+            db_dict = dict(self._creds[creds_file])
+
         return db_dict
-    
-    # initialises a sqlalchemy engine using the db creds and returns the engine
+
+    # builds a sqlalchemy engine from a credentials file. URL.create escapes special characters in the password and lets RDS_HOST be a unix socket directory
+    def create_engine_from_creds(self, creds_file):
+
+        db_creds = self.read_db_creds(creds_file)
+        url = URL.create('postgresql+psycopg2', username=db_creds['RDS_USER'], password=db_creds['RDS_PASSWORD'], host=db_creds['RDS_HOST'], port=db_creds['RDS_PORT'], database=db_creds['RDS_DATABASE'])
+
+        return create_engine(url, pool_size=self.pool_size, max_overflow=self.max_overflow, pool_pre_ping=True)
+
+    # returns the pooled engine for a credentials file, creating it on first use
+    def get_engine(self, creds_file):
+
+        with self._engines_lock:
+            if creds_file not in self._engines:
+                self._engines[creds_file] = self.create_engine_from_creds(creds_file)
+
+            return self._engines[creds_file]
+
+    # disposes of every pooled engine and forgets the cached credentials, the connector can still be used afterwards and will reconnect on demand
+    def close(self):
+
+        with self._engines_lock, self._creds_lock:
+            for engine in self._engines.values():
+                engine.dispose()
+
+            self._engines.clear()
+            self._creds.clear()
+
+    # returns the pooled sqlalchemy engine for the AWS database
     def init_db_engine(self):
 
-        # uses read_db_creds method to read the AWS database credentials
-        db_creds = self.read_db_creds('aws_db_creds.yaml')
-        engine = create_engine(f"postgresql+psycopg2://{db_creds['RDS_USER']}:{db_creds['RDS_PASSWORD']}@{db_creds['RDS_HOST']}:{db_creds['RDS_PORT']}/{db_creds['RDS_DATABASE']}")
+        engine = self.get_engine(self.source_creds_file)
 
         return engine
 
@@ -32,15 +90,102 @@ class DatabaseConnector:
         table_names = inspector.get_table_names()
 
         print(table_names)
-    
-    # uploads cleaned data to local postgres database 
-    def upload_to_db(self, df, table_name):
-        
-        # uses read_db_creds method to read the sales_data database credentials
-        db_creds = self.read_db_creds('sales_data_creds.yaml')
 
-        engine = create_engine(f"postgresql+psycopg2://{db_creds['RDS_USER']}:{db_creds['RDS_PASSWORD']}@{db_creds['RDS_HOST']}:{db_creds['RDS_PORT']}/{db_creds['RDS_DATABASE']}")
-        df.to_sql(table_name, engine, if_exists='replace', index=False, index_label='index')
+    # uploads cleaned data to local postgres database. if_exists='append' adds the rows to an existing table instead of replacing it.
+    # the table is created with the column types in schema_registry.py, so star_based_schema.sql doesn't have to rewrite it to change them
+    # bulk=True loads the data with COPY instead of to_sql's INSERT statements, see bulk_upload_to_db.
+    # types_from names the table whose registered types are used when they differ, such as orders_table for the partitions of a partitioned load
+    @instrumented('load', table_arg='table_name')
+    def upload_to_db(self, df, table_name, if_exists='replace', bulk=False, batch_size=100000, types_from=None):
+
+        if bulk:
+            return self.bulk_upload_to_db(df, table_name, if_exists, batch_size, types_from)
+
+        # uses the sales_data database engine
+        engine = self.get_engine(self.target_creds_file)
+
+        df.to_sql(table_name, engine, if_exists=if_exists, index=False, index_label='index', dtype=sqlalchemy_types(types_from or table_name, df.columns))
+
+    # uploads cleaned data by streaming it through PostgreSQL's COPY FROM STDIN in CSV batches of batch_size rows, which is much faster than to_sql's INSERT statements.
+    # when replacing, the rows are copied into a staging table and swapped in under the final name in the same transaction, so readers never see a half-loaded table
+    def bulk_upload_to_db(self, df, table_name, if_exists='replace', batch_size=100000, types_from=None):
+
+        engine = self.get_engine(self.target_creds_file)
+
+        load_table = f'{table_name}__staging' if if_exists == 'replace' else table_name
+        columns = ', '.join(f'"{column}"' for column in df.columns)
+
+        with engine.begin() as connection:
+
+            # creates the empty table with the same column types to_sql would have used, an existing table is kept when appending
+            df.head(0).to_sql(load_table, connection, if_exists='replace' if if_exists == 'replace' else 'append', index=False, dtype=sqlalchemy_types(types_from or table_name, df.columns))
+
+            cursor = connection.connection.cursor()
+            for batch in self.csv_batches(df, batch_size):
+                cursor.copy_expert(f'COPY "{load_table}" ({columns}) FROM STDIN WITH (FORMAT csv)', batch)
+
+            if if_exists == 'replace':
+                connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+                connection.execute(text(f'ALTER TABLE "{load_table}" RENAME TO "{table_name}"'))
+
+    # swaps load_table in under the name table_name, such as the staging table the workers of a partitioned load copied their rows into.
+    # the rows are counted first, in the same transaction, so a count other than expected_rows raises a ValueError and leaves the old table in place
+    def swap_table(self, table_name, load_table, expected_rows):
+
+        engine = self.get_engine(self.target_creds_file)
+
+        with engine.begin() as connection:
+            rows = connection.execute(text(f'SELECT count(*) FROM "{load_table}"')).scalar()
+            if rows != expected_rows:
+                raise ValueError(f'{table_name} would have {rows} rows after its partitions were loaded, expected {expected_rows}')
+
+            connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+            connection.execute(text(f'ALTER TABLE "{load_table}" RENAME TO "{table_name}"'))
+
+        return rows
+
+    # drops the given tables if they exist
+    def drop_tables(self, table_names):
+
+        engine = self.get_engine(self.target_creds_file)
+
+        with engine.begin() as connection:
+            for table_name in table_names:
+                connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+
+    # splits a dataframe into in-memory CSV files of at most batch_size rows each, ready to be sent to COPY
+    def csv_batches(self, df, batch_size=100000):
+
+        for start in range(0, len(df), batch_size):
+            buffer = io.StringIO()
+            df.iloc[start:start + batch_size].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+
+            yield buffer
+
+    # runs a file of SQL statements, such as star_based_schema.sql, against the sales_data database in a single transaction.
+    # the statements run one at a time so each can be timed, returns a list of dicts holding each statement and the seconds it took
+    def run_sql_file(self, sql_file):
+
+        with open(sql_file, 'r') as f:
+            statements = split_sql(f.read())
+
+        engine = self.get_engine(self.target_creds_file)
+        timings = []
+
+        with engine.begin() as connection:
+            for statement in statements:
+                start_time = time.perf_counter()
+                connection.exec_driver_sql(statement)
+                timings.append({'statement': ' '.join(statement.split()), 'seconds': time.perf_counter() - start_time})
+
+        return timings
+
 
+# splits a SQL script into its statements, leaving out -- comments and /* */ blocks
+def split_sql(sql):
 
+    sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
+    sql = '\n'.join(line for line in sql.splitlines() if not line.strip().startswith('--'))
 
+    return [statement.strip() for statement in sql.split(';') if statement.strip()]
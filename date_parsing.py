@@ -0,0 +1,120 @@
+"""
+Parses the date columns of the source data, which mix a handful of formats ('2005-12-02', '2005/12/02',
+'December 2005 02', '2005 December 02').
+
+Letting pandas infer the format picks one from the first value and turns every date written another way into NaT, and
+parsing value by value is slow. DateParser instead works out which of the known formats each distinct value is written
+in, parses each group in one vectorised pass with its explicit format, and returns the dates as Arrow date32.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# the date formats found in the source data and a pattern that recognises each, in the order they are tried
+DATE_FORMATS = {
+    '%Y-%m-%d': r'\d{4}-\d{1,2}-\d{1,2}',
+    '%Y/%m/%d': r'\d{4}/\d{1,2}/\d{1,2}',
+    '%B %Y %d': r'[A-Za-z]+ \d{4} \d{1,2}',
+    '%Y %B %d': r'\d{4} [A-Za-z]+ \d{1,2}'
+}
+
+
+class DateParser:
+    """
+    Parses date columns into date32, remembering which formats each source uses.
+
+    The format of every distinct value is detected with the DATE_FORMATS patterns. The mix found is cached under the
+    source's name, so later batches from it (chunks, incremental loads, partitions) try its formats first, most common
+    first. Values in none of the formats become missing, like pd.to_datetime(errors='coerce').
+    """
+
+    def __init__(self, date_formats=None):
+        self.date_formats = date_formats if date_formats is not None else DATE_FORMATS
+        # source -> {format: number of distinct values seen in it}, most common first
+        self.format_mix = {}
+
+    def detect_formats(self, text, date_formats=None):
+        """
+        Returns the format each string is written in, None for strings in none of them. The formats are tried in the
+        order given, each only on the strings the earlier ones didn't match
+        """
+        detected = pd.Series(None, index=text.index, dtype=object)
+        for date_format in date_formats or self.date_formats:
+            undetected = text[detected.isna()]
+            # Arrow's regex kernel matches the whole column without a python call per value
+            matches = pc.match_substring_regex(pa.array(undetected, type=pa.string()), f'^(?:{self.date_formats[date_format]})$')
+            detected[undetected.index[matches.to_numpy(zero_copy_only=False)]] = date_format
+
+        return detected
+
+    def parse(self, values, source=None):
+        """
+        Returns the values parsed as a date32 Series with the same index. source names where they come from, such as
+        'legacy_users.join_date', for the format cache
+        """
+        values = pd.Series(values)
+        codes, uniques = pd.factorize(values.astype(object).where(values.notna(), None))
+        text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+
+        # the formats this source is known to use are tried first, most common first, so most values are matched by
+        # the first pattern and the others only see what is left
+        cached = list(self.format_mix.get(source, {}))
+        detected = self.detect_formats(text, cached + [f for f in self.date_formats if f not in cached])
+
+        parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+        seen = {}
+        for date_format, group in text.groupby(detected):
+            dates = pd.to_datetime(group, format=date_format, errors='coerce')
+            parsed[dates.index] = dates
+            seen[date_format] = int(dates.notna().sum())
+
+        if source is not None:
+            mix = self.format_mix.get(source, {})
+            for date_format, count in seen.items():
+                mix[date_format] = mix.get(date_format, 0) + count
+            self.format_mix[source] = dict(sorted(((f, c) for f, c in mix.items() if c), key=lambda item: -item[1]))
+
+        # missing values have the code -1, which picks the NaT appended to the end
+        days = np.append(parsed.to_numpy(), np.datetime64('NaT'))[codes].astype('datetime64[D]')
+        dates = pa.array(days, type=pa.date32(), from_pandas=True)
+
+        return pd.Series(pd.arrays.ArrowExtensionArray(dates), index=values.index, name=values.name)
+
+
+def parse_dates(values, source=None, parser=None):
+    """
+    Parses a column of dates in any of DATE_FORMATS into date32, see DateParser
+    """
+    return (parser if parser is not None else DateParser()).parse(values, source)
+
+
+# the range of each date component of dim_date_times, values outside it become missing
+DATE_COMPONENT_RANGES = {'year': (1, 9999), 'month': (1, 12), 'day': (1, 31)}
+
+TIME_PATTERN = r'(\d{1,2}):(\d{2}):(\d{2})'
+
+
+def build_date_dimension(table):
+    """
+    Casts the columns of a frame of date events to the dim_date_times types with integer operations.
+
+    month, year and day are validated as whole numbers in DATE_COMPONENT_RANGES and become smallints, timestamp is split
+    into hours, minutes and seconds and becomes an Arrow time32 time of day, and full_timestamp is composed from all
+    four in one vectorised step. Anything that isn't a valid date or time becomes missing.
+    """
+    for column, (low, high) in DATE_COMPONENT_RANGES.items():
+        values = pd.to_numeric(table[column], errors='coerce')
+        table[column] = values.where(values.between(low, high) & (values % 1 == 0)).astype('Int16')
+
+    parts = table['timestamp'].astype(str).str.extract(f'^{TIME_PATTERN}$').apply(pd.to_numeric)
+    hours, minutes, seconds = parts[0], parts[1], parts[2]
+    seconds = (hours * 3600 + minutes * 60 + seconds).where((hours < 24) & (minutes < 60) & (seconds < 60))
+    times = pa.array(seconds.astype('Int32'), type=pa.int32(), from_pandas=True).cast(pa.time32('s'))
+    table['timestamp'] = pd.Series(pd.arrays.ArrowExtensionArray(times), index=table.index)
+
+    # dates such as 30 February become NaT
+    dates = pd.to_datetime(table[['year', 'month', 'day']].astype('float64'), errors='coerce')
+    table['full_timestamp'] = dates + pd.to_timedelta(seconds, unit='s')
+
+    return table
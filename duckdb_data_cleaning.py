@@ -1,212 +1,379 @@
 from duckdb_database_utils import DatabaseConnector
 from duckdb_data_extraction import DataExtractor
+from schema_registry import ENUMS
+from date_parsing import DATE_FORMATS
+from instrumentation import instrumented, record_dropped
+from validation import RULES
 
 import pandas as pd
+import numpy as np
 import duckdb
-import re
 
 class DataCleaning:
 
-    def __init__(self):
-        self.duck_conn = duckdb.connect(":memory:")
+    # the date formats found in the source data, shared with the pandas cleaner's DateParser. parse_date tries them in order
+    DATE_FORMATS = list(DATE_FORMATS)
 
-    def clean_card_details(self):
+    def __init__(self, db_connector=None, staging=None):
+        self.conn = duckdb.connect(":memory:")
+        # one connector for every clean_* method, so PostgreSQL is attached once per run
+        self.db_connect = db_connector if db_connector is not None else DatabaseConnector()
+        self.extractor = DataExtractor(self.db_connect)
+        # with a ParquetStaging every cleaned table is also staged as Parquet and can be published again without re-cleaning
+        self.staging = staging
+        # the rows each table's validity rules rejected, as Arrow tables, until they are loaded into its _rejected table
+        self.rejected = {}
+
+        # parses a date written in any of the known formats, dates that match none of them become NULL
+        formats = ', '.join(f"'{date_format}'" for date_format in self.DATE_FORMATS)
+        self.conn.execute(f"CREATE MACRO parse_date(value) AS CAST(try_strptime(CAST(value AS VARCHAR), [{formats}]) AS DATE)")
+
+        # low-cardinality columns are cast to these enum types, which come back as Arrow dictionary arrays or pandas categoricals
+        for name, labels in ENUMS.items():
+            self.conn.execute(f"CREATE TYPE {name}_enum AS ENUM ({self.sql_list(labels)})")
+
+    def date_component(self, column, low, high):
         """
-        Extracts and cleans card details from PDF using DuckDB for processing
+        Casts a date component to a smallint, NULL if it isn't a whole number between low and high
+        """
+        return f"CASE WHEN TRY_CAST({column} AS DOUBLE) BETWEEN {low} AND {high} AND TRY_CAST({column} AS DOUBLE) % 1 = 0 " \
+               f"THEN TRY_CAST({column} AS SMALLINT) END"
+
+    def sql_list(self, values):
         """
+        Formats a list of python strings as the contents of a SQL IN (...) list
+        """
+        return ', '.join("'" + value.replace("'", "''") + "'" for value in values)
+
+    def load(self, table, table_name):
+        """
+        Stages a cleaned table as Parquet if a staging area is set, then uploads it to PostgreSQL. The rows its validity
+        rules rejected are uploaded to <table_name>_rejected with their rejection reasons
+        """
+        if self.staging is not None:
+            self.staging.write(table_name, table)
+
+        self.db_connect.upload_to_db(table, table_name)
 
-        db_extract = DataExtractor()
+        rejected = self.rejected.pop(table_name, None)
+        if rejected is not None:
+            self.db_connect.upload_to_db(rejected, f'{table_name}_rejected')
+
+    def valid_rows(self, table_name, relation, table):
+        """
+        Returns a subquery of the rows of a registered relation holding table that pass table_name's validity rules
+        (validation.py), to select from in place of the relation.
+
+        The rules are evaluated once: the relation is copied into a temporary table with the reason code of the first rule
+        each row breaks, and both the valid rows and the rejects are split off it by that column. The rejects are set aside
+        until the cleaned table is loaded. release() drops the temporary table with the relation.
+        """
+        rules = RULES[table_name]
+        columns = table.column_names if hasattr(table, 'column_names') else list(table.columns)
+
+        self.conn.execute(f"CREATE OR REPLACE TEMP TABLE {relation}_checked AS SELECT *, {rules.reason(columns)} AS rejection_reason FROM {relation}")
+
+        rejected = self.conn.execute(f"SELECT * FROM {relation}_checked WHERE rejection_reason IS NOT NULL").to_arrow_table()
+        record_dropped(rejected.num_rows)
+        self.rejected[table_name] = rejected
+
+        return f"(SELECT * EXCLUDE (rejection_reason) FROM {relation}_checked WHERE rejection_reason IS NULL)"
+
+    def release(self, relation):
+        """
+        Unregisters a relation and drops the temporary table valid_rows split it in
+        """
+        self.conn.unregister(relation)
+        self.conn.execute(f"DROP TABLE IF EXISTS {relation}_checked")
+
+    def to_frame(self, table, index):
+        """
+        Converts an Arrow table to a pandas DataFrame indexed by one of its columns, only done when a caller asks for pandas
+        """
+        table_df = table.to_pandas()
+        table_df.set_index(index, inplace=True)
+
+        return table_df
+
+    @instrumented('clean')
+    def clean_card_details(self, as_arrow=False):
+        """
+        Extracts and cleans card details from PDF using DuckDB for processing
+
+        The table is passed from extraction to cleaning to upload as Arrow and only converted to pandas on return,
+        unless as_arrow is True.
+        """
+        db_extract = self.extractor
         link = 'https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf'
-        table = db_extract.retrieve_pdf_data(link)
+        table = db_extract.retrieve_pdf_data(link, as_arrow=True)
+
+        table = self.clean_card_frame(table, as_arrow=True)
 
+        self.load(table, 'dim_card_details')
+
+        return table if as_arrow else table.to_pandas()
+
+    @instrumented('clean')
+    def clean_card_frame(self, table, as_arrow=False):
+        """
+        Cleans a DataFrame or Arrow table of card details in a single DuckDB query
+
+        Sets aside rows with invalid card providers (see valid_rows), rewrites expiry_date as MM/YYYY and parses date_payment_confirmed as a date.
+        Card numbers read from the PDF as numbers become text, as they are stored in PostgreSQL.
+        """
         self.conn.register('card_details', table)
 
-        card_providers = [
-            'Diners Club / Carte',
-            'Mastercard',
-            'VISA 13 digit', 
-            'VISA 16 digit',
-            'Discover',
-            'American Express',
-            'Maestro',
-            'JCB 16 digit',
-            'VISA 19 digit',
-            'JCB 15 digit'
-        ]
-
-        table = self.conn.execute(f"""
-            SELECT *
-            FROM card_details
-            WHERE card_provider IN ({', '.join([f"'{provider}'"] for provider in card_providers)})
+        result = self.conn.execute(f"""
+            SELECT * REPLACE (
+                CAST(card_number AS VARCHAR) AS card_number,
+                CAST(card_provider AS card_provider_enum) AS card_provider,
+                strftime(try_strptime(CAST(expiry_date AS VARCHAR), '%m/%y'), '%m/%Y') AS expiry_date,
+                parse_date(date_payment_confirmed) AS date_payment_confirmed
+            )
+            FROM {self.valid_rows('dim_card_details', 'card_details', table)}
         """)
+        table = result.to_arrow_table() if as_arrow else result.df()
 
-        # uses to_datetime() method to correct date entries and changes expiry_date and date_payment_confirmed columns to data type datetime
-        table['expiry_date'] = pd.to_datetime(table['expiry_date'], format='%m/%y')
-        table['expiry_date'] = table['expiry_date'].astype('datetime64[ns]')
-        # changes the date format for the card expiry date to month/year as would be expected
-        table['expiry_date'] = table['expiry_date'].dt.strftime('%m/%Y')
+        self.release('card_details')
 
-        table['date_payment_confirmed'] = pd.to_datetime(table['date_payment_confirmed'], infer_datetime_format=True, errors='coerce')
-        table['date_payment_confirmed'] = table['date_payment_confirmed'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['date_payment_confirmed'] = table['date_payment_confirmed'].dt.date
-
-        db_connect = DataExtractor()
-        db_connect.upload_to_db(table, 'dim_card_details')
+        return table
 
-    def clean_store_data(self):
+    @instrumented('clean')
+    def clean_store_data(self, as_arrow=False):
         """
         Cleans store data retrieved through API using DuckDB
+
+        The table is passed from extraction to cleaning to upload as Arrow. With as_arrow=False it is converted to a
+        pandas DataFrame indexed by the store index on return.
         """
-        db_extract = DataExtractor()
-        table = db_extract.retrieve_stores_data('https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/{store_number}')
+        db_extract = self.extractor
+        table = db_extract.retrieve_stores_data('https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/{store_number}', as_arrow=True)
+
+        table = self.clean_store_frame(table, as_arrow=True)
+
+        # the store index isn't uploaded, as with the DataFrame whose index it becomes
+        self.load(table.drop_columns(['index']), 'dim_store_details')
 
+        if as_arrow:
+            return table
+
+        return self.to_frame(table, 'index')
+
+    @instrumented('clean')
+    def clean_store_frame(self, table, as_arrow=False):
+        """
+        Cleans a DataFrame or Arrow table of store details in a single DuckDB query
+
+        Drops the empty lat column, removes the 'ee' typo from continent, sets aside invalid country codes, strips
+        non-digits from staff_numbers and casts it to a smallint, parses opening_date as a date, casts the coordinates to
+        floats and sets the web store's location to NULL. A DataFrame result is indexed by the store index, an Arrow
+        result keeps it as the index column.
+        """
         self.conn.register('store_data', table)
 
-        # Clean data using SQL - remove unwanted columns, fix continent, filter country codes
-        table = self.conn.execute("""
-            SELECT
-                "index",
-                store_code,
-                 store_type,
-                staff_numbers,
-                opening_date,
-                store_name,
-                address,
-                longitude,
-                latitude,
-                country_code,
-                REPLACE(continent, 'ee', '') AS continent,
-                locality
-            FROM store_data
-            WHERE country_code IN ('GB', 'US', 'DE')
-        """).df()
+        result = self.conn.execute(f"""
+            SELECT * EXCLUDE (lat) REPLACE (
+                CASE WHEN store_type = 'Web Portal' THEN NULL ELSE address END AS address,
+                CASE WHEN store_type = 'Web Portal' THEN NULL ELSE TRY_CAST(longitude AS DOUBLE) END AS longitude,
+                CASE WHEN store_type = 'Web Portal' THEN NULL ELSE locality END AS locality,
+                CAST(REPLACE(continent, 'ee', '') AS continent_enum) AS continent,
+                CAST(store_type AS store_type_enum) AS store_type,
+                CAST(country_code AS country_code_enum) AS country_code,
+                TRY_CAST(regexp_replace(CAST(staff_numbers AS VARCHAR), '[^0-9]+', '', 'g') AS SMALLINT) AS staff_numbers,
+                parse_date(opening_date) AS opening_date,
+                TRY_CAST(latitude AS DOUBLE) AS latitude
+            )
+            FROM {self.valid_rows('dim_store_details', 'store_data', table)}
+        """)
+
+        if as_arrow:
+            table = result.to_arrow_table()
+        else:
+            table = result.df()
+            table.set_index('index', inplace=True)
 
-        table.set_index('index', inplace=True)
+        self.release('store_data')
+
+        return table
 
-        def remove_chars(value):
-            return re.sub('[^0-9]+', '', str(value))
-        
-        table['staff_numbers'] = table['staff_numbers'].apply(remove_chars)
-        table['staff_numbers'] = pd.to_numeric(table['staff_numbers'])
-        
-        # uses to_datetime() method to correct date entries in the opening_date column and changes the column data type to datetime
-        table['opening_date'] = pd.to_datetime(table['opening_date'], infer_datetime_format=True, errors='coerce')
-        table['opening_date'] = table['opening_date'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['opening_date'] = table['opening_date'].dt.date
+    def weight_conversion_ctes(self, source):
+        """
+        Returns SQL common table expressions that convert the weights of the relation `source` to kg
 
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_store_details')
+        Weights repeat a lot, so each distinct entry is parsed once: regexp_extract pulls its multipack count, number and
+        unit (kg, g, ml, oz) out and the kg weight is computed from them. The last CTE is converted_weights(weight, weight_kg),
+        which is joined back onto the rows. Multipacks such as '12 x 100g' give the total weight of the pack and entries
+        with no number become NULL.
+        """
+        return rf"""
+            distinct_weights AS (
+                SELECT
+                    weight,
+                    regexp_extract(
+                        lower(CAST(weight AS VARCHAR)),
+                        '(?:(\d+)\s*x\s*)?(\d+(?:\.\d*)?|\.\d+)\s*(kg|g|ml|oz)?',
+                        ['count', 'value', 'unit']
+                    ) AS parsed
+                FROM (SELECT DISTINCT weight FROM {source})
+            ),
+            converted_weights AS (
+                SELECT
+                    weight,
+                    COALESCE(TRY_CAST(NULLIF(parsed.count, '') AS DOUBLE), 1)
+                    * TRY_CAST(NULLIF(parsed.value, '') AS DOUBLE)
+                    / CASE parsed.unit
+                        WHEN 'g' THEN 1000
+                        WHEN 'ml' THEN 1000
+                        WHEN 'oz' THEN 35.27396194958041
+                        ELSE 1
+                    END AS weight_kg
+                FROM distinct_weights
+            )
+        """
 
     def convert_product_weights(self, table):
         """
         Convert product weights to a standardised kg format
+
+        The conversion is done in SQL by DuckDB, see weight_conversion_ctes. Only the converted weight column comes back to pandas.
         """
-        self.conn.register('products_weight', table)
-
-        # For complex string manipulations, pandas is still more convenient
-        table['weight'] = table['weight'].astype(str)
-
-        def convert_to_kg(value):
-            value = re.sub('[^0123456789\.kgmlx]', '', value)
-
-            try:
-                # Handle different weight formats
-                if 'kg' in value:
-                    value = value.replace('kg', '')
-                elif 'x' in value:
-                    x_index = value.index('x')
-                    value = value.replace('g', '')
-                    value = float(value[:x_index]) * float(value[x_index + 1:])
-                    value = value / 1000
-                elif 'ml' in value:
-                    value = value.replace('ml', '')
-                    value = float(value) / 1000 
-                elif 'g' in value and 'k' not in value:
-                    value = value.replace('g', '')
-                    value = float(value) / 1000
-                
-                return float(value)
-            except (ValueError, TypeError):
-                return None
-        
-        table['weight'] = table['weight'].apply(convert_to_kg)
+        # the row position is passed in so the joined result can be put back in the original row order
+        self.conn.register('products_weight', pd.DataFrame({'weight': table['weight'].to_numpy(), 'row_id': np.arange(len(table))}))
+
+        converted = self.conn.execute(f"""
+            WITH {self.weight_conversion_ctes('products_weight')}
+            SELECT converted_weights.weight_kg
+            FROM products_weight
+            LEFT JOIN converted_weights ON products_weight.weight = converted_weights.weight
+            ORDER BY products_weight.row_id
+        """).df()
+
+        self.conn.unregister('products_weight')
+
+        table['weight'] = converted['weight_kg'].to_numpy(dtype=float)
+
         return table
 
-    def clean_products_data(self):
+    @instrumented('clean')
+    def clean_products_data(self, as_arrow=False):
         """
-        Cleans product data using DuckDB for efficient processing        
+        Cleans product data using DuckDB for efficient processing
+
+        The table is passed from extraction to cleaning to upload as Arrow. With as_arrow=False it is converted to a
+        pandas DataFrame indexed by the product index on return.
         """
-        db_extract = DataExtractor()
-        table = db_extract.extract_from_s3('s3://data-handling-public/products.csv')
+        db_extract = self.extractor
+        table = db_extract.extact_from_s3('s3://data-handling-public/products.csv', as_arrow=True)
 
-        self.conn.register('products', table)
+        table = self.clean_products_frame(table, as_arrow=True)
 
-        valid_categories = [
-            'toys-and-games',
-            'sports-and-leisure',
-            'pets',
-            'homeware',
-            'health-and-beauty',
-            'food-and-drink',
-            'diy'
-        ]
-
-        table = self.conn.execute(f"""
-            SELECT *
-            FROM products
-            WHERE category IN ({', '.join([f"'{cat}'" for cat in valid_categories])})
-        """).df()
+        self.load(table.drop_columns(['product_index']), 'dim_products')
+
+        if as_arrow:
+            return table
+
+        table = self.to_frame(table, 'product_index')
+        table.index.name = None
+
+        return table
+
+    @instrumented('clean')
+    def clean_products_frame(self, table, as_arrow=False):
+        """
+        Cleans a DataFrame or Arrow table of products in a single DuckDB query
+
+        Sets aside invalid categories and uuids, parses date_added as a date, converts weights to kg and shifts the zero based
+        index to start at 1. The '£' sign is stripped from product_price, which becomes a float, each product gets a
+        weight_class from its weight and the removed column becomes the still_available boolean. An Arrow table carries
+        its index in the first column, as read from products.csv, and the Arrow result keeps it in a product_index column.
+        """
+        # the index is passed in as a column so the rows keep their original index and order
+        if isinstance(table, pd.DataFrame):
+            table = table.reset_index(names='product_index')
+        else:
+            table = table.rename_columns(['product_index'] + table.column_names[1:])
+        self.conn.register('products', table)
 
-        table.index = table.index + 1
+        result = self.conn.execute(f"""
+            WITH valid_products AS (
+                SELECT *
+                FROM {self.valid_rows('dim_products', 'products', table)}
+            ),
+            {self.weight_conversion_ctes('valid_products')}
+            SELECT * RENAME (removed AS still_available)
+            FROM (
+                SELECT valid_products.* REPLACE (
+                    valid_products.product_index + 1 AS product_index,
+                    TRY_CAST(REPLACE(CAST(valid_products.product_price AS VARCHAR), '£', '') AS DOUBLE) AS product_price,
+                    parse_date(valid_products.date_added) AS date_added,
+                    converted_weights.weight_kg AS weight,
+                    COALESCE(valid_products.removed = 'Still_avaliable', FALSE) AS removed,
+                    CAST(valid_products.category AS category_enum) AS category
+                ),
+                CAST(CASE
+                    WHEN converted_weights.weight_kg < 2 THEN 'Light'
+                    WHEN converted_weights.weight_kg < 40 THEN 'Mid_Sized'
+                    WHEN converted_weights.weight_kg < 140 THEN 'Heavy'
+                    WHEN converted_weights.weight_kg IS NOT NULL THEN 'Truck_Required'
+                END AS weight_class_enum) AS weight_class
+                FROM valid_products
+                LEFT JOIN converted_weights ON valid_products.weight = converted_weights.weight
+                ORDER BY valid_products.product_index
+            )
+        """)
 
-        # uses to_datetime() method to correct date entries for 'date_added' column and changes the datatype to datetime64'
-        table['date_added'] = pd.to_datetime(table['date_added'], infer_datetime_format=True, errors='coerce')
-        table['date_added'] = table['date_added'].astype('datetime64[ns]')
-        # removes timestamp from column as only the date is required 
-        table['date_added'] = table['date_added'].dt.date
+        if as_arrow:
+            table = result.to_arrow_table()
+        else:
+            table = result.df()
+            table.set_index('product_index', inplace=True)
+            table.index.name = None
 
-        # Clean weight column
-        table = self.convert_product_weights(table)
+        self.release('products')
 
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_products')
+        return table
 
-    def clean_date_events_data(self):
+    @instrumented('clean')
+    def clean_date_events_data(self, as_arrow=False):
         """
         Cleans date events data
+
+        The table is passed from extraction to cleaning to upload as Arrow and only converted to pandas on return,
+        unless as_arrow is True.
         """
-        table = pd.read_json('https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json')
+        table = self.extractor.retrieve_json_data('https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json', as_arrow=True)
 
-        self.conn.register('date_events', table)
+        table = self.clean_date_events_frame(table, as_arrow=True)
 
-        valid_periods = ['Evening', 'Midday', 'Morning', 'Late_Hours']
+        self.load(table, 'dim_date_times')
 
-        table = self.conn.execute(f"""
-            SELECT * 
-            FROM date_events
-            WHERE time_period IN ({', '.join([f"'{period}'" for period in valid_periods])})
-        """).df()
+        return table if as_arrow else table.to_pandas()
 
-         # changes the timestamp, month, day and year columns to datetime64[ns]
-        table['timestamp'] = pd.to_datetime(table['timestamp'], infer_datetime_format=True, errors='coerce')
-        table['timestamp'] = table['timestamp'].astype('datetime64[ns]')
-        table['timestamp'] = table['timestamp'].dt.time
+    @instrumented('clean')
+    def clean_date_events_frame(self, table, as_arrow=False):
+        """
+        Cleans a DataFrame or Arrow table of date events in a single DuckDB query
 
-        table['month'] = pd.to_datetime(table['month'], format='%m')
-        table['month'] = table['month'].astype('datetime64[ns]')
-        table['month'] = table['month'].dt.month
-        
-        table['year'] = pd.to_datetime(table['year'], format='%Y')
-        table['year'] = table['year'].astype('datetime64[ns]')
-        table['year'] = table['year'].dt.year
-        
-        table['day'] = pd.to_datetime(table['day'], format='%d')
-        table['day'] = table['day'].astype('datetime64[ns]')
-        table['day'] = table['day'].dt.day
+        Sets aside invalid time periods and date_uuids, parses timestamp as a time of day and casts month, year and day to smallints,
+        leaving any outside the range of a date NULL. full_timestamp is composed from them, NULL for dates that don't exist.
+        """
+        self.conn.register('date_events', table)
 
-        db_connect = DatabaseConnector()
-        db_connect.upload_to_db(table, 'dim_date_times')
+        result = self.conn.execute(f"""
+            SELECT *, try(make_date(year, month, day) + "timestamp") AS full_timestamp
+            FROM (
+                SELECT * REPLACE (
+                    CAST(try_strptime(CAST("timestamp" AS VARCHAR), '%H:%M:%S') AS TIME) AS "timestamp",
+                    {self.date_component('month', 1, 12)} AS month,
+                    {self.date_component('year', 1, 9999)} AS year,
+                    {self.date_component('day', 1, 31)} AS day,
+                    CAST(time_period AS time_period_enum) AS time_period
+                )
+                FROM {self.valid_rows('dim_date_times', 'date_events', table)}
+            )
+        """)
+        table = result.to_arrow_table() if as_arrow else result.df()
 
+        self.release('date_events')
 
+        return table
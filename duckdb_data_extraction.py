@@ -1,118 +1,161 @@
 from duckdb_database_utils import DatabaseConnector
+from store_api import fetch_store_details
+from source_cache import SourceCache
+from pdf_tables import read_pdf_tables
+from s3_ingest import read_s3_csv, read_csv_table
+from instrumentation import instrumented, record_bytes
 import duckdb
 import pandas as pd
+import pyarrow as pa
 import tabula
 import requests
 import json
 import boto3
 import io
+import os
 
 class DataExtractor:
 
-    def read_dbs_table(self, db_connector, table):
+    def __init__(self, db_connector=None, cache=None):
         """
-        Reads in a specified table from the AWS database as a Panda's DataFrame.
+        The connector is used to read the api key, passing in a shared connector reuses its cached credentials.
+
+        Remote files and API responses are kept in a local SourceCache so unchanged sources are not downloaded again,
+        pass SourceCache(bypass=True) to always download.
+        """
+        self.db_connector = db_connector if db_connector is not None else DatabaseConnector()
+        self.cache = cache if cache is not None else SourceCache()
+
+    @instrumented('extract', table_arg='table')
+    def read_dbs_table(self, db_connector, table, as_arrow=False):
+        """
+        Reads in a specified table from the AWS database as a Panda's DataFrame, or as an Arrow table with as_arrow=True.
         """
         connection = db_connector.init_db_engine()
 
         # Query the table through DuckDB's SQL interface allowing for optimissation of query performance
-        result = connection.execute(f"SELECT * FROM postgres_db.{table}").df()
+        result = connection.execute(f"SELECT * FROM postgres_db.{table}")
         
-        return result
+        return result.to_arrow_table() if as_arrow else result.df()
 
-    def retrieve_pdf_data(self, link):
+    @instrumented('extract', table_arg='table')
+    def read_dbs_table_chunks(self, db_connector, table, chunksize=50000, as_arrow=False):
         """
-        Reads in data from a specified pdf file as a Panda's DataFrame.
+        Reads in a table in chunks of chunksize rows, yielding a Panda's DataFrame per chunk.
 
-        This function remains largely the same as DuckDB doesn't have native pdf parsing capabilities.
+        DuckDB streams the query result as Arrow record batches, so only one chunk is materialised at a time.
+        With as_arrow=True the record batches are yielded as they are. The stream runs on its own cursor, as any other
+        query on the connector's shared connection, such as an upload of the previous chunk, would invalidate it.
         """
-        table = tabula.read_pdf(link, pages="all")
-        table_df = pd.concat(table)
+        cursor = db_connector.init_db_engine().cursor()
 
-        # Convert to DuckDB DataFrame after extraction
-        connection = duckdb.connect(':memory:')
+        try:
+            reader = cursor.execute(f"SELECT * FROM postgres_db.{table}").to_arrow_reader(chunksize)
 
-        connection.register('pdf_table_view', table_df)
+            for batch in reader:
+                yield batch if as_arrow else batch.to_pandas()
+        finally:
+            cursor.close()
+
+    @instrumented('extract', table_arg='table')
+    def read_dbs_table_incremental(self, db_connector, table, watermark=None, key='index'):
+        """
+        Reads in only the rows of a table whose key column is above the given high-water mark.
+
+        Returns the new rows as a Panda's DataFrame together with the new high-water mark. A watermark of None reads the whole table.
+        """
+        connection = db_connector.init_db_engine()
+
+        if watermark is None:
+            result = connection.execute(f'SELECT * FROM postgres_db.{table} ORDER BY "{key}"').df()
+        else:
+            result = connection.execute(f'SELECT * FROM postgres_db.{table} WHERE "{key}" > ? ORDER BY "{key}"', [watermark]).df()
+
+        new_watermark = result[key].iloc[-1] if len(result) else watermark
+
+        return result, new_watermark
+
+    @instrumented('extract')
+    def retrieve_pdf_data(self, link, max_workers=4, as_arrow=False):
+        """
+        Reads in data from a specified pdf file as a Panda's DataFrame, or as an Arrow table with as_arrow=True.
+
+        DuckDB doesn't have native pdf parsing capabilities, so the pages are parsed by max_workers tabula processes.
+        The parsed tables are cached as Parquet under the PDF's hash, so an unchanged PDF is only parsed once.
+        """
+        pdf_bytes = self.cache.get_url(link)
+        record_bytes(len(pdf_bytes))
+        table_df = read_pdf_tables(pdf_bytes, max_workers, cache_dir=None if self.cache.bypass else os.path.join(self.cache.cache_dir, 'pdf_tables'))
+
+        # tabula only produces pandas, the page-level index is not part of the data
+        return pa.Table.from_pandas(table_df, preserve_index=False) if as_arrow else table_df
 
-        result = connection.execute("SELECT * FROM pdf_table_view").df()
-    
-        return result
-    
     def list_number_of_stores(self, endpoint):
         """
         Sends an API request to retrieve the number of stores
         """
         url = endpoint
 
-        connect = DatabaseConnector()
-        headers = connect.read_db_creds('api_key.yaml')
+        headers = self.db_connector.read_db_creds('api_key.yaml')
 
-        response = requests.get(url, headers=headers)
-
-        data = response.json()
+        data = json.loads(self.cache.get_url(url, headers))
         number_of_stores = data['number_stores']
 
         return number_of_stores
     
-    def retrieve_stores_data(self, endpoint):
+    @instrumented('extract')
+    def retrieve_stores_data(self, endpoint, max_workers=16, timeout=10, retries=3, number_stores_endpoint='https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores', as_arrow=False):
         """
-        Retrieves each stores data and saves them in a DuckDB DataFrame
+        Retrieves each stores data and saves them in a Panda's DataFrame, or an Arrow table with as_arrow=True
+
+        Stores are fetched concurrently over a pooled keep-alive session with max_workers requests in flight,
+        throttled and 5xx responses are retried with backoff and results are kept in store index order.
+        The Arrow table is built straight from the decoded responses, without going through pandas.
         """
         url = endpoint 
 
-        connect = DatabaseConnector()
-        headers = connect.read_db_creds('api_key.yaml')
+        headers = self.db_connector.read_db_creds('api_key.yaml')
 
-        number_of_stores = self.list_number_of_stores('https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores')
+        number_of_stores = self.list_number_of_stores(number_stores_endpoint)
 
-        stores_list = []
-
-        for i in range(number_of_stores):
-            new_url = url.replace('{store_number}', str(i))
-            response = requests.get(new_url, headers=headers)
-            data = response.json()
-            stores_list.append(data)
+        stores_list = fetch_store_details(url, headers, number_of_stores, max_workers=max_workers, timeout=timeout, retries=retries, cache=self.cache)
         
-        stores_df = pd.DataFrame(stores_list)
-
-        # Convert to DuckDB DataFrame
-        conn = duckdb.connect(':memory:')
-        duckdb_df = conn.from_df(stores_df)
+        if as_arrow:
+            return pa.Table.from_pylist(stores_list)
 
-        return duckdb_df.df()
+        return pd.DataFrame(stores_list)
     
-    def extact_from_s3(self, s3_address):
+    @instrumented('extract')
+    def retrieve_json_data(self, url, as_arrow=False):
         """
-        Uses boto3 to extract a CSV file from an s3 bucket and loads it using DuckDB
+        Reads in a JSON file from a url as a Panda's DataFrame, or an Arrow table with as_arrow=True, from the source
+        cache when the file hasn't changed
         """
-        address_list = s3_address.split('/')
-        bucket = address_list[-2]
-        key = address_list[-1]
-
-        s3 = boto3.client('s3')
-
-        # Instead of downloading to disk, get object and read directly
-        response = s3.get_object(Bucket=bucket, Key=key)
-        # Read the CSV content into a pandas DataFrame first
-        df = pd.read_csv(io.BytesIO(response['Body'].read()))
-    
-        # Then convert to DuckDB
-        conn = duckdb.connect(':memory:')
-        conn.register('temp_df', df)
-
-        products_df = conn.execute("SELECT * FROM temp_df").df()
-
-        return products_df
-    
-         
+        content = self.cache.get_url(url)
+        record_bytes(len(content))
+        table_df = pd.read_json(io.BytesIO(content))
 
+        return pa.Table.from_pandas(table_df, preserve_index=False) if as_arrow else table_df
 
-        
-
-
-    
-    
+    @instrumented('extract')
+    def extact_from_s3(self, s3_address, as_arrow=False):
+        """
+        Extracts a CSV file from an s3 bucket as a Panda's DataFrame, or as an Arrow table with as_arrow=True
 
+        The CSV is parsed once, by Arrow's CSV reader, and handed over without going through pandas first, an Arrow
+        table can be queried by DuckDB directly. The object is downloaded with parallel ranged reads into the source cache,
+        and only again when its ETag has changed. With the cache bypassed it is streamed from S3 instead.
+        """
+        address_list = s3_address.split('/')
+        bucket = address_list[-2]
+        key = address_list[-1]
 
+        if self.cache.bypass:
+            return read_s3_csv(bucket, key, index_col=0, as_arrow=as_arrow)
 
+        # the cached copy is parsed from a memory map of its file rather than read into memory first
+        with self.cache.open_s3_object(bucket, key) as source:
+            record_bytes(source.size())
+            products = read_csv_table(source, index_col=0, as_arrow=as_arrow)
 
+        return products
@@ -1,35 +1,108 @@
-import yaml 
-import duckdb 
+import yaml
+import duckdb
+
+from schema_registry import duckdb_select, postgres_enum_statements
+from instrumentation import instrumented
 
 class DatabaseConnector:
 
+    def __init__(self, source_creds_file='aws_db_creds.yaml', target_creds_file='sales_data_creds.yaml', pool_size=64):
+        """
+        Holds one in-memory DuckDB connection for the lifetime of the connector.
+
+        The postgres extension is loaded once and each credentials file is attached once, every later call reuses the
+        attached database. pool_size caps the number of PostgreSQL connections DuckDB keeps open per attached database.
+        """
+        self.source_creds_file = source_creds_file
+        self.target_creds_file = target_creds_file
+        self.pool_size = pool_size
+        self._creds = {}
+        self._conn = None
+        self._attached = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def read_db_creds(self, creds_file):
         """
         Reads and returns database credentials from a yaml file into a python dictionary
+
+        Each file is only read once per connector
         """
-        with open(creds_file, 'r') as db_creds:
-            db_dict = yaml.safe_load(db_creds)
+        if creds_file not in self._creds:
+            with open(creds_file, 'r') as db_creds:
+                self._creds[creds_file] = yaml.safe_load(db_creds)
 
-            return db_dict
-        
-    def init_db_engine(self):
+        return dict(self._creds[creds_file])
+
+    def connection(self):
+        """
+        Returns the connector's DuckDB connection, creating it and loading the postgres extension on first use
+        """
+        if self._conn is None:
+            conn = duckdb.connect(':memory:') # In memory DuckDB database
+
+            conn.execute("""
+            INSTALL postgres;
+            LOAD postgres;
+            """)
+            conn.execute(f"SET pg_connection_limit = {int(self.pool_size)}")
+
+            self._conn = conn
+
+        return self._conn
+
+    def attach(self, creds_file, alias):
         """
-        Create a DuckDB connection that can connect to postgres
+        Attaches the PostgreSQL database described by a credentials file under alias, unless it is already attached
         """
-        db_creds = self.read_db_creds('aws_db_creds.yaml')
-        
-        # create DuckDB connection 
-        conn = duckdb.connect(':memory:') # In memory DuckDB database
+        conn = self.connection()
 
-        conn.execute(f"""
-        INSTALL postgres;
-        LOAD postgres;
-        ATTACH 'postgres://{db_creds["RDS_USER"]}:{db_creds["RDS_PASSWORD"]}@{db_creds["RDS_HOST"]}:{db_creds["RDS_PORT"]}/{db_creds["RDS_DATABASE"]}' 
-        AS postgres_db;
-        """)
+        if self._attached.get(alias) != creds_file:
+            db_creds = self.read_db_creds(creds_file)
+
+            # libpq key/value connection string, values are quoted so passwords may contain spaces or special characters
+            def quote(value):
+                return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+            dsn = ' '.join([
+                f"host={quote(db_creds['RDS_HOST'])}",
+                f"port={quote(db_creds['RDS_PORT'])}",
+                f"dbname={quote(db_creds['RDS_DATABASE'])}",
+                f"user={quote(db_creds['RDS_USER'])}",
+                f"password={quote(db_creds['RDS_PASSWORD'])}"
+            ])
+
+            if alias in self._attached:
+                conn.execute(f"DETACH {alias}")
+            dsn = dsn.replace("'", "''")
+            conn.execute(f"ATTACH '{dsn}' AS {alias} (TYPE postgres)")
+            self._attached[alias] = creds_file
+
+        return conn
+
+    def close(self):
+        """
+        Closes the DuckDB connection, which also closes the attached PostgreSQL connections
+        """
+        if self._conn is not None:
+            self._conn.close()
+
+        self._conn = None
+        self._attached.clear()
+        self._creds.clear()
+
+    def init_db_engine(self):
+        """
+        Returns the DuckDB connection with the AWS database attached as postgres_db
+        """
+        conn = self.attach(self.source_creds_file, 'postgres_db')
 
         return conn
-    
+
     def list_db_tables(self):
         """
         List all tables in the database
@@ -44,25 +117,34 @@ class DatabaseConnector:
 
         print(table_names)
 
+    @instrumented('load', table_arg='table_name')
     def upload_to_db(self, df, table_name):
         """
-        Use duckdb to upload cleaned pandas DataFrame to PostgreSQL
+        Use duckdb to upload a cleaned pandas DataFrame or Arrow table to PostgreSQL
+
+        The sales_data database is attached as sales_db on first use and the table is replaced inside one transaction.
+        DuckDB scans an Arrow table in place, so the cleaned data isn't copied before it is sent. Columns are cast to
+        their types in schema_registry.py as the table is created, and enum columns are then converted to the PostgreSQL
+        enum types the pandas connector uses.
         """
-        
-        db_creds = self.read_db_creds('sales_data_creds.yaml')
+        conn = self.attach(self.target_creds_file, 'sales_db')
 
-        # Create connection string for PostgreSQL
-        postgres_conn_string = f"postgres://{db_creds['RDS_USER']}:{db_creds['RDS_PASSWORD']}@{db_creds['RDS_HOST']}:{db_creds['RDS_PORT']}/{db_creds['RDS_DATABASE']}"
-        
-        # Create DuckDB connection
-        conn = duckdb.connect(':memory:')
-        
-        # Register the pandas DataFrame as a view in DuckDB
+        # Register the DataFrame or Arrow table as a view in DuckDB
         conn.register('temp_df', df)
-        
-        # Create or replace the table in PostgreSQL using DuckDB's COPY functionality
-        conn.execute(f"""
-            COPY (SELECT * FROM temp_df) 
-            TO '{postgres_conn_string}' 
-            (FORMAT POSTGRES, TABLE '{table_name}', CREATE_TABLE TRUE, OVERWRITE_OR_IGNORE TRUE)
-        """)
+        columns = df.column_names if hasattr(df, 'column_names') else list(df.columns)
+
+        try:
+            # Create or replace the table in PostgreSQL through the attached database
+            conn.execute("BEGIN TRANSACTION")
+            conn.execute(f'DROP TABLE IF EXISTS sales_db."{table_name}"')
+            conn.execute(f'CREATE TABLE sales_db."{table_name}" AS {duckdb_select(table_name, columns, "temp_df")}')
+            # the enum columns are created as VARCHAR, PostgreSQL converts them to the shared enum types in the same transaction
+            for statement in postgres_enum_statements(table_name, columns):
+                statement = statement.replace("'", "''")
+                conn.execute(f"CALL postgres_execute('sales_db', '{statement}')")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.unregister('temp_df')
@@ -0,0 +1,340 @@
+"""
+Per-call metrics for the extract, clean and load methods of both implementations.
+
+The methods are decorated with @instrumented(stage). While instrumentation is enabled each call records a span: its wall
+time, CPU time, the rows it was given and returned, the rows its validity filters dropped and the bytes it moved. Spans
+nest, so clean_user_data's span contains those of read_dbs_table, clean_user_frame and upload_to_db, and the rows a child
+dropped are added to its parent. A chunked read's span stays open until its last chunk has been read, so it covers
+every chunk. The spans can be exported as JSON lines or as Prometheus text.
+
+CPU time is that of the calling thread (time.thread_time), so concurrent pipeline stages don't count each other's work.
+It leaves out what DuckDB and Arrow compute on their own threads.
+
+While disabled, which is the default, a decorated method makes one attribute check before calling through, and
+record_dropped and record_bytes return straight away. Set RETAIL_ETL_INSTRUMENTATION=1 or call enable() to turn it on.
+
+    from instrumentation import INSTRUMENTATION
+    INSTRUMENTATION.enable()
+    DataCleaning().clean_user_data()
+    INSTRUMENTATION.write('metrics.prom')
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+
+METRIC_PREFIX = 'retail_etl'
+
+# the Prometheus counters exported for every (stage, operation, implementation, table) and the span field each one sums
+PROMETHEUS_COUNTERS = {
+    'calls_total': ('calls', 'Calls made'),
+    'errors_total': ('errors', 'Calls that raised an exception'),
+    'wall_seconds_total': ('wall_seconds', 'Wall time spent in the calls'),
+    'cpu_seconds_total': ('cpu_seconds', 'CPU time of the calling thread spent in the calls'),
+    'rows_in_total': ('rows_in', 'Rows passed to the calls'),
+    'rows_out_total': ('rows_out', 'Rows returned by the calls'),
+    'rows_dropped_total': ('rows_dropped', 'Rows removed by validity filters'),
+    'bytes_total': ('bytes', 'Bytes downloaded, read or uploaded')
+}
+
+
+def table_size(table):
+    """
+    Returns the rows and in-memory bytes of a DataFrame or Arrow table, (None, None) for anything else
+    """
+    if isinstance(table, pd.DataFrame):
+        return len(table), int(table.memory_usage(index=True, deep=True).sum())
+    if isinstance(table, (pa.Table, pa.RecordBatch)):
+        return table.num_rows, table.nbytes
+
+    return None, None
+
+
+class Span:
+    """
+    The metrics of one instrumented call. rows_dropped and bytes stay None unless something reports them
+    """
+
+    def __init__(self, stage, operation, implementation=None, table=None, parent=None):
+        self.stage = stage
+        self.operation = operation
+        self.implementation = implementation
+        self.table = table
+        self.parent = parent
+        self.start = time.time()
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.rows_dropped = None
+        self.bytes = None
+        self.error = None
+
+    def add_dropped(self, rows):
+        self.rows_dropped = (self.rows_dropped or 0) + rows
+
+    def add_bytes(self, size):
+        self.bytes = (self.bytes or 0) + size
+
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'operation': self.operation,
+            'implementation': self.implementation,
+            'table': self.table,
+            'parent': self.parent.operation if self.parent is not None else None,
+            'start': self.start,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_dropped': self.rows_dropped,
+            'bytes': self.bytes,
+            'error': self.error
+        }
+
+
+class Instrumentation:
+    """
+    Collects the spans of instrumented calls from every thread while enabled
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.spans = []
+
+    def current(self):
+        """
+        Returns the innermost open span of the calling thread, None if there is none
+        """
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        return stack
+
+    def finish(self, span):
+        if span.parent is not None and span.rows_dropped:
+            span.parent.add_dropped(span.rows_dropped)
+        with self.lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, stage, operation, implementation=None, table=None):
+        """
+        Records the block as a span and yields it, so the block can set its rows and bytes. Yields None while disabled
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        stack = self.stack()
+        span = Span(stage, operation, implementation, table, parent=stack[-1] if stack else None)
+        stack.append(span)
+        start_time = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.wall_seconds = time.perf_counter() - start_time
+            span.cpu_seconds = time.thread_time() - start_cpu
+            stack.pop()
+            self.finish(span)
+
+    def stream(self, stage, operation, generator, implementation=None, table=None):
+        """
+        Yields the items of a generator, such as the chunks of a chunked read, while recording it as one span that stays
+        open until the generator is exhausted or closed. rows_out and bytes add up the items that are tables.
+
+        Its wall and CPU time only count the time spent producing the items, and the span is only on the stack while the
+        generator runs, so the spans the consumer records between two items are its siblings rather than its children
+        """
+        stack = self.stack()
+        span = Span(stage, operation, implementation, table, parent=stack[-1] if stack else None)
+        try:
+            while True:
+                stack.append(span)
+                start_time = time.perf_counter()
+                start_cpu = time.thread_time()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    break
+                finally:
+                    span.wall_seconds += time.perf_counter() - start_time
+                    span.cpu_seconds += time.thread_time() - start_cpu
+                    stack.pop()
+
+                rows, size = table_size(item)
+                if rows is not None:
+                    span.rows_out = (span.rows_out or 0) + rows
+                    span.add_bytes(size)
+
+                yield item
+        except GeneratorExit:
+            # the consumer stopped early, which isn't an error
+            raise
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            generator.close()
+            self.finish(span)
+
+    def record_dropped(self, rows):
+        """
+        Adds rows removed by a validity filter, a count or a boolean mask of the removed rows, to the current span
+        """
+        if not self.enabled:
+            return
+
+        span = self.current()
+        if span is not None:
+            span.add_dropped(int(rows.sum()) if hasattr(rows, 'sum') else int(rows))
+
+    def record_bytes(self, size):
+        """
+        Adds bytes transferred, such as the size of a downloaded file, to the current span
+        """
+        if not self.enabled:
+            return
+
+        span = self.current()
+        if span is not None:
+            span.add_bytes(size)
+
+    def records(self):
+        with self.lock:
+            return [span.to_dict() for span in self.spans]
+
+    def to_json_lines(self):
+        """
+        Returns every span as a line of JSON, in the order they finished
+        """
+        return ''.join(json.dumps(record, default=str) + '\n' for record in self.records())
+
+    def to_prometheus(self):
+        """
+        Returns the spans summed into counters per stage, operation, implementation and table, in the Prometheus text format
+        """
+        totals = {}
+        for record in self.records():
+            labels = tuple((name, record[name]) for name in ('stage', 'operation', 'implementation', 'table') if record[name] is not None)
+            total = totals.setdefault(labels, {field: 0 for field, _ in PROMETHEUS_COUNTERS.values()})
+            total['calls'] += 1
+            total['errors'] += record['error'] is not None
+            for field in ('wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'rows_dropped', 'bytes'):
+                total[field] += record[field] or 0
+
+        lines = []
+        for name, (field, description) in PROMETHEUS_COUNTERS.items():
+            metric = f'{METRIC_PREFIX}_{name}'
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for labels, total in totals.items():
+                label_text = ','.join(f'{label}="{value}"' for label, value in labels)
+                lines.append(f'{metric}{{{label_text}}} {total[field]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Writes the spans to path, as Prometheus text if it ends in .prom and as JSON lines otherwise
+        """
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus() if path.endswith('.prom') else self.to_json_lines())
+
+
+INSTRUMENTATION = Instrumentation(enabled=os.environ.get('RETAIL_ETL_INSTRUMENTATION', '') not in ('', '0'))
+
+
+def instrumented(stage, table_arg=None):
+    """
+    Decorates a method so each call is recorded as a span of the given stage ('extract', 'clean' or 'load').
+
+    rows_in and rows_out are the rows of the first table argument and of the result (or the result itself when it is a
+    row count). When nothing reported the bytes, extract spans count the size of the table they return and load spans
+    the size of the table they were given. Clean spans that return fewer rows than they were given without reporting
+    any drops count the difference as dropped. table_arg names the argument holding the table name, for the table label.
+    A generator function, such as a chunked read, is recorded as one span over all the items it yields
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        implementation = 'duckdb' if func.__module__.startswith('duckdb') else 'pandas'
+
+        if inspect.isgeneratorfunction(func):
+            # a generator's span covers the whole stream, see Instrumentation.stream
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not INSTRUMENTATION.enabled:
+                    return func(*args, **kwargs)
+
+                table = signature.bind_partial(*args, **kwargs).arguments.get(table_arg) if table_arg else None
+
+                return INSTRUMENTATION.stream(stage, func.__name__, func(*args, **kwargs), implementation, table)
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return func(*args, **kwargs)
+
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            table = arguments.get(table_arg) if table_arg else None
+            tables = [value for name, value in arguments.items() if name != 'self' and table_size(value)[0] is not None]
+            rows_in, bytes_in = table_size(tables[0]) if tables else (None, None)
+
+            with INSTRUMENTATION.span(stage, func.__name__, implementation, table) as span:
+                span.rows_in = rows_in
+                result = func(*args, **kwargs)
+
+                output = result[0] if isinstance(result, tuple) and result else result
+                rows_out, bytes_out = table_size(output)
+                if rows_out is None and isinstance(output, int) and not isinstance(output, bool):
+                    rows_out = output
+                span.rows_out = rows_out
+
+                if span.bytes is None:
+                    span.bytes = bytes_in if stage == 'load' else bytes_out
+                if stage == 'clean' and span.rows_dropped is None and rows_in is not None and rows_out is not None and rows_out < rows_in:
+                    span.rows_dropped = rows_in - rows_out
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def record_dropped(rows):
+    INSTRUMENTATION.record_dropped(rows)
+
+
+def record_bytes(size):
+    INSTRUMENTATION.record_bytes(size)
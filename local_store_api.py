@@ -0,0 +1,140 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_store(index, seed=0):
+    """
+    Builds a synthetic store record with the same fields as the live store_details API
+    """
+    rng = random.Random(seed * 100003 + index)
+    country_code = rng.choice(['GB', 'US', 'DE'])
+    continent = {'GB': 'Europe', 'DE': 'Europe', 'US': 'America'}[country_code]
+
+    return {
+        'index': index,
+        'address': f'{rng.randint(1, 999)} Test Street',
+        'longitude': str(round(rng.uniform(-120, 15), 5)),
+        'lat': None,
+        'locality': rng.choice(['London', 'High Wycombe', 'Berlin', 'Munich', 'New York', 'Chapletown']),
+        'store_code': f'{rng.choice(["BL", "HI", "CH", "LO", "WE"])}-{rng.randint(0, 0xFFFFFFFF):08X}',
+        'staff_numbers': str(rng.randint(5, 150)),
+        'opening_date': f'{rng.randint(1992, 2022)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'store_type': rng.choice(['Local', 'Super Store', 'Mall Kiosk', 'Outlet']),
+        'latitude': str(round(rng.uniform(30, 60), 5)),
+        'country_code': country_code,
+        'continent': continent
+    }
+
+
+class LocalStoreAPI:
+    """
+    A local HTTP stand-in for the store API, used to measure and test store extraction offline.
+
+    Serves /prod/number_stores and /prod/store_details/{store_number} on localhost. `latency` adds a delay to every
+    response to mimic the network round trip and `transient_failures` makes each store URL answer 503 that many times
+    before succeeding, which exercises the retry path.
+    """
+
+    def __init__(self, number_of_stores=451, latency=0.0, transient_failures=0, api_key=None, seed=0):
+        self.stores = [make_store(i, seed) for i in range(number_of_stores)]
+        self.latency = latency
+        self.transient_failures = transient_failures
+        self.api_key = api_key
+        self.request_count = 0
+        self._failures_seen = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/prod'
+
+    @property
+    def number_stores_url(self):
+        return f'{self.base_url}/number_stores'
+
+    @property
+    def store_details_url(self):
+        return f'{self.base_url}/store_details/{{store_number}}'
+
+    def _handle(self, path, headers):
+        """
+        Returns the status code and JSON body for a request path
+        """
+        with self._lock:
+            self.request_count += 1
+
+        if self.api_key is not None and headers.get('x-api-key') != self.api_key:
+            return 403, {'message': 'Forbidden'}
+
+        if path == '/prod/number_stores':
+            return 200, {'statusCode': 200, 'number_stores': len(self.stores)}
+
+        match = re.fullmatch(r'/prod/store_details/(\d+)', path)
+        if match is None or int(match.group(1)) >= len(self.stores):
+            return 404, {'message': 'Not Found'}
+
+        with self._lock:
+            seen = self._failures_seen.get(path, 0)
+            self._failures_seen[path] = seen + 1
+        if seen < self.transient_failures:
+            return 503, {'message': 'Service Unavailable'}
+
+        return 200, self.stores[int(match.group(1))]
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 so clients can keep connections alive between requests
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if api.latency:
+                    time.sleep(api.latency)
+                status, body = api._handle(self.path, self.headers)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == '__main__':
+    from store_api import fetch_store_details
+
+    # compares serial and concurrent throughput against a stand-in with a realistic per-request latency
+    with LocalStoreAPI(number_of_stores=451, latency=0.05) as api:
+        for max_workers in (1, 4, 16, 32):
+            start_time = time.perf_counter()
+            stores = fetch_store_details(api.store_details_url, {}, len(api.stores), max_workers=max_workers)
+            elapsed = time.perf_counter() - start_time
+            print(f'max_workers={max_workers:>2}: {len(stores)} stores in {elapsed:.2f}s ({len(stores) / elapsed:.0f} stores/s)')
@@ -0,0 +1,88 @@
+"""
+Memory measurements for the benchmarks: the Python heap peak of a call (tracemalloc), the peak resident set size of the
+process while it ran and the deep memory usage of DataFrames.
+
+tracemalloc sees the memory allocated through Python, including pandas' and NumPy's buffers, but not what DuckDB
+allocates itself. The peak RSS covers everything. On Linux the kernel's high-water mark (VmHWM) is reset before each call,
+so the peak is that of the call alone. Elsewhere only the peak of the whole process (ru_maxrss) is available, which
+never goes down, so the value is the process peak once the call had finished.
+"""
+import sys
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+
+MB = 1024 ** 2
+
+
+def reset_peak_rss():
+    """
+    Resets the process's peak RSS to its current RSS, where the platform allows it. Returns whether it did
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the process in MB, since the last reset_peak_rss() on Linux
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024 / MB
+    except OSError:
+        pass
+
+    import resource
+    # ru_maxrss is in bytes on macOS and kB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return max_rss / MB if sys.platform == 'darwin' else max_rss * 1024 / MB
+
+
+def frame_memory_mb(table):
+    """
+    Returns the memory a DataFrame (deep, so strings are counted) or Arrow table holds in MB, None for anything else
+    """
+    if isinstance(table, pd.DataFrame):
+        return float(table.memory_usage(index=True, deep=True).sum()) / MB
+    if isinstance(table, (pa.Table, pa.RecordBatch)):
+        return table.nbytes / MB
+
+    return None
+
+
+def measure_memory(func, *args, **kwargs):
+    """
+    Calls func and returns its result with the memory it used: 'python_peak_mb', the tracemalloc peak during the call,
+    'peak_rss_mb', the peak RSS of the process while it ran, and 'input_mb' and 'output_mb', the size of the first
+    argument and of the result when they are tables
+    """
+    input_mb = frame_memory_mb(args[0]) if args else None
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    reset_peak_rss()
+
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _, python_peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+
+    return result, {
+        'python_peak_mb': python_peak / MB,
+        'peak_rss_mb': peak_rss_mb(),
+        'input_mb': input_mb,
+        'output_mb': frame_memory_mb(result)
+    }
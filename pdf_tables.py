@@ -0,0 +1,108 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import tabula
+
+
+def count_pdf_pages(pdf_bytes):
+    """
+    Returns the number of pages in a PDF, or None if it can't be worked out.
+
+    Uses pypdf when it is installed, otherwise counts the /Type /Page objects, which works for PDFs whose page objects
+    aren't compressed into object streams.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        pages = len(re.findall(rb'/Type\s*/Page(?![a-zA-Z])', pdf_bytes))
+        return pages or None
+
+    return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+def page_ranges(number_of_pages, parts):
+    """
+    Splits pages 1..number_of_pages into at most `parts` contiguous tabula page ranges such as '1-72'
+    """
+    parts = max(1, min(parts, number_of_pages))
+    size, remainder = divmod(number_of_pages, parts)
+
+    ranges = []
+    start = 1
+    for part in range(parts):
+        end = start + size - 1 + (1 if part < remainder else 0)
+        ranges.append(f'{start}-{end}')
+        start = end + 1
+
+    return ranges
+
+
+def read_pages(pdf_path, pages):
+    """
+    Reads the tables on the given pages of a PDF into one DataFrame. Runs in a worker process, each with its own JVM
+    """
+    tables = tabula.read_pdf(pdf_path, pages=pages)
+
+    return pd.concat(tables) if tables else pd.DataFrame()
+
+
+def cacheable(table_df):
+    """
+    Converts object columns holding a mix of types, such as card numbers that are numeric on some pages and text on
+    others, to strings so the table can be written to Parquet. Missing values are kept
+    """
+    table_df = table_df.copy()
+    for column in table_df.columns[table_df.dtypes == object]:
+        values = table_df[column].dropna()
+        if values.map(type).nunique() > 1:
+            table_df[column] = table_df[column].map(lambda value: value if pd.isna(value) else str(value))
+
+    return table_df
+
+
+def read_pdf_tables(pdf_bytes, max_workers=4, cache_dir='.source_cache/pdf_tables'):
+    """
+    Extracts every table in a PDF into one DataFrame, in page order.
+
+    The pages are split into max_workers ranges that are parsed by tabula in separate processes. The result is cached
+    as Parquet under the SHA-256 of the PDF, so an unchanged PDF is never parsed again. cache_dir=None disables the cache.
+    Mixed-type columns are always returned as strings (see cacheable) so cached and freshly parsed tables match.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f'{hashlib.sha256(pdf_bytes).hexdigest()}.parquet')
+        if os.path.exists(cache_path):
+            return pd.read_parquet(cache_path)
+
+    # tabula reads from a file, which the worker processes can all open
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, 'source.pdf')
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf_bytes)
+
+        number_of_pages = count_pdf_pages(pdf_bytes)
+
+        if max_workers <= 1 or not number_of_pages:
+            table_df = read_pages(pdf_path, 'all')
+        else:
+            ranges = page_ranges(number_of_pages, max_workers)
+            # spawned rather than forked, as the pipeline calls this from a thread while other threads hold pooled connections and locks
+            with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context('spawn')) as executor:
+                # map returns the ranges' tables in page order
+                table_df = pd.concat(executor.map(read_pages, [pdf_path] * len(ranges), ranges))
+
+    table_df = cacheable(table_df)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f'{cache_path}.tmp'
+        table_df.to_parquet(temp_path)
+        os.replace(temp_path, cache_path)
+
+    return table_df
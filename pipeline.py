@@ -0,0 +1,275 @@
+"""
+Runs the ETL as a dependency graph of stages.
+
+The six dimension and fact loads read from independent sources (RDS users, RDS orders, the card PDF, the store API,
+the S3 products CSV and the date events JSON), so they run concurrently on a thread pool. The star_schema stage applies
+star_based_schema.sql once every table it touches has been loaded, then the indexes stage indexes the orders_table join
+columns and refreshes the planner statistics with star_schema_indexes.sql. Each stage records its wall time and the rows
+and bytes it produced, the SQL stages also the time each statement took.
+
+    python pipeline.py                         # runs every stage
+    python pipeline.py dim_store_details       # reruns a single dimension
+    python pipeline.py star_schema --report run.json
+    python pipeline.py --metrics run.prom      # also records every extract, clean and load call, see instrumentation.py
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+
+class Stage:
+    """
+    A named unit of work in the pipeline and the names of the stages that must finish before it starts
+    """
+
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+
+
+class StageResult:
+    """
+    The outcome of one stage: its status ('succeeded', 'failed' or 'skipped'), wall time and the rows and bytes it produced.
+    details holds anything else the stage reported, such as the per-statement timings of a SQL file
+    """
+
+    def __init__(self, name, status, wall_time=0.0, rows=None, bytes=None, error=None, details=None):
+        self.name = name
+        self.status = status
+        self.wall_time = wall_time
+        self.rows = rows
+        self.bytes = bytes
+        self.error = error
+        self.details = details
+
+    def to_dict(self):
+        return {
+            'stage': self.name,
+            'status': self.status,
+            'wall_time': self.wall_time,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'error': self.error,
+            'details': self.details
+        }
+
+
+def measure_output(output):
+    """
+    Returns the rows and in-memory bytes of a stage's output. Stages return the cleaned DataFrame, or a row count when they stream
+    """
+    if isinstance(output, pd.DataFrame):
+        return len(output), int(output.memory_usage(index=True, deep=True).sum())
+    if isinstance(output, int) and not isinstance(output, bool):
+        return output, None
+
+    return None, None
+
+
+class Pipeline:
+    """
+    Executes stages as soon as all of their dependencies have succeeded, up to max_workers at a time
+    """
+
+    def __init__(self, stages, max_workers=6):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+
+        for stage in stages:
+            missing = [name for name in stage.depends_on if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+        self.execution_order(list(self.stages))
+
+    def execution_order(self, names):
+        """
+        Returns the given stages in dependency order, raising a ValueError if the dependencies contain a cycle
+        """
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage '{name}'")
+
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                if dependency in names:
+                    visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in names:
+            visit(name)
+
+        return ordered
+
+    def select(self, targets=None, with_dependencies=True):
+        """
+        Returns the stages needed to build the targets, all stages if targets is empty
+        """
+        if not targets:
+            return self.execution_order(list(self.stages))
+
+        unknown = [name for name in targets if name not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown stages: {unknown}. Choose from {list(self.stages)}")
+
+        selected = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                if with_dependencies:
+                    pending.extend(self.stages[name].depends_on)
+
+        return self.execution_order([name for name in self.stages if name in selected])
+
+    def run_stage(self, stage):
+        start_time = time.perf_counter()
+        try:
+            output = stage.func()
+        except Exception as e:
+            return StageResult(stage.name, 'failed', time.perf_counter() - start_time, error=repr(e))
+
+        rows, size = measure_output(output)
+        details = output if isinstance(output, (list, dict, str)) else None
+
+        return StageResult(stage.name, 'succeeded', time.perf_counter() - start_time, rows, size, details=details)
+
+    def run(self, targets=None, with_dependencies=True):
+        """
+        Runs the selected stages and returns their StageResults in the order they were selected.
+
+        Dependencies outside the selection (when with_dependencies is False) are assumed to be loaded already.
+        A failed stage does not stop independent stages, but everything downstream of it is skipped.
+        """
+        names = self.select(targets, with_dependencies)
+        results = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(results) < len(names):
+                for name in names:
+                    if name in results or name in running.values():
+                        continue
+
+                    dependencies = [dependency for dependency in self.stages[name].depends_on if dependency in names]
+                    if any(dependency in results and results[dependency].status != 'succeeded' for dependency in dependencies):
+                        results[name] = StageResult(name, 'skipped', error='an upstream stage did not succeed')
+                    elif all(dependency in results for dependency in dependencies):
+                        running[executor.submit(self.run_stage, self.stages[name])] = name
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        return [results[name] for name in names]
+
+
+def build_pipeline(cleaner=None, max_workers=6, schema_file='star_based_schema.sql', index_file='star_schema_indexes.sql', orders_workers=None):
+    """
+    Builds the ETL pipeline around a pandas DataCleaning, whose connector is shared by every stage
+
+    With orders_workers the orders_table stage cleans and loads the orders in that many processes, see DataCleaning.load_partitioned.
+
+    When the cleaner stages its tables as Parquet, orders_table waits for dim_date_times, whose dates partition the staged orders,
+    and a sales_aggregates stage refreshes the summary tables in aggregates.py once the orders and their dimensions are staged.
+    """
+    if cleaner is None:
+        from data_cleaning import DataCleaning
+        cleaner = DataCleaning()
+
+    staging = getattr(cleaner, 'staging', None)
+    clean_orders = (lambda: cleaner.clean_orders_data(workers=orders_workers)) if orders_workers else cleaner.clean_orders_data
+    tables = ['dim_users', 'dim_card_details', 'dim_store_details', 'dim_products', 'dim_date_times', 'orders_table']
+    stages = [
+        Stage('dim_users', cleaner.clean_user_data),
+        Stage('dim_card_details', cleaner.clean_card_details),
+        Stage('dim_store_details', cleaner.clean_store_data),
+        Stage('dim_products', cleaner.clean_products_data),
+        Stage('dim_date_times', cleaner.clean_date_events_data),
+        Stage('orders_table', clean_orders, depends_on=['dim_date_times'] if staging is not None else []),
+        Stage('star_schema', lambda: cleaner.db_connect.run_sql_file(schema_file), depends_on=tables),
+        Stage('indexes', lambda: cleaner.db_connect.run_sql_file(index_file), depends_on=['star_schema'])
+    ]
+
+    if staging is not None:
+        def refresh_aggregates():
+            from sales_queries import SalesQueries
+            return SalesQueries(staging.staging_dir).refresh_aggregates()
+
+        stages.append(Stage('sales_aggregates', refresh_aggregates, depends_on=['dim_store_details', 'dim_products', 'dim_date_times', 'orders_table']))
+
+    return Pipeline(stages, max_workers)
+
+
+def print_report(results, total_time):
+    report = pd.DataFrame([result.to_dict() for result in results])
+    print(report.drop(columns=['error', 'details']).to_string(index=False))
+    print(f"\nTotal wall time: {total_time:.2f}s")
+
+    # the SQL stages report how long each statement took
+    for result in results:
+        if isinstance(result.details, list):
+            print(f"\n{result.name}:")
+            for timing in result.details:
+                print(f"  {timing['seconds']:8.3f}s  {timing['statement'][:100]}")
+
+    for result in results:
+        if result.error:
+            print(f"{result.name}: {result.error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the retail data ETL pipeline')
+    parser.add_argument('targets', nargs='*', help='stages to run together with their dependencies (default: all)')
+    parser.add_argument('--only', action='store_true', help="don't run the targets' dependencies")
+    parser.add_argument('--workers', type=int, default=6, help='number of stages that may run at the same time')
+    parser.add_argument('--report', help='write the per-stage metrics to this JSON file')
+    parser.add_argument('--orders-workers', type=int, help='clean and load orders_table in this many processes, partitioned by index')
+    parser.add_argument('--metrics', help='record every extract, clean and load call and write the metrics to this file, as Prometheus text if it ends in .prom and JSON lines otherwise')
+    parser.add_argument('--staging-dir', help='also stage every cleaned table as Parquet in this directory, see staging.py')
+    args = parser.parse_args()
+
+    from data_cleaning import DataCleaning
+    from staging import ParquetStaging
+    from instrumentation import INSTRUMENTATION
+
+    if args.metrics:
+        INSTRUMENTATION.enable()
+
+    cleaner = DataCleaning(staging=ParquetStaging(args.staging_dir) if args.staging_dir else None)
+    pipeline = build_pipeline(cleaner, args.workers, orders_workers=args.orders_workers)
+
+    try:
+        pipeline.select(args.targets)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start_time = time.perf_counter()
+    results = pipeline.run(args.targets, with_dependencies=not args.only)
+    total_time = time.perf_counter() - start_time
+
+    print_report(results, total_time)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'total_wall_time': total_time, 'stages': [result.to_dict() for result in results]}, f, indent=4)
+
+    if args.metrics:
+        INSTRUMENTATION.write(args.metrics)
+
+    if any(result.status != 'succeeded' for result in results):
+        raise SystemExit(1)
@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+
+def read_csv_table(source, index_col=0, as_arrow=False):
+    """
+    Parses a CSV file-like object or pyarrow buffer reader with Arrow's multithreaded CSV reader.
+
+    Returns the Arrow table when as_arrow is True. Otherwise returns a pandas DataFrame with column index_col as its
+    index, like pd.read_csv(..., index_col=0) would.
+    """
+    # like pd.read_csv, NULL, N/A and empty fields in text columns are read as missing values
+    table = pa_csv.read_csv(source, convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+
+    if as_arrow:
+        return table
+
+    table_df = table.to_pandas()
+
+    if index_col is not None:
+        index_name = table_df.columns[index_col]
+        table_df = table_df.set_index(index_name)
+        # an unnamed index column, such as the first column of products.csv, has an empty header
+        if index_name == '':
+            table_df.index.name = None
+
+    return table_df
+
+
+def read_s3_parts(s3_client, bucket, key, size, write, etag=None, part_size=8 * 1024 ** 2, max_workers=8):
+    """
+    Downloads an S3 object with concurrent ranged GETs of part_size bytes each, calling write(position, chunk) for every
+    chunk of the body as it arrives.
+
+    Passing the ETag from the HEAD request makes S3 reject the parts if the object is replaced mid-download.
+    """
+    def read_part(start):
+        end = min(start + part_size, size)
+        kwargs = {'Bucket': bucket, 'Key': key, 'Range': f'bytes={start}-{end - 1}'}
+        if etag is not None:
+            kwargs['IfMatch'] = etag
+
+        body = s3_client.get_object(**kwargs)['Body']
+        position = start
+        while position < end:
+            chunk = body.read(min(1024 ** 2, end - position))
+            if not chunk:
+                raise IOError(f's3://{bucket}/{key}: part {start}-{end - 1} ended after {position - start} bytes')
+            write(position, chunk)
+            position += len(chunk)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() re-raises any error from the parts
+        list(executor.map(read_part, range(0, size, part_size)))
+
+
+def read_s3_object(s3_client, bucket, key, size, etag=None, part_size=8 * 1024 ** 2, max_workers=8):
+    """
+    Downloads an S3 object in concurrent ranged parts (see read_s3_parts), returning it as a pyarrow Buffer.
+
+    Each part is written straight into its slice of one preallocated buffer, which Arrow then wraps without copying.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+
+    def write(position, chunk):
+        view[position:position + len(chunk)] = chunk
+
+    read_s3_parts(s3_client, bucket, key, size, write, etag, part_size, max_workers)
+
+    return pa.py_buffer(buffer)
+
+
+def download_s3_object(s3_client, bucket, key, path, size, etag=None, part_size=8 * 1024 ** 2, max_workers=8):
+    """
+    Downloads an S3 object in concurrent ranged parts (see read_s3_parts) to a file, without holding it in memory.
+
+    The file is allocated at its full size up front and each part is written at its own offset.
+    """
+    with open(path, 'wb') as f:
+        f.truncate(size)
+        descriptor = f.fileno()
+
+        def write(position, chunk):
+            os.pwrite(descriptor, chunk, position)
+
+        read_s3_parts(s3_client, bucket, key, size, write, etag, part_size, max_workers)
+
+
+def read_s3_csv(bucket, key, s3_client=None, index_col=0, as_arrow=False, part_size=8 * 1024 ** 2, max_workers=8):
+    """
+    Reads a CSV object from S3 without writing it to disk or parsing it twice.
+
+    Objects up to part_size bytes are streamed from the response body straight into Arrow's CSV reader. Larger objects
+    are downloaded with concurrent ranged GETs (see read_s3_object) and parsed from memory. Returns an Arrow table
+    or a pandas DataFrame, see read_csv_table.
+    """
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client('s3')
+
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+
+    if head['ContentLength'] <= part_size:
+        source = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    else:
+        source = pa.BufferReader(read_s3_object(s3_client, bucket, key, head['ContentLength'], head.get('ETag'), part_size, max_workers))
+
+    return read_csv_table(source, index_col, as_arrow)
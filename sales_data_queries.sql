@@ -138,9 +138,9 @@ ORDER BY
 
 WITH next_sale AS(
 SELECT date_uuid, 
-	make_date(year::int, month::int, day::int) + timestamp AS sale,
-	LEAD(make_date(year::int, month::int, day::int) + timestamp)
-	OVER( ORDER BY make_date(year::int, month::int, day::int) + timestamp) AS next_sale
+	full_timestamp AS sale,
+	LEAD(full_timestamp)
+	OVER( ORDER BY full_timestamp) AS next_sale
 FROM dim_date_times)
 
 SELECT
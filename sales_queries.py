@@ -0,0 +1,171 @@
+"""
+Runs the business queries in sales_data_queries.sql on DuckDB, against the Parquet copy of the star schema written by
+staging.py, instead of on PostgreSQL.
+
+    python sales_queries.py                   # prints every query's result
+    python sales_queries.py --check-parity    # also runs them on PostgreSQL and compares the results
+    python sales_queries.py --refresh-aggregates
+"""
+import argparse
+import decimal
+import os
+import re
+
+import duckdb
+import pandas as pd
+from sqlalchemy import text
+
+from aggregates import SalesAggregates
+from staging import ParquetStaging
+
+
+def load_queries(path='sales_data_queries.sql'):
+    """
+    Splits a SQL file into its statements, returning a dictionary of each statement keyed by the comment above it
+    """
+    with open(path, 'r') as f:
+        sql = f.read()
+
+    queries = {}
+    for statement in sql.split(';'):
+        lines = statement.strip().splitlines()
+        comments = [line[2:].strip() for line in lines if line.startswith('--')]
+        body = '\n'.join(line for line in lines if not line.startswith('--')).strip()
+        if body:
+            title = comments[0] if comments else f'query {len(queries) + 1}'
+            queries[title] = body
+
+    return queries
+
+
+def to_duckdb_sql(sql):
+    """
+    Rewrites the PostgreSQL-specific parts of a query for DuckDB.
+
+    DuckDB's NUMERIC defaults to DECIMAL(18,3), which would round before ROUND(..., 2) does, so it is widened.
+    """
+    return re.sub(r'::\s*numeric\b', '::DECIMAL(38, 10)', sql, flags=re.IGNORECASE)
+
+
+class SalesQueries:
+    """
+    Creates DuckDB views over the staged Parquet tables and runs the sales queries against them. The staged tables
+    already have the column types of the star schema in PostgreSQL, see schema_registry.py. Every query returns a
+    pandas DataFrame.
+
+    With use_aggregates, queries that the summary tables in aggregates.py can answer are rewritten to read them instead
+    of orders_table, as long as the summaries are up to date with the staged tables.
+    """
+
+    def __init__(self, staging_dir='staging', queries_file='sales_data_queries.sql', use_aggregates=True):
+        self.staging = ParquetStaging(staging_dir)
+        self.queries = load_queries(queries_file)
+        self.conn = duckdb.connect(':memory:')
+        self.use_aggregates = use_aggregates
+        self.create_views()
+        self.aggregates = SalesAggregates(self.staging, self.conn)
+        self.aggregates.create_views()
+
+    def create_views(self):
+        """
+        Creates a view over each staged table. The partition columns of orders_table only exist in its directory names,
+        so reading the files without hive partitioning leaves them out
+        """
+        for table_name in self.staging.tables():
+            files = os.path.join(self.staging.table_path(table_name), '**', '*.parquet').replace("'", "''")
+            self.conn.execute(f"""CREATE OR REPLACE VIEW "{table_name}" AS SELECT * FROM read_parquet('{files}', hive_partitioning = false)""")
+
+    def run(self, title):
+        """
+        Runs one of the queries from the SQL file, by its comment, and returns the result as a DataFrame
+        """
+        return self.run_sql(self.queries[title])
+
+    def run_sql(self, sql):
+        if self.use_aggregates:
+            sql = self.aggregates.route(sql) or sql
+
+        return self.conn.execute(to_duckdb_sql(sql)).df()
+
+    def refresh_aggregates(self):
+        """
+        Builds or incrementally refreshes the summary tables from the staged tables, see SalesAggregates.refresh
+        """
+        return self.aggregates.refresh()
+
+    def run_all(self):
+        """
+        Runs every query, returning a dictionary of DataFrames keyed by the query comments
+        """
+        return {title: self.run(title) for title in self.queries}
+
+    def check_parity(self, db_connector):
+        """
+        Runs every query on PostgreSQL through the connector's sales_data engine and on DuckDB, returning whether each pair of results match
+        """
+        engine = db_connector.get_engine(db_connector.target_creds_file)
+        parity = {}
+
+        with engine.connect() as connection:
+            for title, sql in self.queries.items():
+                expected = pd.read_sql_query(text(sql), connection)
+                parity[title] = results_match(expected, self.run(title))
+
+        return parity
+
+
+def normalise_result(result):
+    """
+    Puts a query result in a form that compares equal across databases: numbers as floats rounded to 2 decimal places,
+    as the databases widen integer sums differently, intervals in whole seconds, everything else as text, and the rows
+    sorted, as tied rows may come back in any order
+    """
+    result = result.copy()
+    result.columns = [str(column).lower() for column in result.columns]
+
+    for column in result.columns:
+        values = result[column]
+        if pd.api.types.is_timedelta64_dtype(values) or values.map(lambda value: isinstance(value, pd.Timedelta)).any():
+            result[column] = pd.to_timedelta(values).dt.total_seconds().round()
+        elif values.map(lambda value: isinstance(value, decimal.Decimal)).any() or \
+                (pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)):
+            result[column] = pd.to_numeric(values.astype(float)).round(2)
+
+        result[column] = result[column].map(lambda value: None if pd.isna(value) else str(value))
+
+    return result.sort_values(list(result.columns)).reset_index(drop=True)
+
+
+def results_match(expected, actual):
+    """
+    Returns True if two query results hold the same rows, see normalise_result
+    """
+    if expected.shape != actual.shape:
+        return False
+
+    return normalise_result(expected).equals(normalise_result(actual))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the sales queries on DuckDB over the staged Parquet tables')
+    parser.add_argument('--staging-dir', default='staging')
+    parser.add_argument('--queries', default='sales_data_queries.sql')
+    parser.add_argument('--check-parity', action='store_true', help='also run the queries on PostgreSQL and compare the results')
+    parser.add_argument('--refresh-aggregates', action='store_true', help='bring the summary tables up to date with the staged tables first')
+    parser.add_argument('--no-aggregates', action='store_true', help="always query orders_table, never the summary tables")
+    args = parser.parse_args()
+
+    sales_queries = SalesQueries(args.staging_dir, args.queries, use_aggregates=not args.no_aggregates)
+
+    if args.refresh_aggregates:
+        print(f"Sales aggregates {sales_queries.refresh_aggregates()}")
+
+    for title, result in sales_queries.run_all().items():
+        print(f"\n-- {title}\n{result.to_string(index=False)}")
+
+    if args.check_parity:
+        from database_utils import DatabaseConnector
+
+        with DatabaseConnector() as db_connector:
+            for title, matches in sales_queries.check_parity(db_connector).items():
+                print(f"{'OK  ' if matches else 'DIFF'} {title}")
@@ -0,0 +1,212 @@
+"""
+The final PostgreSQL column types of every table in the star schema.
+
+The tables are created with these types when they are uploaded, so star_based_schema.sql no longer has to rewrite
+them with ALTER TABLE ... TYPE. Columns that aren't listed keep the type inferred from the cleaned data.
+
+Low-cardinality text columns are registered as ENUM(<name>): they are kept as pandas categoricals (Arrow dictionary
+arrays in the DuckDB cleaner) with the labels in ENUMS from cleaning to upload, and stored as PostgreSQL enum types.
+"""
+import re
+
+import pandas as pd
+from sqlalchemy import Boolean, Date, DateTime, Float, SmallInteger, String, Time
+from sqlalchemy.dialects.postgresql import ENUM, UUID
+
+# the labels of each enumerated type, in the order they sort in
+ENUMS = {
+    'country_code': ['GB', 'US', 'DE'],
+    'continent': ['Europe', 'America'],
+    'store_type': ['Web Portal', 'Local', 'Super Store', 'Mall Kiosk', 'Outlet'],
+    'card_provider': [
+        'Diners Club / Carte Blanche',
+        'Mastercard',
+        'VISA 13 digit',
+        'VISA 16 digit',
+        'Discover',
+        'American Express',
+        'Maestro',
+        'JCB 16 digit',
+        'VISA 19 digit',
+        'JCB 15 digit'
+    ],
+    'category': ['toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty', 'food-and-drink', 'diy'],
+    'weight_class': ['Light', 'Mid_Sized', 'Heavy', 'Truck_Required'],
+    'time_period': ['Evening', 'Midday', 'Morning', 'Late_Hours']
+}
+
+SCHEMAS = {
+    'orders_table': {
+        'date_uuid': 'UUID',
+        'user_uuid': 'UUID',
+        'card_number': 'VARCHAR(22)',
+        'store_code': 'VARCHAR(12)',
+        'product_code': 'VARCHAR(11)',
+        'product_quantity': 'SMALLINT'
+    },
+    'dim_users': {
+        'first_name': 'VARCHAR(255)',
+        'last_name': 'VARCHAR(255)',
+        'date_of_birth': 'DATE',
+        'country_code': 'ENUM(country_code)',
+        'user_uuid': 'UUID',
+        'join_date': 'DATE'
+    },
+    'dim_store_details': {
+        'longitude': 'FLOAT',
+        'locality': 'VARCHAR(255)',
+        'store_code': 'VARCHAR(12)',
+        'staff_numbers': 'SMALLINT',
+        'opening_date': 'DATE',
+        'store_type': 'ENUM(store_type)',
+        'latitude': 'FLOAT',
+        'country_code': 'ENUM(country_code)',
+        'continent': 'ENUM(continent)'
+    },
+    'dim_products': {
+        'product_price': 'FLOAT',
+        'weight': 'FLOAT',
+        'category': 'ENUM(category)',
+        'EAN': 'VARCHAR(17)',
+        'product_code': 'VARCHAR(11)',
+        'date_added': 'DATE',
+        'uuid': 'UUID',
+        'still_available': 'BOOL',
+        'weight_class': 'ENUM(weight_class)'
+    },
+    'dim_date_times': {
+        'timestamp': 'TIME',
+        'month': 'SMALLINT',
+        'year': 'SMALLINT',
+        'day': 'SMALLINT',
+        'time_period': 'ENUM(time_period)',
+        'date_uuid': 'UUID',
+        'full_timestamp': 'TIMESTAMP'
+    },
+    'dim_card_details': {
+        'card_number': 'VARCHAR(22)',
+        'expiry_date': 'VARCHAR(7)',
+        'card_provider': 'ENUM(card_provider)',
+        'date_payment_confirmed': 'DATE'
+    }
+}
+
+# the DuckDB type each PostgreSQL type is created from by the DuckDB connector. DuckDB ignores VARCHAR lengths, and enum
+# columns are sent as VARCHAR as its postgres extension doesn't create PostgreSQL enum types, postgres_enum_statements
+# converts them afterwards
+DUCKDB_TYPES = {'UUID': 'UUID', 'SMALLINT': 'SMALLINT', 'DATE': 'DATE', 'FLOAT': 'DOUBLE', 'BOOL': 'BOOLEAN', 'TIME': 'TIME', 'TIMESTAMP': 'TIMESTAMP'}
+
+
+def column_types(table_name, columns):
+    """
+    Returns the registered type of each of the columns that has one
+    """
+    schema = SCHEMAS.get(table_name, {})
+
+    return {column: schema[column] for column in columns if column in schema}
+
+
+def enum_name(sql_type):
+    """
+    Returns the name of the enumerated type in a registered type such as 'ENUM(store_type)', None for other types
+    """
+    match = re.fullmatch(r'ENUM\((\w+)\)', sql_type or '')
+
+    return match.group(1) if match else None
+
+
+def sqlalchemy_type(sql_type):
+    match = re.fullmatch(r'VARCHAR\((\d+)\)', sql_type)
+    if match:
+        return String(int(match.group(1)))
+
+    if enum_name(sql_type):
+        return ENUM(*ENUMS[enum_name(sql_type)], name=f'{enum_name(sql_type)}_enum')
+
+    return {
+        'UUID': UUID(as_uuid=False),
+        'SMALLINT': SmallInteger(),
+        'DATE': Date(),
+        'FLOAT': Float(),
+        'BOOL': Boolean(),
+        'TIME': Time(),
+        'TIMESTAMP': DateTime()
+    }[sql_type]
+
+
+def sqlalchemy_types(table_name, columns):
+    """
+    Returns the dtype argument for DataFrame.to_sql that creates the columns with their registered types
+    """
+    return {column: sqlalchemy_type(sql_type) for column, sql_type in column_types(table_name, columns).items()}
+
+
+def duckdb_select(table_name, columns, source):
+    """
+    Returns a DuckDB SELECT of the columns from source, with each registered column cast to its type
+    """
+    types = column_types(table_name, columns)
+    select = []
+    for column in columns:
+        sql_type = types.get(column)
+        duckdb_type = 'VARCHAR' if sql_type and sql_type.startswith(('VARCHAR', 'ENUM')) else DUCKDB_TYPES.get(sql_type)
+        select.append(f'CAST("{column}" AS {duckdb_type}) AS "{column}"' if duckdb_type else f'"{column}"')
+
+    return f"SELECT {', '.join(select)} FROM {source}"
+
+
+def postgres_enum_statements(table_name, columns):
+    """
+    Returns the PostgreSQL statements that convert a table's enum columns, created as VARCHAR, to their enum types.
+
+    Each type is created the first time a table needs it and shared by every table after that, with the same name and
+    labels as the types DataFrame.to_sql creates, so both connectors can load into the same database.
+    """
+    statements = []
+    for column, sql_type in column_types(table_name, columns).items():
+        name = enum_name(sql_type)
+        if name is None:
+            continue
+
+        labels = ', '.join("'" + label.replace("'", "''") + "'" for label in ENUMS[name])
+        # another table being loaded at the same time may create the type first
+        statements.append(
+            f'DO $$ BEGIN CREATE TYPE {name}_enum AS ENUM ({labels}); '
+            f'EXCEPTION WHEN duplicate_object OR unique_violation THEN NULL; END $$'
+        )
+        statements.append(f'ALTER TABLE "{table_name}" ALTER COLUMN "{column}" TYPE {name}_enum USING "{column}"::{name}_enum')
+
+    return statements
+
+
+def conform_frame(table_name, table):
+    """
+    Gives each registered column of a cleaned DataFrame the pandas dtype that matches its PostgreSQL type.
+
+    SMALLINT columns become int16 (Int16 if they have missing values), FLOAT columns float64 and BOOL columns bool.
+    ENUM columns become categoricals with the enum's labels as their categories, raising a ValueError for any other value.
+    Numbers in text columns, such as card numbers read from the PDF, become strings.
+    """
+    for column, sql_type in column_types(table_name, table.columns).items():
+        values = table[column]
+
+        if enum_name(sql_type):
+            labels = ENUMS[enum_name(sql_type)]
+            unknown = set(values.dropna().astype(object)) - set(labels)
+            if unknown:
+                raise ValueError(f'{table_name}.{column} has values outside {labels}: {sorted(unknown)}')
+            table[column] = values.astype(object).astype(pd.CategoricalDtype(labels))
+        elif sql_type == 'SMALLINT':
+            values = pd.to_numeric(values, errors='coerce')
+            table[column] = values.astype('Int16' if values.isna().any() else 'int16')
+        elif sql_type == 'FLOAT':
+            table[column] = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif sql_type == 'BOOL':
+            table[column] = values.astype(bool)
+        elif (sql_type == 'UUID' or sql_type.startswith('VARCHAR')) and pd.api.types.is_numeric_dtype(values):
+            # whole numbers read as floats because of missing values would otherwise keep a '.0'
+            if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+                values = values.astype('Int64')
+            table[column] = values.astype(str).where(values.notna(), None)
+
+    return table
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pyarrow as pa
+import requests
+
+from s3_ingest import download_s3_object
+from store_api import fetch_response
+
+
+class SourceCache:
+    """
+    Caches remote source files (the card details PDF, the date events JSON, the products CSV on S3 and the store API
+    responses) on local disk.
+
+    Files are stored once per distinct content under blobs/<sha256> and an index.json maps each URL or s3:// address to
+    its blob, the ETag and Last-Modified validators the source sent, when it was last fetched and when it was last used.
+
+    A cached file younger than max_age seconds is returned without touching the network. An older one is revalidated
+    with a conditional request (If-None-Match / If-Modified-Since) and only downloaded again if the source has changed.
+    Sources that send no validators are downloaded again, but an unchanged body still maps onto the existing blob.
+    Large files, such as the products CSV, can be downloaded straight into their blob and read through a memory map
+    (see open_file and open_s3_object) so they are never held in memory as a whole.
+    Once the blobs take up more than max_bytes the least recently used entries are evicted. bypass=True skips the cache
+    entirely, neither reading from nor writing to it.
+
+    Inside a batch() block the index is kept in memory and written once when the block ends, so a run of lookups, such
+    as the hundreds of store API responses, doesn't rewrite index.json for every cached file it reads.
+    """
+
+    def __init__(self, cache_dir='.source_cache', max_bytes=512 * 1024 ** 2, max_age=3600, bypass=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.bypass = bypass
+        self._index = None
+        self._batch_depth = 0
+        self._index_changed = False
+        # the store API responses are fetched from several threads at once
+        self._lock = threading.RLock()
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, 'blobs', digest)
+
+    def _read_index(self):
+        if self._index is None:
+            if os.path.exists(self._index_path()):
+                with open(self._index_path(), 'r') as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {}
+
+        return self._index
+
+    def _write_index(self):
+        if self._batch_depth:
+            self._index_changed = True
+            return
+
+        # written to a temporary file and swapped in so an interrupted run never leaves the index half written
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f'{self._index_path()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self._index, f, indent=4)
+        os.replace(temp_path, self._index_path())
+        self._index_changed = False
+
+    @contextmanager
+    def batch(self):
+        """
+        Defers writing the index until the block ends, then writes it once if anything in it changed
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._index_changed:
+                    self._write_index()
+
+    def _store_blob(self, temp_path):
+        """
+        Moves a downloaded file into the blobs under the hash of its content, returning the hash and the size
+        """
+        digest = hashlib.sha256()
+        with open(temp_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 ** 2), b''):
+                digest.update(block)
+        digest = digest.hexdigest()
+        size = os.path.getsize(temp_path)
+
+        # an unchanged file maps onto the blob that is already there
+        if os.path.exists(self._blob_path(digest)):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, self._blob_path(digest))
+
+        return digest, size
+
+    def cached_entry(self, key):
+        """
+        Returns the index entry of a cached key, or None if the key is not cached or its blob has gone missing
+        """
+        with self._lock:
+            entry = self._read_index().get(key)
+            if entry is None or not os.path.exists(self._blob_path(entry['sha256'])):
+                return None
+
+            return dict(entry)
+
+    def get(self, key, fetch):
+        """
+        Returns the content stored under key, calling fetch only when the cached copy is missing or too old.
+
+        fetch is called with the cached entry (None if there is none) so it can send a conditional request, and returns
+        a tuple of (content, validators). content is None when the source reports that the cached copy is still current.
+        """
+        if self.bypass:
+            content, _ = fetch(None)
+            return content
+
+        def fetch_file(entry, path):
+            content, validators = fetch(entry)
+            if content is not None:
+                with open(path, 'wb') as f:
+                    f.write(content)
+
+            return content is not None, validators
+
+        with self.open_file(key, fetch_file) as source:
+            return source.read()
+
+    def open_file(self, key, fetch):
+        """
+        Returns the file stored under key opened as a pyarrow memory map, calling fetch only when the cached copy is
+        missing or too old. Large files are read this way without holding a copy of them in memory.
+
+        fetch is called with the cached entry (None if there is none) and the path of a temporary file. It writes the
+        content to that file and returns a tuple of (downloaded, validators). downloaded is False when the source reports
+        that the cached copy is still current. The cache can't be bypassed here, as the file has to be written somewhere.
+        """
+        # the entry is checked, updated and opened under the lock, so another thread's eviction can't remove it in
+        # between. Once it is open an eviction only unlinks it, the memory map stays readable
+        with self._lock:
+            entry = self.cached_entry(key)
+            now = time.time()
+
+            if entry is not None and self.max_age is not None and now - entry['fetched_at'] < self.max_age:
+                self._index[key]['last_used'] = now
+                self._write_index()
+                return pa.memory_map(self._blob_path(entry['sha256']))
+
+        os.makedirs(os.path.join(self.cache_dir, 'blobs'), exist_ok=True)
+        temp_path = self._blob_path(f'{uuid.uuid4().hex}.tmp')
+
+        try:
+            downloaded, validators = fetch(entry, temp_path)
+
+            with self._lock:
+                # the cached copy may have been evicted by another thread while it was being revalidated
+                evicted = not downloaded and not os.path.exists(self._blob_path(entry['sha256']))
+
+                if not evicted:
+                    if downloaded:
+                        digest, size = self._store_blob(temp_path)
+                        entry = {'sha256': digest, 'size': size, 'fetched_at': now, **validators}
+                    else:
+                        entry['fetched_at'] = now
+
+                    entry['last_used'] = now
+                    self._read_index()[key] = entry
+                    self.evict(keep=key)
+                    self._write_index()
+                    source = pa.memory_map(self._blob_path(entry['sha256']))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        # in which case it is downloaded again, cached_entry no longer returns it
+        return self.open_file(key, fetch) if evicted else source
+
+    def evict(self, keep=None):
+        """
+        Evicts the least recently used entries until the cached blobs fit in max_bytes. The entry for `keep` is never evicted
+        """
+        with self._lock:
+            index = self._read_index()
+
+            # several keys may share a blob, each blob is counted once
+            blob_sizes = {entry['sha256']: entry['size'] for entry in index.values()}
+            total_bytes = sum(blob_sizes.values())
+
+            for key in sorted(index, key=lambda key: index[key]['last_used']):
+                if total_bytes <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+
+                digest = index.pop(key)['sha256']
+                if all(entry['sha256'] != digest for entry in index.values()):
+                    total_bytes -= blob_sizes[digest]
+                    if os.path.exists(self._blob_path(digest)):
+                        os.remove(self._blob_path(digest))
+
+    def clear(self):
+        """
+        Removes every cached file
+        """
+        with self._lock:
+            for entry in self._read_index().values():
+                if os.path.exists(self._blob_path(entry['sha256'])):
+                    os.remove(self._blob_path(entry['sha256']))
+
+            self._index = {}
+            self._write_index()
+
+    def get_url(self, url, headers=None, session=None, timeout=10, retries=3, backoff=0.5):
+        """
+        Returns the body of a HTTP(S) resource, revalidating a stale cached copy with a conditional GET
+        """
+        def fetch(entry):
+            request_headers = dict(headers or {})
+            if entry is not None and entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry is not None and entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+            response = fetch_response(session if session is not None else requests, url, request_headers, timeout, retries, backoff)
+
+            if response.status_code == 304 and entry is not None:
+                return None, {}
+            response.raise_for_status()
+
+            return response.content, {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+        return self.get(url, fetch)
+
+    def get_s3_object(self, bucket, key, s3_client=None):
+        """
+        Returns the body of an S3 object, revalidating a stale cached copy with a conditional GetObject on its ETag
+        """
+        def fetch(entry):
+            # the client is only created when S3 actually has to be contacted
+            import boto3
+            from botocore.exceptions import ClientError
+
+            client = s3_client if s3_client is not None else boto3.client('s3')
+            kwargs = {'Bucket': bucket, 'Key': key}
+            if entry is not None and entry.get('etag'):
+                kwargs['IfNoneMatch'] = entry['etag']
+
+            try:
+                response = client.get_object(**kwargs)
+            except ClientError as e:
+                if entry is not None and e.response['Error']['Code'] in ('304', 'NotModified'):
+                    return None, {}
+                raise
+
+            return response['Body'].read(), {'etag': response['ETag'], 'last_modified': str(response['LastModified'])}
+
+        return self.get(f's3://{bucket}/{key}', fetch)
+
+    def open_s3_object(self, bucket, key, s3_client=None, part_size=8 * 1024 ** 2, max_workers=8):
+        """
+        Returns an S3 object opened as a pyarrow memory map of its cached copy. A stale copy is revalidated with a
+        conditional HeadObject on its ETag, a changed or missing one is downloaded with concurrent ranged GETs straight
+        into its blob file (see s3_ingest.download_s3_object)
+        """
+        def fetch(entry, path):
+            import boto3
+            from botocore.exceptions import ClientError
+
+            client = s3_client if s3_client is not None else boto3.client('s3')
+            kwargs = {'Bucket': bucket, 'Key': key}
+            if entry is not None and entry.get('etag'):
+                kwargs['IfNoneMatch'] = entry['etag']
+
+            try:
+                head = client.head_object(**kwargs)
+            except ClientError as e:
+                if entry is not None and e.response['Error']['Code'] in ('304', 'NotModified'):
+                    return False, {}
+                raise
+
+            download_s3_object(client, bucket, key, path, head['ContentLength'], head['ETag'], part_size, max_workers)
+
+            return True, {'etag': head['ETag'], 'last_modified': str(head['LastModified'])}
+
+        return self.open_file(f's3://{bucket}/{key}', fetch)
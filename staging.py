@@ -0,0 +1,170 @@
+"""
+Stages cleaned tables as compressed Parquet so they can be reloaded without extracting and cleaning them again.
+
+    python staging.py                              # publishes every staged table to the sales_data database
+    python staging.py dim_products orders_table    # publishes only these tables
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ParquetStaging:
+    """
+    Writes each cleaned table to <staging_dir>/<table_name>/ as a zstd-compressed Parquet dataset.
+
+    orders_table is partitioned into year=/month= directories by the date of each order, looked up through date_uuid in
+    the staged dim_date_times, so it should be staged after dim_date_times. A manifest.json records the partition
+    columns, row count and write time of every table. publish() loads staged tables into PostgreSQL through a
+    DatabaseConnector, leaving the partition columns out.
+    """
+
+    PARTITIONS = {'orders_table': ['year', 'month']}
+
+    def __init__(self, staging_dir='staging', compression='zstd'):
+        self.staging_dir = staging_dir
+        self.compression = compression
+        # the pipeline stages its tables from several threads at once
+        self._lock = threading.Lock()
+
+    def _manifest_path(self):
+        return os.path.join(self.staging_dir, 'manifest.json')
+
+    def _read_manifest(self):
+        if not os.path.exists(self._manifest_path()):
+            return {}
+
+        with open(self._manifest_path(), 'r') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        # written to a temporary file and swapped in so an interrupted run never leaves the manifest half written
+        temp_path = f'{self._manifest_path()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_path, self._manifest_path())
+
+    def table_path(self, table_name):
+        return os.path.join(self.staging_dir, table_name)
+
+    def tables(self):
+        """
+        Returns the names of the staged tables
+        """
+        return list(self._read_manifest())
+
+    def to_arrow(self, table):
+        """
+        Converts a cleaned DataFrame to Arrow without its index, which isn't uploaded either
+        """
+        if isinstance(table, pa.Table):
+            return table
+
+        return pa.Table.from_pandas(table, preserve_index=False)
+
+    def order_partitions(self, orders):
+        """
+        Adds the year and month of each order, from the staged dim_date_times, as partition columns
+        """
+        if 'dim_date_times' not in self.tables():
+            raise ValueError('dim_date_times must be staged before orders_table can be partitioned by year and month')
+
+        dates = pq.read_table(self.table_path('dim_date_times'), columns=['date_uuid', 'year', 'month']).to_pandas()
+        dates = dates.drop_duplicates('date_uuid').set_index('date_uuid')
+        date_uuids = orders.column('date_uuid').to_pandas()
+
+        for column in ['year', 'month']:
+            values = pd.array(date_uuids.map(dates[column]), dtype='Int64')
+            orders = orders.append_column(column, pa.array(values))
+
+        return orders
+
+    def write(self, table_name, table, if_exists='replace'):
+        """
+        Stages a cleaned DataFrame or Arrow table. if_exists='append' adds the rows to an already staged table.
+
+        A replaced table is written next to the old one and swapped in, so readers never see a half-written table.
+        """
+        table = self.to_arrow(table)
+        partition_cols = self.PARTITIONS.get(table_name, [])
+        if partition_cols:
+            table = self.order_partitions(table)
+
+        path = self.table_path(table_name)
+        write_path = path if if_exists == 'append' and os.path.exists(path) else f'{path}.tmp-{uuid.uuid4().hex}'
+
+        # a unique file name per write lets appends add files next to the existing ones
+        pq.write_to_dataset(
+            table,
+            write_path,
+            partition_cols=partition_cols or None,
+            compression=self.compression,
+            basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+            existing_data_behavior='overwrite_or_ignore'
+        )
+
+        with self._lock:
+            manifest = self._read_manifest()
+
+            if write_path != path:
+                old_path = f'{path}.old-{uuid.uuid4().hex}'
+                if os.path.exists(path):
+                    os.rename(path, old_path)
+                os.rename(write_path, path)
+                shutil.rmtree(old_path, ignore_errors=True)
+                rows = table.num_rows
+            else:
+                rows = manifest[table_name]['rows'] + table.num_rows
+
+            manifest[table_name] = {'partition_cols': partition_cols, 'rows': rows, 'written_at': time.time()}
+            self._write_manifest(manifest)
+
+    def read(self, table_name, as_arrow=False):
+        """
+        Reads a staged table back, without its partition columns, as a DataFrame or with as_arrow=True as an Arrow table
+        """
+        manifest = self._read_manifest()
+        if table_name not in manifest:
+            raise KeyError(f"'{table_name}' has not been staged in {self.staging_dir}")
+
+        table = pq.read_table(self.table_path(table_name))
+        table = table.drop_columns(manifest[table_name]['partition_cols'])
+
+        return table if as_arrow else table.to_pandas()
+
+    def publish(self, db_connector, table_names=None, as_arrow=False):
+        """
+        Uploads staged tables to PostgreSQL without extracting or cleaning them again, returning the rows published per table.
+
+        The pandas DatabaseConnector uploads DataFrames, pass as_arrow=True to hand the DuckDB one Arrow tables.
+        """
+        published = {}
+        for table_name in table_names or self.tables():
+            table = self.read(table_name, as_arrow=as_arrow)
+            db_connector.upload_to_db(table, table_name)
+            published[table_name] = table.num_rows if as_arrow else len(table)
+
+        return published
+
+
+if __name__ == "__main__":
+    from database_utils import DatabaseConnector
+
+    parser = argparse.ArgumentParser(description='Publish staged tables to the sales_data database')
+    parser.add_argument('tables', nargs='*', help='tables to publish (default: every staged table)')
+    parser.add_argument('--staging-dir', default='staging')
+    args = parser.parse_args()
+
+    staging = ParquetStaging(args.staging_dir)
+
+    with DatabaseConnector() as db_connector:
+        for table_name, rows in staging.publish(db_connector, args.tables).items():
+            print(f"{table_name}: {rows} rows")
@@ -0,0 +1,30 @@
+
+-- Indexes the orders_table columns the sales queries join the dimension tables on. They are built once the tables have been loaded, as keeping them up to date during the bulk load would slow every insert
+
+CREATE INDEX IF NOT EXISTS orders_table_date_uuid_idx ON orders_table (date_uuid);
+
+CREATE INDEX IF NOT EXISTS orders_table_user_uuid_idx ON orders_table (user_uuid);
+
+CREATE INDEX IF NOT EXISTS orders_table_card_number_idx ON orders_table (card_number);
+
+CREATE INDEX IF NOT EXISTS orders_table_store_code_idx ON orders_table (store_code);
+
+CREATE INDEX IF NOT EXISTS orders_table_product_code_idx ON orders_table (product_code);
+
+-- dim_products has no primary key (see star_based_schema.sql), so its join column is indexed here
+
+CREATE INDEX IF NOT EXISTS dim_products_product_code_idx ON dim_products (product_code);
+
+-- Refreshes the planner statistics of the freshly loaded tables so the joins use the new indexes
+
+ANALYZE orders_table;
+
+ANALYZE dim_users;
+
+ANALYZE dim_card_details;
+
+ANALYZE dim_store_details;
+
+ANALYZE dim_products;
+
+ANALYZE dim_date_times;
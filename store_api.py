@@ -0,0 +1,80 @@
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+# status codes worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def create_session(pool_size):
+    """
+    Creates a requests Session whose connection pool is large enough to keep one keep-alive connection per worker
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def fetch_response(session, url, headers=None, timeout=10, retries=3, backoff=0.5):
+    """
+    Sends a GET request and returns the response.
+
+    Throttled (429) and 5xx responses, timeouts and dropped connections are retried with exponential backoff,
+    honouring a numeric Retry-After header when the server sends one.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            if attempt == retries:
+                response.raise_for_status()
+
+            retry_after = response.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt
+
+        time.sleep(delay)
+
+
+def fetch_json(session, url, headers=None, timeout=10, retries=3, backoff=0.5):
+    """
+    Sends a GET request, retried as in fetch_response, and returns the decoded JSON body. Error responses that aren't
+    retried, such as 403 or 404, raise a requests.HTTPError, as they do when the response goes through a SourceCache
+    """
+    response = fetch_response(session, url, headers, timeout, retries, backoff)
+    response.raise_for_status()
+
+    return response.json()
+
+
+def fetch_store_details(url, headers, number_of_stores, max_workers=16, timeout=10, retries=3, backoff=0.5, cache=None):
+    """
+    Fetches the details of every store concurrently over a pooled keep-alive session.
+
+    `url` contains a '{store_number}' placeholder. Results are returned as a list of dictionaries in store index order,
+    regardless of the order in which the responses arrive. With a SourceCache, stores whose cached response is still
+    fresh are not requested again.
+    """
+    urls = [url.replace('{store_number}', str(i)) for i in range(number_of_stores)]
+    max_workers = max(1, min(max_workers, number_of_stores))
+
+    with create_session(max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # executor.map yields results in the order of its inputs, so the list lines up with the store indices
+        if cache is None:
+            stores_list = list(executor.map(lambda store_url: fetch_json(session, store_url, headers, timeout, retries, backoff), urls))
+        else:
+            # the cache writes its index once for the whole batch rather than once per store
+            with cache.batch():
+                stores_list = list(executor.map(lambda store_url: json.loads(cache.get_url(store_url, headers, session, timeout, retries, backoff)), urls))
+
+    return stores_list
@@ -0,0 +1,286 @@
+"""
+Deterministic synthetic versions of every source of the pipeline, for benchmarks and tests that run offline.
+
+Each generator builds rows shaped like its live source, including the defects the cleaners exist for: rows of 'NULL's,
+rows of random 10 character strings, 'GGB' country codes, 'ee' prefixed continents, dates in the four source formats,
+weights in g, kg, ml, oz and multipacks, '£' prices and card numbers with stray '?'s. The same seed and number of rows
+always give the same data.
+
+SOURCE_ROWS holds the size of each live source, rows_at_scale() scales them, so a scale factor of 1 gives sources of
+about the same size as the real ones.
+"""
+import io
+import json
+import string
+
+import numpy as np
+import pandas as pd
+
+from local_store_api import make_store
+
+# the number of rows in each live source
+SOURCE_ROWS = {
+    'legacy_users': 15320,
+    'orders_table': 120123,
+    'card_details': 15309,
+    'store_details': 451,
+    'products': 1853,
+    'date_events': 120161
+}
+
+# the share of rows that are all 'NULL' and the share that are random strings in every column
+NULL_ROWS = 0.001
+JUNK_ROWS = 0.001
+
+CARD_PROVIDERS = [
+    'Diners Club / Carte Blanche', 'Mastercard', 'VISA 13 digit', 'VISA 16 digit', 'Discover', 'American Express', 'Maestro',
+    'JCB 16 digit', 'VISA 19 digit', 'JCB 15 digit'
+]
+CATEGORIES = ['toys-and-games', 'sports-and-leisure', 'pets', 'homeware', 'health-and-beauty', 'food-and-drink', 'diy']
+TIME_PERIODS = ['Evening', 'Midday', 'Morning', 'Late_Hours']
+FIRST_NAMES = ['Sigfried', 'Guy', 'Harry', 'Andreas', 'Lily', 'Yvonne', 'Roy', 'Anna', 'Lucas', 'Emma', 'Mohammed', 'Olivia']
+LAST_NAMES = ['Noack', 'Allen', 'Lawrence', 'Bonbach', 'Scott', 'Beyer', 'Smith', 'Muller', 'Brown', 'Johnson', 'Khan', 'Jones']
+COUNTRIES = {'GB': 'United Kingdom', 'US': 'United States', 'DE': 'Germany'}
+
+
+def rows_at_scale(source, scale):
+    """
+    Returns the number of rows of a source at a scale factor, at least one
+    """
+    return max(1, int(round(SOURCE_ROWS[source] * scale)))
+
+
+def make_uuids(rng, rows):
+    """
+    Returns rows random version 4 UUID strings
+    """
+    high = rng.integers(0, 2 ** 64, size=rows, dtype=np.uint64)
+    low = rng.integers(0, 2 ** 64, size=rows, dtype=np.uint64)
+    # the version (4) and variant (10xx) bits
+    high = (high & np.uint64(0xFFFFFFFFFFFF0FFF)) | np.uint64(0x4000)
+    low = (low & np.uint64(0x3FFFFFFFFFFFFFFF)) | np.uint64(0x8000000000000000)
+    digits = np.char.add(np.char.mod('%016x', high), np.char.mod('%016x', low))
+
+    return [f'{u[:8]}-{u[8:12]}-{u[12:16]}-{u[16:20]}-{u[20:]}' for u in digits.tolist()]
+
+
+def format_dates(rng, days, mixed=0.02):
+    """
+    Writes datetime64 days as strings, mostly ISO and a share of them in each of the other formats of the source data
+    """
+    dates = pd.Series(pd.to_datetime(days))
+    formats = rng.choice(['%Y-%m-%d', '%Y/%m/%d', '%B %Y %d', '%Y %B %d'], size=len(dates), p=[1 - 3 * mixed, mixed, mixed, mixed])
+
+    text = dates.dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+    for date_format in ['%Y/%m/%d', '%B %Y %d', '%Y %B %d']:
+        selected = formats == date_format
+        text[selected] = dates[selected].dt.strftime(date_format).to_numpy(dtype=object)
+
+    return text
+
+
+def random_days(rng, rows, start, end):
+    """
+    Returns rows random datetime64 days between the start and end dates
+    """
+    start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+
+    return start + rng.integers(0, int((end - start).astype(int)), size=rows).astype('timedelta64[D]')
+
+
+def junk(rng, rows):
+    """
+    Returns rows random 10 character strings of capitals and digits, like the corrupt rows of the sources
+    """
+    alphabet = np.array(list(string.ascii_uppercase + string.digits))
+
+    return [''.join(row) for row in alphabet[rng.integers(0, len(alphabet), size=(rows, 10))]]
+
+
+def add_defects(rng, table, columns=None):
+    """
+    Overwrites a share of the rows with 'NULL' in every column and another share with random strings
+    """
+    columns = list(columns if columns is not None else table.columns)
+    rows = len(table)
+    kind = rng.random(rows)
+
+    null_rows = np.flatnonzero(kind < NULL_ROWS)
+    junk_rows = np.flatnonzero((kind >= NULL_ROWS) & (kind < NULL_ROWS + JUNK_ROWS))
+
+    table[columns] = table[columns].astype(object)
+    table.loc[table.index[null_rows], columns] = 'NULL'
+    for column in columns:
+        table.loc[table.index[junk_rows], column] = junk(rng, len(junk_rows))
+
+    return table
+
+
+def make_legacy_users(rows, seed=0):
+    """
+    Builds rows of the legacy_users table of the RDS database
+    """
+    rng = np.random.default_rng(seed)
+    country_code = rng.choice(['GB', 'US', 'DE'], size=rows, p=[0.6, 0.25, 0.15]).astype(object)
+    first_name = rng.choice(FIRST_NAMES, size=rows)
+    last_name = rng.choice(LAST_NAMES, size=rows)
+
+    table = pd.DataFrame({
+        'index': np.arange(rows),
+        'first_name': first_name,
+        'last_name': last_name,
+        'date_of_birth': format_dates(rng, random_days(rng, rows, '1940-01-01', '2006-01-01')),
+        'company': rng.choice(['Wright Ltd', 'Bauer GmbH', 'Johnson PLC', 'Hoffmann AG'], size=rows),
+        'email_address': [f'{first.lower()}.{last.lower()}{i}@example.com' for i, (first, last) in enumerate(zip(first_name, last_name))],
+        'address': [f'{number} Test Street' for number in rng.integers(1, 999, size=rows)],
+        'country': [COUNTRIES[code] for code in country_code],
+        'country_code': country_code,
+        'phone_number': [f'+44 {number}' for number in rng.integers(1000000000, 9999999999, size=rows)],
+        'join_date': format_dates(rng, random_days(rng, rows, '1992-01-01', '2022-06-01')),
+        'user_uuid': make_uuids(rng, rows)
+    })
+    # the legacy data has a handful of 'GGB' country codes for British users
+    table.loc[rng.random(rows) < 0.005, 'country_code'] = 'GGB'
+
+    return add_defects(rng, table, table.columns.drop('index'))
+
+
+def make_orders_table(rows, seed=0):
+    """
+    Builds rows of the orders_table of the RDS database
+    """
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({
+        'level_0': np.arange(rows),
+        'index': np.arange(rows),
+        'date_uuid': make_uuids(rng, rows),
+        'first_name': None,
+        'last_name': None,
+        'user_uuid': make_uuids(rng, rows),
+        'card_number': rng.integers(10 ** 11, 10 ** 16, size=rows).astype(str),
+        'store_code': [f'{prefix}-{code:08X}' for prefix, code in zip(rng.choice(['BL', 'HI', 'CH', 'LO', 'WE'], size=rows), rng.integers(0, 2 ** 32, size=rows))],
+        'product_code': [f'{letter}{digit}-{code}{suffix}' for letter, digit, code, suffix in zip(
+            rng.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), size=rows), rng.integers(0, 10, size=rows),
+            rng.integers(1000000, 9999999, size=rows), rng.choice(list('abcdefghijklmnopqrstuvwxyz'), size=rows))],
+        '1': None,
+        'product_quantity': rng.integers(1, 14, size=rows)
+    })
+
+
+def make_card_details(rows, seed=0):
+    """
+    Builds the rows tabula reads from the card details PDF: card numbers are numbers, or strings when tabula kept a
+    stray '?'
+    """
+    rng = np.random.default_rng(seed)
+    card_number = rng.integers(10 ** 11, 10 ** 16, size=rows).astype(object)
+    question_marks = rng.random(rows) < 0.01
+    card_number[question_marks] = [f'???{number}' for number in card_number[question_marks]]
+
+    expiry = random_days(rng, rows, '2022-01-01', '2031-12-01')
+    table = pd.DataFrame({
+        'card_number': card_number,
+        'expiry_date': pd.Series(pd.to_datetime(expiry)).dt.strftime('%m/%y').to_numpy(dtype=object),
+        'card_provider': rng.choice(CARD_PROVIDERS, size=rows),
+        'date_payment_confirmed': format_dates(rng, random_days(rng, rows, '1992-01-01', '2022-06-01'))
+    })
+
+    return add_defects(rng, table)
+
+
+def make_store_records(rows, seed=0):
+    """
+    Builds the JSON records of the store details API, as served by local_store_api.LocalStoreAPI
+    """
+    rng = np.random.default_rng(seed)
+    stores = [make_store(index, seed) for index in range(rows)]
+
+    # the live API has 'ee' prefixed continents and letters in some staff numbers
+    for store in stores:
+        draw = rng.random()
+        if draw < 0.01:
+            store['continent'] = f"ee{store['continent']}"
+        elif draw < 0.02:
+            store['staff_numbers'] = f"J{store['staff_numbers']}"
+
+    return stores
+
+
+def make_products(rows, seed=0):
+    """
+    Builds the rows of the products CSV on S3
+    """
+    rng = np.random.default_rng(seed)
+    weight_kind = rng.choice(['g', 'kg', 'ml', 'oz', 'multipack', 'stray'], size=rows, p=[0.45, 0.4, 0.08, 0.02, 0.04, 0.01])
+    grams = rng.integers(20, 5000, size=rows)
+    weights = np.where(weight_kind == 'kg', [f'{g / 1000}kg' for g in grams], [f'{g}g' for g in grams]).astype(object)
+    weights[weight_kind == 'ml'] = [f'{g}ml' for g in grams[weight_kind == 'ml']]
+    weights[weight_kind == 'oz'] = [f'{g // 28}oz' for g in grams[weight_kind == 'oz']]
+    weights[weight_kind == 'multipack'] = [f'{g % 12 + 2} x {g // 10}g' for g in grams[weight_kind == 'multipack']]
+    weights[weight_kind == 'stray'] = [f'{g}g .' for g in grams[weight_kind == 'stray']]
+
+    table = pd.DataFrame({
+        'product_name': [f'Product {i}' for i in range(rows)],
+        'product_price': [f'£{price:.2f}' for price in rng.integers(50, 100000, size=rows) / 100],
+        'weight': weights,
+        'category': rng.choice(CATEGORIES, size=rows),
+        'EAN': rng.integers(10 ** 11, 10 ** 13, size=rows).astype(str),
+        'date_added': format_dates(rng, random_days(rng, rows, '1992-01-01', '2022-06-01')),
+        'uuid': make_uuids(rng, rows),
+        'removed': rng.choice(['Still_avaliable', 'Removed'], size=rows, p=[0.95, 0.05]),
+        'product_code': [f'{letter}{digit}-{code}{suffix}' for letter, digit, code, suffix in zip(
+            rng.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), size=rows), rng.integers(0, 10, size=rows),
+            rng.integers(1000000, 9999999, size=rows), rng.choice(list('abcdefghijklmnopqrstuvwxyz'), size=rows))]
+    })
+
+    return add_defects(rng, table)
+
+
+def make_products_csv(rows, seed=0):
+    """
+    Returns the products CSV file, with its unnamed index column, as bytes
+    """
+    return make_products(rows, seed).to_csv().encode()
+
+
+def make_date_events(rows, seed=0):
+    """
+    Builds the rows of the date details JSON: a sale every few minutes from 1992 onwards
+    """
+    rng = np.random.default_rng(seed)
+    sale_times = np.datetime64('1992-01-01T00:00:00') + np.cumsum(rng.integers(60, 9000, size=rows)).astype('timedelta64[s]')
+    sale_times = pd.Series(pd.to_datetime(sale_times))
+    hours = sale_times.dt.hour
+
+    table = pd.DataFrame({
+        'timestamp': sale_times.dt.strftime('%H:%M:%S'),
+        'month': sale_times.dt.month.astype(str),
+        'year': sale_times.dt.year.astype(str),
+        'day': sale_times.dt.day.astype(str),
+        'time_period': np.select([hours < 6, hours < 12, hours < 18], ['Late_Hours', 'Morning', 'Midday'], 'Evening'),
+        'date_uuid': make_uuids(rng, rows)
+    })
+
+    return add_defects(rng, table)
+
+
+def make_date_events_json(rows, seed=0):
+    """
+    Returns the date details JSON file as bytes, with one object per column keyed by row number like the live file
+    """
+    return json.dumps(make_date_events(rows, seed).to_dict()).encode()
+
+
+def make_raw_frames(scale=1.0, seed=0):
+    """
+    Returns every source at a scale factor as the DataFrame its extractor returns, ready to be cleaned
+    """
+    return {
+        'legacy_users': make_legacy_users(rows_at_scale('legacy_users', scale), seed),
+        'orders_table': make_orders_table(rows_at_scale('orders_table', scale), seed),
+        'card_details': make_card_details(rows_at_scale('card_details', scale), seed),
+        'store_details': pd.DataFrame(make_store_records(rows_at_scale('store_details', scale), seed)),
+        'products': pd.read_csv(io.BytesIO(make_products_csv(rows_at_scale('products', scale), seed)), index_col=0),
+        'date_events': pd.read_json(io.BytesIO(make_date_events_json(rows_at_scale('date_events', scale), seed)))
+    }
@@ -0,0 +1,127 @@
+import datetime
+
+import pandas as pd
+import pytest
+import yaml
+from sqlalchemy import create_engine
+
+
+class SqliteConnector:
+    """Stands in for DatabaseConnector with a sqlite source and target database"""
+
+    def __init__(self, source_engine, target_engine):
+        self.source_engine = source_engine
+        self.target_engine = target_engine
+
+    def init_db_engine(self):
+        return self.source_engine
+
+    def upload_to_db(self, df, table_name, if_exists='replace'):
+        df.to_sql(table_name, self.target_engine, if_exists=if_exists, index=False)
+
+
+def make_uuid(i, kind=0):
+    """A valid UUID that sorts by i, kind tells the uuids of different tables apart"""
+    return f'{kind:08d}-0000-4000-8000-{i:012d}'
+
+
+def make_orders(start, stop):
+    """Builds rows shaped like the legacy orders_table with index values start..stop-1"""
+    return pd.DataFrame({
+        'level_0': range(start, stop),
+        'index': range(start, stop),
+        'date_uuid': [make_uuid(i, 1) for i in range(start, stop)],
+        'first_name': None,
+        'last_name': None,
+        'user_uuid': [make_uuid(i, 2) for i in range(start, stop)],
+        'card_number': [str(4000000000000000 + i) for i in range(start, stop)],
+        'store_code': 'WEB-1388012W',
+        'product_code': 'A8-4686892S',
+        '1': None,
+        'product_quantity': 1
+    })
+
+
+def make_users(start, stop):
+    """Builds rows shaped like the legacy_users table, every tenth row has an invalid country code"""
+    country_codes = ['GB', 'US', 'DE', 'GGB', 'GB', 'US', 'DE', 'GB', 'US', 'XQ1']
+    return pd.DataFrame({
+        'index': range(start, stop),
+        'first_name': [f'First{i}' for i in range(start, stop)],
+        'last_name': [f'Last{i}' for i in range(start, stop)],
+        'date_of_birth': [f'19{50 + i % 50}-0{1 + i % 9}-1{i % 10}' for i in range(start, stop)],
+        'company': 'Test Ltd',
+        'email_address': [f'user{i}@example.com' for i in range(start, stop)],
+        'address': '1 Test Street',
+        'country': [{'GB': 'United Kingdom', 'GGB': 'United Kingdom', 'US': 'United States', 'DE': 'Germany'}.get(country_codes[i % 10], 'XQ1') for i in range(start, stop)],
+        'country_code': [country_codes[i % 10] for i in range(start, stop)],
+        'phone_number': '+44 1234 567890',
+        'join_date': [f'20{10 + i % 12}-1{i % 3}-0{1 + i % 9}' for i in range(start, stop)],
+        'user_uuid': [make_uuid(i, 2) for i in range(start, stop)]
+    })
+
+
+def make_star_schema():
+    """A small star schema with a sale every few hours over two years, in four stores and three products"""
+    stores = pd.DataFrame({
+        'store_code': ['WEB-1', 'DE-1', 'DE-2', 'GB-1'],
+        'country_code': ['GB', 'DE', 'DE', 'GB'],
+        'locality': ['N/A', 'Berlin', 'Munich', 'London'],
+        'store_type': ['Web Portal', 'Local', 'Super Store', 'Local'],
+        'staff_numbers': [30, 12, 45, 8]
+    })
+    products = pd.DataFrame({'product_code': ['A1', 'B2', 'C3'], 'product_price': [9.99, 120.50, 0.35], 'category': ['toys-and-games', 'homeware', 'toys-and-games']})
+
+    sale_times = [datetime.datetime(2021, 1, 1, 8, 15) + datetime.timedelta(hours=7 * i + i % 5) for i in range(200)]
+    date_times = pd.DataFrame({
+        'timestamp': [sale_time.time() for sale_time in sale_times],
+        'month': [sale_time.month for sale_time in sale_times],
+        'year': [sale_time.year for sale_time in sale_times],
+        'day': [sale_time.day for sale_time in sale_times],
+        'time_period': 'Midday',
+        'date_uuid': [make_uuid(i, 1) for i in range(200)],
+        'full_timestamp': sale_times
+    })
+    orders = pd.DataFrame({
+        'date_uuid': date_times['date_uuid'],
+        'product_code': [['A1', 'B2', 'C3'][i % 3] for i in range(200)],
+        'store_code': [stores['store_code'][i * 7 % 4] for i in range(200)],
+        'product_quantity': [1 + i % 4 for i in range(200)]
+    })
+
+    return {'dim_store_details': stores, 'dim_products': products, 'dim_date_times': date_times, 'orders_table': orders}
+
+
+@pytest.fixture
+def sqlite_connector(tmp_path):
+    """A DatabaseConnector stand-in reading from and writing to sqlite files in tmp_path"""
+    source = create_engine(f'sqlite:///{tmp_path / "source.db"}')
+    target = create_engine(f'sqlite:///{tmp_path / "target.db"}')
+    return SqliteConnector(source, target)
+
+
+@pytest.fixture(scope='session')
+def postgres_server(tmp_path_factory):
+    """A throwaway local PostgreSQL server, skipped when pgserver is not installed"""
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(tmp_path_factory.mktemp('pgdata'), cleanup_mode='stop')
+    yield server
+    server.cleanup()
+
+
+@pytest.fixture
+def postgres_creds(postgres_server, tmp_path):
+    """Writes a credentials file for a freshly emptied database on the local PostgreSQL server and returns its path"""
+    postgres_server.psql('DROP SCHEMA IF EXISTS public CASCADE; CREATE SCHEMA public;')
+
+    creds_file = tmp_path / 'postgres_creds.yaml'
+    with open(creds_file, 'w') as f:
+        yaml.dump({
+            'RDS_USER': 'postgres',
+            'RDS_PASSWORD': '',
+            'RDS_HOST': str(postgres_server.pgdata),
+            'RDS_PORT': 5432,
+            'RDS_DATABASE': 'postgres'
+        }, f)
+
+    return str(creds_file)
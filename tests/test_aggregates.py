@@ -0,0 +1,90 @@
+import pytest
+from conftest import make_star_schema
+
+from sales_queries import SalesQueries, results_match
+from staging import ParquetStaging
+
+ROUTED = [
+    'Which months produced the largest amount of sales?',
+    'How many sales are coming from online?',
+    'What percentage of sales come through each type of store?',
+    'Which month in each year produced the highest cost of sales?',
+    'Which German store type is making the most sales?'
+]
+
+
+@pytest.fixture
+def staging(tmp_path):
+    staging = ParquetStaging(tmp_path / 'staging')
+    tables = make_star_schema()
+    for table_name in ['dim_store_details', 'dim_products', 'dim_date_times']:
+        staging.write(table_name, tables[table_name])
+    staging.write('orders_table', tables['orders_table'].iloc[:120])
+
+    return staging
+
+
+def assert_same_results(staging):
+    with_aggregates = SalesQueries(staging.staging_dir).run_all()
+    without_aggregates = SalesQueries(staging.staging_dir, use_aggregates=False).run_all()
+
+    for title, expected in without_aggregates.items():
+        assert results_match(expected, with_aggregates[title]), title
+
+
+def test_matching_queries_are_routed_to_the_aggregates(staging):
+    sales_queries = SalesQueries(staging.staging_dir)
+    assert all(sales_queries.aggregates.route(sql) is None for sql in sales_queries.queries.values())
+
+    assert sales_queries.refresh_aggregates() == 'rebuilt'
+
+    routed = {title for title, sql in sales_queries.queries.items() if sales_queries.aggregates.route(sql) is not None}
+    assert routed == set(ROUTED)
+    assert 'orders_table' not in sales_queries.aggregates.route(sales_queries.queries[ROUTED[2]])
+    assert_same_results(staging)
+
+
+def test_queries_the_aggregates_cannot_answer_are_not_routed(staging):
+    sales_queries = SalesQueries(staging.staging_dir)
+    sales_queries.refresh_aggregates()
+
+    unroutable = [
+        'SELECT product_code, SUM(product_quantity) FROM orders_table GROUP BY product_code',
+        'SELECT store_type, SUM(product_quantity) FROM orders_table INNER JOIN dim_store_details ON orders_table.store_code = dim_store_details.store_code '
+        'INNER JOIN dim_products ON orders_table.product_code = dim_products.product_code GROUP BY store_type',
+        'SELECT SUM(product_quantity) FROM orders_table INNER JOIN dim_date_times ON orders_table.date_uuid = dim_date_times.date_uuid WHERE day = 1',
+        'SELECT SUM(product_quantity * product_price) FROM orders_table INNER JOIN dim_products ON orders_table.product_code = dim_users.product_code'
+    ]
+    assert [sales_queries.aggregates.route(sql) for sql in unroutable] == [None] * len(unroutable)
+
+    by_category = sales_queries.run_sql(
+        'SELECT category, COUNT(date_uuid) AS sales FROM orders_table INNER JOIN dim_products ON orders_table.product_code = dim_products.product_code GROUP BY category ORDER BY category'
+    )
+    assert by_category.to_dict('list') == {'category': ['homeware', 'toys-and-games'], 'sales': [40, 80]}
+
+
+def test_new_orders_are_added_incrementally(staging):
+    sales_queries = SalesQueries(staging.staging_dir)
+    sales_queries.refresh_aggregates()
+
+    staging.write('orders_table', make_star_schema()['orders_table'].iloc[120:], if_exists='append')
+
+    # stale summaries are never read
+    assert not sales_queries.aggregates.is_fresh()
+    assert all(sales_queries.aggregates.route(sql) is None for sql in sales_queries.queries.values())
+
+    assert sales_queries.refresh_aggregates() == 'updated'
+    assert sales_queries.refresh_aggregates() == 'unchanged'
+    assert int(sales_queries.run_sql('SELECT SUM(number_of_sales) FROM sales_by_month').iloc[0, 0]) == 200
+    assert_same_results(staging)
+
+
+def test_changed_dimensions_rebuild_the_aggregates(staging):
+    sales_queries = SalesQueries(staging.staging_dir)
+    sales_queries.refresh_aggregates()
+
+    products = make_star_schema()['dim_products']
+    staging.write('dim_products', products.assign(product_price=[1.0, 2.0, 3.0]))
+
+    assert sales_queries.refresh_aggregates() == 'rebuilt'
+    assert_same_results(staging)
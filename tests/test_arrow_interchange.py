@@ -0,0 +1,98 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from duckdb_data_cleaning import DataCleaning
+from local_store_api import make_store
+from s3_ingest import read_csv_table
+
+PRODUCTS_CSV = os.path.join(os.path.dirname(__file__), '..', 'products.csv')
+
+
+class RecordingConnector:
+    """Stands in for the DuckDB DatabaseConnector, keeping whatever would have been uploaded"""
+
+    def __init__(self):
+        self.uploads = {}
+
+    def upload_to_db(self, df, table_name):
+        self.uploads[table_name] = df
+
+
+class ArrowExtractor:
+    """Returns prepared Arrow tables in place of the remote sources"""
+
+    def __init__(self, stores, products):
+        self.stores = stores
+        self.products = products
+
+    def retrieve_stores_data(self, endpoint, as_arrow=False):
+        assert as_arrow
+        return self.stores
+
+    def extact_from_s3(self, s3_address, as_arrow=False):
+        assert as_arrow
+        return self.products
+
+
+def assert_same_table(arrow_table, table_df):
+    # DuckDB's enums come back ordered in a DataFrame but as unordered Arrow dictionaries
+    pd.testing.assert_frame_equal(arrow_table.to_pandas(date_as_object=False), table_df.reset_index(drop=True), check_dtype=False, check_categorical=False)
+
+
+def test_arrow_frames_match_dataframe_frames():
+    cleaner = DataCleaning(db_connector=object())
+    stores = pd.DataFrame([make_store(i) for i in range(20)])
+    stores.loc[2, 'country_code'] = 'XQ1'
+    date_events = pd.DataFrame({
+        'timestamp': ['22:00:06', 'NULL', '10:05:59'],
+        'month': ['9', 'NULL', '12'],
+        'year': ['2012', 'NULL', '2005'],
+        'day': ['19', 'NULL', '1'],
+        'time_period': ['Evening', 'NULL', 'Midday'],
+        'date_uuid': ['a', 'NULL', 'b']
+    })
+
+    store_table = cleaner.clean_store_frame(pa.Table.from_pandas(stores), as_arrow=True)
+    assert isinstance(store_table, pa.Table)
+    assert_same_table(store_table.drop_columns(['index']), cleaner.clean_store_frame(stores.copy()))
+
+    date_table = cleaner.clean_date_events_frame(pa.Table.from_pandas(date_events), as_arrow=True)
+    assert_same_table(date_table, cleaner.clean_date_events_frame(date_events.copy()))
+
+
+def test_products_arrow_frame_keeps_the_csv_index():
+    cleaner = DataCleaning(db_connector=object())
+    with open(PRODUCTS_CSV, 'rb') as f:
+        products_arrow = read_csv_table(pa.BufferReader(pa.py_buffer(f.read())), as_arrow=True)
+    products_df = pd.read_csv(PRODUCTS_CSV, index_col=0)
+    # ISO dates only, as Arrow types a column of them as dates while pandas keeps strings
+    products_df = products_df[products_df['date_added'].str.match(r'\d{4}-\d{2}-\d{2}$', na=True)]
+    products_arrow = products_arrow.take(pa.array(products_df.index.to_numpy()))
+
+    arrow_table = cleaner.clean_products_frame(products_arrow, as_arrow=True)
+    table_df = cleaner.clean_products_frame(products_df)
+
+    assert arrow_table.column('product_index').to_pylist() == table_df.index.tolist()
+    assert arrow_table.column('weight').to_pylist() == table_df['weight'].tolist()
+
+
+def test_clean_data_uploads_arrow_and_converts_on_request():
+    connector = RecordingConnector()
+    cleaner = DataCleaning(db_connector=connector)
+    stores = pa.Table.from_pylist([make_store(i) for i in range(10)])
+    with open(PRODUCTS_CSV, 'rb') as f:
+        products = read_csv_table(pa.BufferReader(pa.py_buffer(f.read())), as_arrow=True).slice(0, 50)
+    cleaner.extractor = ArrowExtractor(stores, products)
+
+    store_df = cleaner.clean_store_data()
+    assert isinstance(connector.uploads['dim_store_details'], pa.Table)
+    assert 'index' not in connector.uploads['dim_store_details'].column_names
+    assert store_df.index.name == 'index'
+    assert store_df.index.tolist() == list(range(10))
+
+    products_table = cleaner.clean_products_data(as_arrow=True)
+    assert isinstance(products_table, pa.Table)
+    assert 'product_index' not in connector.uploads['dim_products'].column_names
+    assert products_table.num_rows == connector.uploads['dim_products'].num_rows
@@ -0,0 +1,90 @@
+import json
+
+import pandas as pd
+import pytest
+
+import synthetic_data
+from benchmark_suite import run_suite, summarise
+from data_cleaning import DataCleaning
+
+GENERATORS = [
+    synthetic_data.make_legacy_users,
+    synthetic_data.make_orders_table,
+    synthetic_data.make_card_details,
+    synthetic_data.make_products,
+    synthetic_data.make_date_events
+]
+
+
+@pytest.mark.parametrize('generate', GENERATORS)
+def test_generators_are_deterministic(generate):
+    table = generate(500, seed=1)
+
+    assert len(table) == 500
+    pd.testing.assert_frame_equal(table, generate(500, seed=1))
+    assert not table.equals(generate(500, seed=2))
+
+
+def test_sources_scale_with_the_scale_factor():
+    assert synthetic_data.rows_at_scale('orders_table', 1) == 120123
+    assert synthetic_data.rows_at_scale('orders_table', 0.1) == 12012
+    assert synthetic_data.rows_at_scale('store_details', 0.0001) == 1
+    assert synthetic_data.make_store_records(3) == synthetic_data.make_store_records(3)
+
+
+def test_synthetic_sources_have_the_defects_the_cleaners_remove():
+    cleaner = DataCleaning(db_connector=object())
+    users = synthetic_data.make_legacy_users(5000)
+    products = synthetic_data.make_products(5000)
+
+    assert (users['country_code'] == 'GGB').any()
+    assert (products['weight'].str.contains(' x ')).any()
+
+    cleaned_users = cleaner.clean_user_frame(users.copy())
+    cleaned_products = cleaner.clean_products_frame(products.copy())
+
+    assert 4950 < len(cleaned_users) < 5000
+    assert set(cleaned_users['country_code']) == {'GB', 'US', 'DE'}
+    assert cleaned_users['join_date'].notna().all()
+    assert cleaned_products['weight'].notna().all()
+
+
+def test_summarise():
+    summary = summarise([0.1, 0.2, 0.3, 0.4, 10.0])
+
+    assert summary['median_s'] == pytest.approx(0.3)
+    assert summary['p95_s'] == pytest.approx(8.08)
+    assert summary['min_s'] == pytest.approx(0.1)
+
+
+def test_suite_runs_every_stage_offline(postgres_creds, tmp_path):
+    output = tmp_path / 'results'
+
+    results = run_suite(scales=[0.002], repeats=2, warmup=1, creds_file=postgres_creds, output=str(output))
+
+    pandas_results = results[results['implementation'].str.startswith('pandas')]
+    assert set(pandas_results['stage']) == {'extract', 'clean', 'load'}
+    assert set(pandas_results['source']) == set(synthetic_data.SOURCE_ROWS)
+    assert set(pandas_results['status']) == {'ok', 'skipped: parsing the PDF needs Java'}
+    assert (pandas_results.dropna(subset=['median_s'])['p95_s'] >= pandas_results.dropna(subset=['median_s'])['median_s']).all()
+    cleaned = pandas_results[(pandas_results['stage'] == 'clean') & (pandas_results['status'] == 'ok')]
+    assert (cleaned['input_mb'] > 0).all() and (cleaned['output_mb'] > 0).all() and (cleaned['peak_rss_mb'] > 0).all()
+
+    with open(f'{output}.json') as f:
+        report = json.load(f)
+    assert report['settings']['repeats'] == 2
+    assert len(report['results']) == len(pd.read_csv(f'{output}.csv')) == len(results)
+
+
+def test_a_failing_cleaner_is_recorded_as_the_load_cases_error(postgres_creds, tmp_path, monkeypatch):
+    def clean_user_frame(self, table):
+        raise ValueError('broken cleaner')
+
+    monkeypatch.setattr(DataCleaning, 'clean_user_frame', clean_user_frame)
+
+    results = run_suite(scales=[0.002], repeats=1, warmup=0, stages=['load'], sources=['legacy_users'], creds_file=postgres_creds, output=str(tmp_path / 'results'))
+
+    assert dict(zip(results['implementation'], results['status'])) == {
+        'pandas': 'error: ValueError: broken cleaner',
+        'pandas (COPY)': 'error: ValueError: broken cleaner'
+    }
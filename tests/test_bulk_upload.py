@@ -0,0 +1,44 @@
+import pandas as pd
+from sqlalchemy import text
+from conftest import make_orders
+from database_utils import DatabaseConnector
+
+
+def test_csv_batches_split_rows():
+    """Each batch holds at most batch_size rows as headerless CSV"""
+    batches = list(DatabaseConnector().csv_batches(make_orders(0, 25), batch_size=10))
+
+    assert [len(batch.getvalue().splitlines()) for batch in batches] == [10, 10, 5]
+
+
+def test_bulk_upload_matches_to_sql(postgres_creds):
+    """COPY loads the same rows as to_sql, and replacing swaps the staging table in under the final name"""
+    connector = DatabaseConnector(target_creds_file=postgres_creds)
+    orders = make_orders(0, 250)
+
+    connector.upload_to_db(orders, 'orders_to_sql')
+    connector.upload_to_db(make_orders(900, 950), 'orders_copy', bulk=True, batch_size=40)
+    connector.upload_to_db(orders, 'orders_copy', bulk=True, batch_size=40)
+
+    engine = connector.get_engine(postgres_creds)
+    with engine.connect() as connection:
+        expected = pd.read_sql_query(text('SELECT * FROM orders_to_sql'), connection)
+        loaded = pd.read_sql_query(text('SELECT * FROM orders_copy'), connection)
+        tables = pd.read_sql_query(text("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"), connection)
+
+    pd.testing.assert_frame_equal(loaded, expected)
+    assert sorted(tables['table_name']) == ['orders_copy', 'orders_to_sql']
+
+
+def test_bulk_upload_appends(postgres_creds):
+    """Appending copies the new rows straight into the existing table"""
+    connector = DatabaseConnector(target_creds_file=postgres_creds)
+
+    connector.upload_to_db(make_orders(0, 30), 'orders_table', bulk=True)
+    connector.upload_to_db(make_orders(30, 45), 'orders_table', if_exists='append', bulk=True)
+
+    engine = connector.get_engine(postgres_creds)
+    with engine.connect() as connection:
+        count = connection.execute(text('SELECT COUNT(*) FROM orders_table')).scalar()
+
+    assert count == 45
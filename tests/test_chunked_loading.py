@@ -0,0 +1,59 @@
+import pandas as pd
+from conftest import make_orders, make_users
+from data_cleaning import DataCleaning
+from data_extraction import DataExtractor
+
+
+def test_read_dbs_table_chunks_yields_bounded_chunks(sqlite_connector):
+    """The table comes back in chunks of at most chunksize rows"""
+    make_orders(0, 25).to_sql('orders_table', sqlite_connector.source_engine, index=False)
+
+    chunks = list(DataExtractor().read_dbs_table_chunks(sqlite_connector, 'orders_table', chunksize=10))
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert pd.concat(chunks)['index'].tolist() == list(range(25))
+
+
+def test_chunked_cleaning_matches_full_cleaning(sqlite_connector):
+    """Streaming users and orders through the cleaners chunk by chunk loads the same rows as a full load"""
+    make_users(0, 95).to_sql('legacy_users', sqlite_connector.source_engine, index=False)
+    make_orders(0, 95).to_sql('orders_table', sqlite_connector.source_engine, index=False)
+    cleaner = DataCleaning(sqlite_connector)
+    target = sqlite_connector.target_engine
+
+    cleaner.clean_user_data()
+    cleaner.clean_orders_data()
+    full_users = pd.read_sql_table('dim_users', target)
+    full_orders = pd.read_sql_table('orders_table', target)
+
+    assert cleaner.clean_user_data(chunksize=20) == len(full_users)
+    assert cleaner.clean_orders_data(chunksize=20) == 95
+
+    pd.testing.assert_frame_equal(pd.read_sql_table('dim_users', target), full_users)
+    pd.testing.assert_frame_equal(pd.read_sql_table('orders_table', target), full_orders)
+
+
+def test_chunked_loading_keeps_the_rejects_of_an_invalid_first_chunk(sqlite_connector):
+    """A first chunk without a valid row still replaces the targets, so its rejects aren't overwritten by the next chunk"""
+    users = make_users(0, 30)
+    users.loc[:21, 'country_code'] = 'XQ1'
+    users.to_sql('legacy_users', sqlite_connector.source_engine, index=False)
+    target = sqlite_connector.target_engine
+
+    assert DataCleaning(sqlite_connector).clean_user_data(chunksize=10) == 7
+
+    rejected = pd.read_sql_table('dim_users_rejected', target)
+    assert rejected['index'].tolist() == list(range(22)) + [29]
+    assert len(pd.read_sql_table('dim_users', target)) == 7
+
+
+def test_chunked_loading_of_an_empty_source_replaces_the_target(sqlite_connector):
+    make_users(0, 20).to_sql('legacy_users', sqlite_connector.source_engine, index=False)
+    cleaner = DataCleaning(sqlite_connector)
+    cleaner.clean_user_data(chunksize=10)
+
+    make_users(0, 0).to_sql('legacy_users', sqlite_connector.source_engine, index=False, if_exists='replace')
+
+    assert cleaner.clean_user_data(chunksize=10) == 0
+    assert pd.read_sql_table('dim_users', sqlite_connector.target_engine).empty
+    assert pd.read_sql_table('dim_users_rejected', sqlite_connector.target_engine).empty
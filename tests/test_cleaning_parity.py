@@ -0,0 +1,85 @@
+import os
+import pandas as pd
+from data_cleaning import DataCleaning as PandasDataCleaning
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+from local_store_api import make_store
+
+PRODUCTS_CSV = os.path.join(os.path.dirname(__file__), '..', 'products.csv')
+
+
+def normalise(table, date_columns=()):
+    """Puts both implementations' output in a comparable form: categories as strings, dates as datetime64 and missing values as None"""
+    table = table.copy()
+    for column in table.columns:
+        if isinstance(table[column].dtype, pd.CategoricalDtype):
+            table[column] = table[column].astype(object)
+    for column in date_columns:
+        table[column] = pd.to_datetime(table[column])
+    return table.astype(object).where(table.notna(), None)
+
+
+def assert_same_output(pandas_table, duckdb_table, date_columns=(), ignore_index=False):
+    """Compares the cleaned tables. ignore_index is for tables whose index is not uploaded"""
+    pandas_table = normalise(pandas_table, date_columns)
+    duckdb_table = normalise(duckdb_table, date_columns)
+    if ignore_index:
+        pandas_table = pandas_table.reset_index(drop=True)
+        duckdb_table = duckdb_table.reset_index(drop=True)
+    pd.testing.assert_frame_equal(pandas_table, duckdb_table, check_dtype=False, check_index_type=False)
+
+
+def cleaners():
+    return PandasDataCleaning(db_connector=object()), DuckDBDataCleaning(db_connector=object())
+
+
+def test_card_details_parity():
+    card_details = pd.DataFrame({
+        'card_number': ['30060773296197', '349624180933183', 'NULL', '4971858637664481', 'XGZBYBYGUW'],
+        'expiry_date': ['09/26', '10/23', 'NULL', '12/25', 'XGZBYBYGUW'],
+        'card_provider': ['Diners Club / Carte Blanche', 'American Express', 'NULL', 'VISA 16 digit', 'XGZBYBYGUW'],
+        'date_payment_confirmed': ['2015-11-25', '2001-06-18', 'NULL', 'not a date', 'XGZBYBYGUW']
+    }, index=[0, 1, 2, 0, 1])
+    pandas_cleaner, duckdb_cleaner = cleaners()
+
+    assert_same_output(pandas_cleaner.clean_card_frame(card_details.copy()), duckdb_cleaner.clean_card_frame(card_details.copy()),
+                       date_columns=['date_payment_confirmed'], ignore_index=True)
+
+
+def test_store_data_parity():
+    stores = pd.DataFrame([make_store(i) for i in range(30)])
+    stores.loc[3, 'continent'] = 'eeEurope'
+    stores.loc[4, 'staff_numbers'] = 'J78'
+    stores.loc[5, 'country_code'] = 'QMAVR5H3LD'
+    stores.loc[6, ['country_code', 'continent', 'store_type']] = None
+    stores.loc[7, 'opening_date'] = 'not a date'
+    pandas_cleaner, duckdb_cleaner = cleaners()
+
+    pandas_table = pandas_cleaner.clean_store_frame(stores.copy())
+    duckdb_table = duckdb_cleaner.clean_store_frame(stores.copy())
+
+    assert len(pandas_table) == 28
+    assert_same_output(pandas_table, duckdb_table, date_columns=['opening_date'])
+
+
+def test_products_parity():
+    products = pd.read_csv(PRODUCTS_CSV, index_col=0)
+    pandas_cleaner, duckdb_cleaner = cleaners()
+
+    assert_same_output(pandas_cleaner.clean_products_frame(products.copy()), duckdb_cleaner.clean_products_frame(products.copy()),
+                       date_columns=['date_added'])
+
+
+def test_date_events_parity():
+    date_events = pd.DataFrame({
+        'timestamp': ['22:00:06', '22:44:06', 'NULL', '10:05:59', 'DXBU6GX1VC', '09:00:00', '09:00:00'],
+        'month': ['9', '2', 'NULL', '12', 'DXBU6GX1VC', '2', '13'],
+        'year': ['2012', '1997', 'NULL', '2005', 'DXBU6GX1VC', '2001', '2001'],
+        'day': ['19', '10', 'NULL', '1', 'DXBU6GX1VC', '30', '1'],
+        'time_period': ['Evening', 'Evening', 'NULL', 'Midday', 'DXBU6GX1VC', 'Morning', 'Morning'],
+        'date_uuid': ['3b7ca996-37f9-433f-b6d0-ce8391b615ad', 'adc5a51d-f8a8-4d3d-9a09-f3c7c4dfa0c8', 'NULL', '9e0a6bba-1ad1-4c72-b59e-c2bae0e3f5b4', 'DXBU6GX1VC',
+                      '5b6a8e43-3f0d-4d8b-9a55-0c7e5a1f2b11', '6c7b9f54-4a1e-4e9c-8b66-1d8f6b2a3c22']
+    })
+    pandas_cleaner, duckdb_cleaner = cleaners()
+
+    assert_same_output(pandas_cleaner.clean_date_events_frame(date_events.copy()), duckdb_cleaner.clean_date_events_frame(date_events.copy()),
+                       ignore_index=True)
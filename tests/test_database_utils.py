@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from database_utils import DatabaseConnector
+from duckdb_database_utils import DatabaseConnector as DuckDBDatabaseConnector
+
+
+def write_creds(path):
+    with open(path, 'w') as f:
+        yaml.dump({'RDS_USER': 'user', 'RDS_PASSWORD': 'p@ss:word', 'RDS_HOST': 'localhost', 'RDS_PORT': 5432, 'RDS_DATABASE': 'sales_data'}, f)
+    return str(path)
+
+
+def test_credentials_are_read_once(tmp_path):
+    """Both connectors cache a credentials file after the first read and hand out copies"""
+    creds_file = write_creds(tmp_path / 'creds.yaml')
+
+    for connector in (DatabaseConnector(), DuckDBDatabaseConnector()):
+        creds = connector.read_db_creds(creds_file)
+        creds['RDS_USER'] = 'changed'
+        (tmp_path / 'creds.yaml').unlink()
+
+        assert connector.read_db_creds(creds_file)['RDS_USER'] == 'user'
+        creds_file = write_creds(tmp_path / 'creds.yaml')
+
+
+def test_engines_are_pooled_per_credentials_file(tmp_path):
+    """init_db_engine returns the same pooled engine until the connector is closed"""
+    source = write_creds(tmp_path / 'source.yaml')
+    target = write_creds(tmp_path / 'target.yaml')
+
+    with DatabaseConnector(source, target, pool_size=3, max_overflow=1) as connector:
+        engine = connector.init_db_engine()
+        assert connector.init_db_engine() is engine
+        assert connector.get_engine(target) is not engine
+        assert engine.pool.size() == 3
+        assert engine.url.password == 'p@ss:word'
+
+    assert connector.init_db_engine() is not engine
+
+
+def test_threads_share_one_engine(tmp_path, monkeypatch):
+    """Threads asking for an engine at the same time all get the one engine the connector creates"""
+    source = write_creds(tmp_path / 'source.yaml')
+    connector = DatabaseConnector(source)
+    created = []
+    create_engine_from_creds = connector.create_engine_from_creds
+
+    def slow_create_engine_from_creds(creds_file):
+        # gives the other threads time to find the cache empty as well
+        time.sleep(0.05)
+        created.append(creds_file)
+        return create_engine_from_creds(creds_file)
+
+    monkeypatch.setattr(connector, 'create_engine_from_creds', slow_create_engine_from_creds)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        engines = list(executor.map(lambda _: connector.init_db_engine(), range(8)))
+
+    assert created == [source]
+    assert all(engine is engines[0] for engine in engines)
+    connector.close()
+
+def test_upload_reuses_target_engine(postgres_creds):
+    """Repeated uploads go through one pooled engine"""
+    import pandas as pd
+
+    connector = DatabaseConnector(target_creds_file=postgres_creds)
+    connector.upload_to_db(pd.DataFrame({'a': [1, 2]}), 'first_table')
+    engine = connector.get_engine(postgres_creds)
+    connector.upload_to_db(pd.DataFrame({'a': [3]}), 'second_table', bulk=True)
+
+    assert connector.get_engine(postgres_creds) is engine
+    assert len(connector._engines) == 1
+    connector.close()
@@ -0,0 +1,69 @@
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from conftest import make_uuid
+from sqlalchemy import text
+
+from data_cleaning import DataCleaning
+from database_utils import DatabaseConnector
+from date_parsing import DateParser, build_date_dimension, parse_dates
+
+MIXED = ['2005-12-02', '2005/12/2', 'December 2005 02', '2005 December 02', None, 'NULL', 'not a date', '2005-12-02']
+
+
+def test_every_known_format_is_parsed():
+    dates = parse_dates(pd.Series(MIXED, index=range(10, 18), name='date_added'))
+
+    december_2nd = datetime.date(2005, 12, 2)
+    assert dates.dtype == pd.ArrowDtype(pa.date32())
+    assert dates.index.tolist() == list(range(10, 18))
+    assert dates.name == 'date_added'
+    assert dates.tolist()[:4] == [december_2nd] * 4
+    assert dates.isna().tolist() == [False] * 4 + [True] * 3 + [False]
+    assert pa.array(dates).type == pa.date32()
+
+
+def test_format_mix_is_cached_per_source():
+    parser = DateParser()
+
+    parser.parse(pd.Series(['2005-12-02', '2006-01-15', 'October 2012 01']), 'products.date_added')
+    assert parser.format_mix == {'products.date_added': {'%Y-%m-%d': 2, '%B %Y %d': 1}}
+
+    # a later batch starts from the cached formats and still detects new ones
+    dates = parser.parse(pd.Series(['2007-03-04', '2008/05/06']), 'products.date_added')
+    assert dates.tolist() == [datetime.date(2007, 3, 4), datetime.date(2008, 5, 6)]
+    assert parser.format_mix['products.date_added'] == {'%Y-%m-%d': 3, '%B %Y %d': 1, '%Y/%m/%d': 1}
+
+
+def test_date_dimension_is_built_with_integer_operations():
+    date_events = pd.DataFrame({
+        'timestamp': ['22:00:06', '09:15:00', '25:00:00', 'NULL'],
+        'month': ['9', '2', '13', 'NULL'],
+        'year': ['2012', '2001', '2001', 'NULL'],
+        'day': ['19', '30', '1', 'NULL']
+    }, index=[5, 6, 7, 8])
+
+    table = build_date_dimension(date_events)
+
+    assert table['timestamp'].dtype == pd.ArrowDtype(pa.time32('s'))
+    assert table['timestamp'].tolist()[:2] == [datetime.time(22, 0, 6), datetime.time(9, 15)]
+    assert table['month'].tolist() == [9, 2, pd.NA, pd.NA]
+    # 30 February has no timestamp, although its components are kept
+    assert table['full_timestamp'].tolist()[:2] == [pd.Timestamp('2012-09-19 22:00:06'), pd.NaT]
+    assert table['full_timestamp'].isna().tolist() == [False, True, True, True]
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_date_dimension_loads_with_its_types(postgres_creds, bulk):
+    date_events = pd.DataFrame({'timestamp': ['22:00:06'], 'month': ['9'], 'year': ['2012'], 'day': ['19'], 'time_period': ['Evening'],
+                                'date_uuid': [make_uuid(0)]})
+    table = DataCleaning(db_connector=object()).clean_date_events_frame(date_events)
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        connector.upload_to_db(table, 'dim_date_times', bulk=bulk)
+        with connector.get_engine(postgres_creds).connect() as connection:
+            row = connection.execute(text('SELECT "timestamp", full_timestamp, year FROM dim_date_times')).one()
+
+    assert row == (datetime.time(22, 0, 6), datetime.datetime(2012, 9, 19, 22, 0, 6), 2012)
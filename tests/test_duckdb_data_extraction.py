@@ -90,6 +90,21 @@ def test_extract_from_s3():
     except Exception as e:
         print(f"✗ Error extracting from S3: {e}")
 
+def test_read_dbs_table_chunks_survives_queries_on_the_shared_connection():
+    """Other queries on the connector's connection, such as uploads between chunks, don't cut the stream short"""
+    connection = duckdb.connect()
+    connection.execute("ATTACH ':memory:' AS postgres_db")
+    connection.execute('CREATE TABLE postgres_db.orders_table AS SELECT range AS "index" FROM range(25)')
+    connector = type('Connector', (), {'init_db_engine': lambda self: connection})()
+
+    chunks = []
+    for chunk in DataExtractor(db_connector=object()).read_dbs_table_chunks(connector, 'orders_table', chunksize=10):
+        connection.execute('SELECT 1').fetchall()
+        chunks.append(chunk)
+
+    assert pd.concat(chunks)['index'].tolist() == list(range(25))
+    assert all(len(chunk) <= 10 for chunk in chunks)
+
 def run_all_tests():
     """Run all test functions"""
     print("=== STARTING TESTS FOR DUCKDB DATA EXTRACTION ===")
@@ -99,8 +114,9 @@ def run_all_tests():
     test_list_number_of_stores()
     test_retrieve_stores_data()
     test_extract_from_s3()
+    test_read_dbs_table_chunks_survives_queries_on_the_shared_connection()
     
     print("\n=== ALL TESTS COMPLETED ===")
 
 if __name__ == "__main__":
-    run_all_tests()
\ No newline at end of file
+    run_all_tests()
@@ -0,0 +1,57 @@
+import pandas as pd
+from conftest import make_orders, make_uuid
+from data_cleaning import DataCleaning
+from data_extraction import DataExtractor
+from watermarks import WatermarkStore
+
+
+def test_watermark_store_round_trip(tmp_path):
+    """Marks persist per table and are ignored when the key column changes"""
+    watermarks = WatermarkStore(tmp_path / 'watermarks.json')
+    assert watermarks.get('orders_table') is None
+
+    watermarks.set('orders_table', pd.Series([41]).iloc[0])
+    assert WatermarkStore(tmp_path / 'watermarks.json').get('orders_table') == 41
+    assert watermarks.get('orders_table', key='level_0') is None
+
+    watermarks.reset('orders_table')
+    assert watermarks.get('orders_table') is None
+
+
+def test_read_dbs_table_incremental_only_reads_new_rows(sqlite_connector):
+    """Only rows above the high-water mark are returned"""
+    connector = sqlite_connector
+    make_orders(0, 10).to_sql('orders_table', connector.source_engine, index=False)
+
+    table, watermark = DataExtractor().read_dbs_table_incremental(connector, 'orders_table', watermark=6)
+    assert table['index'].tolist() == [7, 8, 9]
+    assert watermark == 9
+
+    table, watermark = DataExtractor().read_dbs_table_incremental(connector, 'orders_table', watermark=9)
+    assert table.empty
+    assert watermark == 9
+
+
+def test_clean_orders_data_appends_new_orders(tmp_path, sqlite_connector):
+    """The first incremental run loads everything, later runs append only the new orders"""
+    source = sqlite_connector.source_engine
+    target = sqlite_connector.target_engine
+    watermark_file = tmp_path / 'watermarks.json'
+    cleaner = DataCleaning(sqlite_connector)
+
+    make_orders(0, 100).to_sql('orders_table', source, index=False)
+    first = cleaner.clean_orders_data(incremental=True, watermark_file=watermark_file)
+    assert len(first) == 100
+
+    make_orders(100, 130).to_sql('orders_table', source, index=False, if_exists='append')
+    second = cleaner.clean_orders_data(incremental=True, watermark_file=watermark_file)
+    assert len(second) == 30
+    assert 'first_name' not in second.columns
+
+    third = cleaner.clean_orders_data(incremental=True, watermark_file=watermark_file)
+    assert third.empty
+
+    loaded = pd.read_sql_table('orders_table', target)
+    assert len(loaded) == 130
+    assert loaded['date_uuid'].tolist() == [make_uuid(i, 1) for i in range(130)]
+    assert WatermarkStore(watermark_file).get('orders_table') == 129
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+from conftest import make_users
+from data_cleaning import DataCleaning
+from database_utils import DatabaseConnector
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+from instrumentation import INSTRUMENTATION
+import synthetic_data
+
+
+@pytest.fixture
+def instrumentation():
+    INSTRUMENTATION.reset()
+    INSTRUMENTATION.enable()
+    yield INSTRUMENTATION
+    INSTRUMENTATION.disable()
+    INSTRUMENTATION.reset()
+
+
+def test_nothing_is_recorded_while_disabled():
+    INSTRUMENTATION.reset()
+    DataCleaning(db_connector=object()).clean_user_frame(make_users(0, 20))
+
+    assert INSTRUMENTATION.records() == []
+
+
+def test_nested_spans_record_rows_and_drops(sqlite_connector, instrumentation):
+    make_users(0, 100).to_sql('legacy_users', sqlite_connector.source_engine, index=False)
+
+    DataCleaning(sqlite_connector).clean_user_data()
+
+    records = {record['operation']: record for record in instrumentation.records()}
+    assert records['read_dbs_table']['stage'] == 'extract'
+    assert records['read_dbs_table']['table'] == 'legacy_users'
+    assert records['read_dbs_table']['parent'] == 'clean_user_data'
+    assert records['read_dbs_table']['rows_out'] == 100
+    assert records['read_dbs_table']['bytes'] > 0
+
+    # every tenth user has an invalid country code, the frame's drops are added to the span of the whole stage
+    assert records['clean_user_frame']['rows_in'] == 100
+    assert records['clean_user_frame']['rows_out'] == 90
+    assert records['clean_user_frame']['rows_dropped'] == 10
+    assert records['clean_user_data']['rows_dropped'] == 10
+    assert records['clean_user_data']['wall_seconds'] >= records['clean_user_frame']['wall_seconds'] > 0
+
+
+
+def test_chunked_reads_record_one_span_over_every_chunk(sqlite_connector, instrumentation):
+    make_users(0, 25).to_sql('legacy_users', sqlite_connector.source_engine, index=False)
+
+    DataCleaning(sqlite_connector).clean_user_data(chunksize=10)
+
+    records = instrumentation.records()
+    [read] = [record for record in records if record['operation'] == 'read_dbs_table_chunks']
+    assert read['table'] == 'legacy_users'
+    assert read['parent'] == 'clean_user_data'
+    assert read['rows_out'] == 25
+    assert read['bytes'] > 0
+    assert read['error'] is None
+
+    # the cleaning of each chunk runs between two reads but isn't counted as part of them
+    frames = [record for record in records if record['operation'] == 'clean_user_frame']
+    assert [frame['rows_in'] for frame in frames] == [10, 10, 5]
+    assert {frame['parent'] for frame in frames} == {'clean_user_data'}
+
+def test_sql_cleaners_count_the_rows_they_filter(instrumentation):
+    products = synthetic_data.make_products(2000)
+
+    cleaned = DuckDBDataCleaning(db_connector=object()).clean_products_frame(products)
+
+    [record] = instrumentation.records()
+    assert record['implementation'] == 'duckdb'
+    assert record['rows_dropped'] == 2000 - len(cleaned) > 0
+
+
+def test_load_spans_and_exports(postgres_creds, instrumentation, tmp_path):
+    table = DataCleaning(db_connector=object()).clean_user_frame(make_users(0, 50))
+    instrumentation.reset()
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        connector.upload_to_db(table, 'dim_users', bulk=True)
+
+    [record] = instrumentation.records()
+    assert (record['stage'], record['table'], record['rows_in']) == ('load', 'dim_users', 45)
+
+    instrumentation.write(str(tmp_path / 'metrics.jsonl'))
+    with open(tmp_path / 'metrics.jsonl') as f:
+        assert json.loads(f.readline())['operation'] == 'upload_to_db'
+
+    prometheus = instrumentation.to_prometheus()
+    labels = 'stage="load",operation="upload_to_db",implementation="pandas",table="dim_users"'
+    assert '# TYPE retail_etl_rows_in_total counter' in prometheus
+    assert f'retail_etl_rows_in_total{{{labels}}} 45' in prometheus
+    assert f'retail_etl_calls_total{{{labels}}} 1' in prometheus
+
+
+def test_every_clean_method_is_instrumented():
+    methods = [name for name in dir(DataCleaning) if name.startswith('clean_')]
+
+    assert [name for name in methods if not hasattr(getattr(DataCleaning, name), '__wrapped__')] == []
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from memory_profiling import MB, frame_memory_mb, measure_memory
+
+
+def test_measure_memory_reports_the_allocation():
+    result, memory = measure_memory(lambda rows: np.ones(rows), 4 * MB // 8)
+
+    assert len(result) == 4 * MB // 8
+    assert memory['python_peak_mb'] == pytest.approx(4, abs=0.5)
+    assert memory['peak_rss_mb'] > 4
+    assert memory['input_mb'] is None and memory['output_mb'] is None
+
+
+def test_frame_memory_counts_strings():
+    table = pd.DataFrame({'code': ['x' * 100] * 1000})
+
+    assert frame_memory_mb(table) > 100 * 1000 / MB
+    assert frame_memory_mb(pa.Table.from_pandas(table)) == pytest.approx(pa.Table.from_pandas(table).nbytes / MB)
+
+    _, memory = measure_memory(lambda frame: frame.head(10), table)
+    assert memory['input_mb'] == frame_memory_mb(table)
+    assert memory['output_mb'] < memory['input_mb']
@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+import yaml
+from conftest import make_orders
+from sqlalchemy import text
+
+from data_cleaning import DataCleaning, key_ranges
+from database_utils import DatabaseConnector
+
+
+@pytest.fixture
+def source_creds(postgres_server, postgres_creds, tmp_path):
+    """Credentials for a second database on the local server, holding the legacy orders_table"""
+    postgres_server.psql('DROP DATABASE IF EXISTS orders_source;')
+    postgres_server.psql('CREATE DATABASE orders_source;')
+
+    with open(postgres_creds) as f:
+        creds = yaml.safe_load(f)
+    creds['RDS_DATABASE'] = 'orders_source'
+
+    creds_file = tmp_path / 'source_creds.yaml'
+    with open(creds_file, 'w') as f:
+        yaml.dump(creds, f)
+
+    return str(creds_file)
+
+
+def test_key_ranges_cover_every_key_once():
+    ranges = key_ranges(3, 1002, 4)
+
+    assert ranges[0][0] == 3 and ranges[-1][1] == 1003
+    assert all(stop == start for (_, stop), (start, _) in zip(ranges, ranges[1:]))
+    assert key_ranges(5, 6, 8) == [(5, 6), (6, 7)]
+    assert key_ranges(None, None, 4) == []
+
+
+def test_partitioned_load_matches_a_single_process_load(source_creds, postgres_creds):
+    with DatabaseConnector(source_creds, postgres_creds) as connector:
+        make_orders(0, 1000).sample(frac=1, random_state=0).to_sql('orders_table', connector.init_db_engine(), index=False)
+
+        assert DataCleaning(connector).clean_orders_data(workers=3, partitions=5) == 1000
+
+        target = connector.get_engine(postgres_creds)
+        loaded = pd.read_sql_query(text('SELECT * FROM orders_table'), target)
+        with target.connect() as connection:
+            tables = connection.execute(text("SELECT tablename FROM pg_tables WHERE schemaname = 'public'")).scalars().all()
+
+    # the workers copy their rows in parallel, so the rows are compared in date_uuid order with those of a single-process clean
+    expected = DataCleaning(db_connector=object()).clean_orders_frame(make_orders(0, 1000))
+    pd.testing.assert_frame_equal(loaded.astype(str).sort_values('date_uuid', ignore_index=True), expected.astype(str).sort_values('date_uuid', ignore_index=True))
+    assert tables == ['orders_table']
+
+
+def test_partitioned_load_of_an_empty_source_replaces_the_target(source_creds, postgres_creds):
+    with DatabaseConnector(source_creds, postgres_creds) as connector:
+        make_orders(0, 100).to_sql('orders_table', connector.init_db_engine(), index=False)
+        assert DataCleaning(connector).clean_orders_data(workers=2) == 100
+
+        with connector.init_db_engine().begin() as connection:
+            connection.execute(text('DELETE FROM orders_table'))
+        assert DataCleaning(connector).clean_orders_data(workers=2) == 0
+
+        with connector.get_engine(postgres_creds).connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM orders_table')).scalar() == 0
+
+
+def test_count_mismatch_keeps_the_loaded_table(source_creds, postgres_creds):
+    with DatabaseConnector(source_creds, postgres_creds) as connector:
+        orders = make_orders(0, 100)
+        orders.to_sql('orders_table', connector.init_db_engine(), index=False)
+        DataCleaning(connector).clean_orders_data(workers=2)
+
+        # a row without an index falls outside every partition
+        orders.head(1).assign(index=None).to_sql('orders_table', connector.init_db_engine(), index=False, if_exists='append')
+        with pytest.raises(ValueError, match='read 100 rows, the table had 101'):
+            DataCleaning(connector).clean_orders_data(workers=2)
+
+        with connector.get_engine(postgres_creds).connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM orders_table')).scalar() == 100
+            assert connection.execute(text("SELECT count(*) FROM pg_tables WHERE tablename LIKE 'orders_table__%'")).scalar() == 0
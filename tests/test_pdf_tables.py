@@ -0,0 +1,70 @@
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+import pdf_tables
+from pdf_tables import count_pdf_pages, page_ranges, read_pdf_tables
+
+# just enough of a PDF for the page counter: a page tree with five pages
+FAKE_PDF = b'%PDF-1.4\n1 0 obj << /Type /Pages /Count 5 >>\n' + b''.join(
+    f'{i} 0 obj << /Type /Page /Parent 1 0 R >>\n'.encode() for i in range(2, 7)
+)
+
+
+def fake_read_pdf(calls):
+    """Stands in for tabula.read_pdf, returning one table per requested page labelled with its page number"""
+    def read_pdf(path, pages):
+        calls.append(pages)
+        if pages == 'all':
+            pages = '1-5'
+        start, end = map(int, pages.split('-'))
+        return [pd.DataFrame({'card_number': [page if page % 2 else f'{page}?'], 'page': [page]}) for page in range(start, end + 1)]
+
+    return read_pdf
+
+
+def test_page_ranges_cover_every_page_once():
+    assert page_ranges(10, 3) == ['1-4', '5-7', '8-10']
+    assert page_ranges(2, 4) == ['1-1', '2-2']
+    assert page_ranges(5, 1) == ['1-5']
+
+
+def test_count_pdf_pages():
+    assert count_pdf_pages(FAKE_PDF) == 5
+    assert count_pdf_pages(b'not a pdf') is None
+
+
+def test_parsed_tables_are_cached_by_pdf_hash(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pdf_tables.tabula, 'read_pdf', fake_read_pdf(calls))
+
+    first = read_pdf_tables(FAKE_PDF, max_workers=1, cache_dir=tmp_path)
+    second = read_pdf_tables(FAKE_PDF, max_workers=1, cache_dir=tmp_path)
+
+    assert calls == ['all']
+    assert first['page'].tolist() == [1, 2, 3, 4, 5]
+    # card numbers that were numbers on some pages and text on others come back as strings
+    assert first['card_number'].tolist() == ['1', '2?', '3', '4?', '5']
+    pd.testing.assert_frame_equal(first, second)
+
+    read_pdf_tables(FAKE_PDF + b'%changed', max_workers=1, cache_dir=tmp_path)
+    assert calls == ['all', 'all']
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='the patched tabula is only inherited by forked workers')
+def test_pages_are_split_across_processes_in_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pdf_tables.tabula, 'read_pdf', fake_read_pdf(calls))
+
+    # the workers are spawned, the test hands them a fork context instead so they inherit the patched tabula
+    methods = []
+    get_context = multiprocessing.get_context
+    monkeypatch.setattr(pdf_tables.multiprocessing, 'get_context', lambda method: methods.append(method) or get_context('fork'))
+
+    table_df = read_pdf_tables(FAKE_PDF, max_workers=3, cache_dir=None)
+
+    # the calls were made in the worker processes, so none were recorded here
+    assert methods == ['spawn']
+    assert calls == []
+    assert table_df['page'].tolist() == [1, 2, 3, 4, 5]
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+from conftest import make_orders, make_uuid
+from sqlalchemy import text
+
+from database_utils import DatabaseConnector
+from pipeline import Pipeline, Stage, build_pipeline
+
+
+def sleeping_stage(name, log, seconds=0.2, output=None, depends_on=()):
+    def run():
+        log.append(('start', name))
+        time.sleep(seconds)
+        log.append(('end', name))
+        return output
+
+    return Stage(name, run, depends_on)
+
+
+def test_independent_stages_run_concurrently():
+    """Six independent stages of 0.2s each finish in well under their combined 1.2s"""
+    log = []
+    pipeline = Pipeline([sleeping_stage(f'dim_{i}', log) for i in range(6)], max_workers=6)
+
+    start_time = time.perf_counter()
+    results = pipeline.run()
+
+    assert time.perf_counter() - start_time < 0.8
+    assert [result.status for result in results] == ['succeeded'] * 6
+
+
+def test_stage_waits_for_its_dependencies():
+    log = []
+    stages = [
+        sleeping_stage('dim_a', log, 0.1),
+        sleeping_stage('dim_b', log, 0.3),
+        sleeping_stage('star_schema', log, 0.0, depends_on=['dim_a', 'dim_b'])
+    ]
+
+    Pipeline(stages).run()
+
+    assert log.index(('start', 'star_schema')) > log.index(('end', 'dim_b'))
+
+
+def test_targets_pull_in_their_dependencies_only():
+    log = []
+    stages = [
+        sleeping_stage('dim_a', log, 0.0),
+        sleeping_stage('dim_b', log, 0.0),
+        sleeping_stage('fact', log, 0.0, depends_on=['dim_a'])
+    ]
+    pipeline = Pipeline(stages)
+
+    assert pipeline.select(['fact']) == ['dim_a', 'fact']
+    assert pipeline.select(['fact'], with_dependencies=False) == ['fact']
+    assert [result.name for result in pipeline.run(['fact'])] == ['dim_a', 'fact']
+    assert ('start', 'dim_b') not in log
+
+    with pytest.raises(ValueError):
+        pipeline.select(['dim_c'])
+
+
+def test_failure_skips_downstream_stages_only():
+    log = []
+
+    def fail():
+        raise RuntimeError('source unavailable')
+
+    stages = [
+        Stage('dim_a', fail),
+        sleeping_stage('dim_b', log, 0.0),
+        sleeping_stage('fact', log, 0.0, depends_on=['dim_a', 'dim_b'])
+    ]
+
+    results = {result.name: result for result in Pipeline(stages).run()}
+
+    assert results['dim_a'].status == 'failed'
+    assert 'source unavailable' in results['dim_a'].error
+    assert results['dim_b'].status == 'succeeded'
+    assert results['fact'].status == 'skipped'
+    assert ('start', 'fact') not in log
+
+
+def test_invalid_graphs_are_rejected():
+    noop = lambda: None
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage('fact', noop, ['dim_missing'])])
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage('a', noop, ['b']), Stage('b', noop, ['a'])])
+
+
+def test_results_record_rows_and_bytes():
+    df = pd.DataFrame({'user_uuid': ['a', 'b', 'c'], 'product_quantity': [1, 2, 3]})
+    stages = [Stage('dim_users', lambda: df), Stage('orders_table', lambda: 120123), Stage('star_schema', lambda: None)]
+
+    results = {result.name: result for result in Pipeline(stages).run()}
+
+    assert results['dim_users'].rows == 3
+    assert results['dim_users'].bytes == df.memory_usage(index=True, deep=True).sum()
+    assert results['orders_table'].rows == 120123
+    assert results['orders_table'].bytes is None
+    assert results['star_schema'].rows is None
+    assert all(result.wall_time >= 0 for result in results.values())
+
+
+def test_build_pipeline_wires_the_cleaner():
+    """Every table stage calls its clean_* method, then star_schema and the indexes run last"""
+    calls = []
+    lock = threading.Lock()
+
+    class FakeCleaner:
+        def __getattr__(self, name):
+            def clean():
+                with lock:
+                    calls.append(name)
+            return clean
+
+    cleaner = FakeCleaner()
+    cleaner.staging = None
+    cleaner.db_connect = type('Connector', (), {'run_sql_file': lambda self, path: calls.append(path)})()
+
+    results = build_pipeline(cleaner, schema_file='schema.sql', index_file='indexes.sql').run()
+
+    assert [result.status for result in results] == ['succeeded'] * 8
+    assert sorted(calls[:6]) == sorted(['clean_user_data', 'clean_card_details', 'clean_store_data', 'clean_products_data', 'clean_date_events_data', 'clean_orders_data'])
+    assert calls[6:] == ['schema.sql', 'indexes.sql']
+
+
+def test_run_sql_file(postgres_creds, tmp_path):
+    sql_file = tmp_path / 'schema.sql'
+    sql_file.write_text('CREATE TABLE dim_users (user_uuid UUID PRIMARY KEY);\nALTER TABLE dim_users ADD COLUMN first_name VARCHAR(255);\n')
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        timings = connector.run_sql_file(str(sql_file))
+
+        with connector.get_engine(postgres_creds).connect() as connection:
+            columns = connection.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name = 'dim_users' ORDER BY ordinal_position")).scalars().all()
+
+    assert columns == ['user_uuid', 'first_name']
+    assert [timing['statement'] for timing in timings] == ['CREATE TABLE dim_users (user_uuid UUID PRIMARY KEY)', 'ALTER TABLE dim_users ADD COLUMN first_name VARCHAR(255)']
+
+
+def test_indexes_are_built_on_the_orders_join_columns(postgres_creds):
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        connector.upload_to_db(make_orders(0, 50), 'orders_table')
+        for table, key in [('dim_users', 'user_uuid'), ('dim_card_details', 'card_number'), ('dim_store_details', 'store_code'), ('dim_products', 'product_code'), ('dim_date_times', 'date_uuid')]:
+            connector.upload_to_db(pd.DataFrame({key: [make_uuid(0), make_uuid(1)] if key.endswith('uuid') else ['A1', 'B2']}), table)
+
+        timings = connector.run_sql_file('star_schema_indexes.sql')
+        # rerunning the file after a reload keeps the existing indexes
+        connector.run_sql_file('star_schema_indexes.sql')
+
+        with connector.get_engine(postgres_creds).connect() as connection:
+            indexes = connection.execute(text("SELECT indexdef FROM pg_indexes WHERE tablename = 'orders_table'")).scalars().all()
+            analyzed = connection.execute(text("SELECT last_analyze IS NOT NULL FROM pg_stat_user_tables WHERE relname = 'orders_table'")).scalar()
+
+    assert sorted(index.split('(')[-1].rstrip(')') for index in indexes) == ['card_number', 'date_uuid', 'product_code', 'store_code', 'user_uuid']
+    assert analyzed
+    assert len(timings) == 12 and all(timing['seconds'] >= 0 for timing in timings)
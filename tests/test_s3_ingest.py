@@ -0,0 +1,108 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from data_extraction import DataExtractor as PandasDataExtractor
+from duckdb_data_extraction import DataExtractor as DuckDBDataExtractor
+from s3_ingest import read_s3_csv, read_s3_object
+from source_cache import SourceCache
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+PRODUCTS_CSV = (
+    ',product_name,product_price,weight,category,EAN,date_added,uuid,removed,product_code\n'
+    + ''.join(
+        f'{i},Product {i},£{i}.99,{i * 10}g,homeware,{1000000 + i},2005-12-{1 + i % 28:02d},uuid-{i},Still_avaliable,A{i}-1\n'
+        for i in range(200)
+    )
+    + '200,NULL,NULL,NULL,NULL,NULL,NULL,NULL,NULL,NULL\n'
+).encode()
+
+
+@pytest.fixture
+def s3_client():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='eu-west-1')
+        client.create_bucket(Bucket='data-handling-public', CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        client.put_object(Bucket='data-handling-public', Key='products.csv', Body=PRODUCTS_CSV)
+        yield client
+
+
+def counting_get_object(client):
+    ranges = []
+    get_object = client.get_object
+
+    def wrapper(**kwargs):
+        ranges.append(kwargs.get('Range'))
+        return get_object(**kwargs)
+
+    client.get_object = wrapper
+    return ranges
+
+
+def test_small_objects_are_streamed_in_one_request(s3_client):
+    ranges = counting_get_object(s3_client)
+
+    products_df = read_s3_csv('data-handling-public', 'products.csv', s3_client)
+
+    assert ranges == [None]
+    expected = pd.read_csv(io.BytesIO(PRODUCTS_CSV), index_col=0)
+    assert products_df['product_name'].fillna('missing').tolist() == expected['product_name'].fillna('missing').tolist()
+    assert products_df.index.tolist() == list(range(201))
+    assert products_df.index.name is None
+
+
+def test_large_objects_are_read_in_ranged_parts(s3_client):
+    ranges = counting_get_object(s3_client)
+
+    table = read_s3_csv('data-handling-public', 'products.csv', s3_client, as_arrow=True, part_size=1000, max_workers=4)
+
+    assert len(ranges) == -(-len(PRODUCTS_CSV) // 1000)
+    assert all(byte_range.startswith('bytes=') for byte_range in ranges)
+    assert isinstance(table, pa.Table)
+    assert table.num_rows == 201
+    assert table.column('product_code').to_pylist()[:3] == ['A0-1', 'A1-1', 'A2-1']
+
+
+def test_ranged_parts_reassemble_the_object(s3_client):
+    size = len(PRODUCTS_CSV)
+
+    buffer = read_s3_object(s3_client, 'data-handling-public', 'products.csv', size, part_size=333, max_workers=3)
+
+    assert buffer.to_pybytes() == PRODUCTS_CSV
+
+
+@pytest.mark.parametrize('extractor_class, method', [(PandasDataExtractor, 'extract_from_s3'), (DuckDBDataExtractor, 'extact_from_s3')])
+@pytest.mark.parametrize('bypass', [False, True])
+def test_extractors_read_products(s3_client, tmp_path, monkeypatch, extractor_class, method, bypass):
+    monkeypatch.setattr(boto3, 'client', lambda *args, **kwargs: s3_client)
+    extractor = extractor_class(db_connector=object(), cache=SourceCache(tmp_path, bypass=bypass))
+
+    products_df = getattr(extractor, method)('s3://data-handling-public/products.csv')
+    expected = pd.read_csv(io.BytesIO(PRODUCTS_CSV), index_col=0)
+
+    assert list(products_df.columns) == list(expected.columns)
+    assert products_df.index.tolist() == expected.index.tolist()
+    assert products_df['product_price'].tolist()[:200] == expected['product_price'].tolist()[:200]
+    assert products_df['weight'].isna().tolist() == expected['weight'].isna().tolist()
+
+
+@pytest.mark.parametrize('extractor_class, method', [(PandasDataExtractor, 'extract_from_s3'), (DuckDBDataExtractor, 'extact_from_s3')])
+def test_cached_objects_are_downloaded_in_ranged_parts_to_disk(s3_client, tmp_path, monkeypatch, extractor_class, method):
+    monkeypatch.setattr(boto3, 'client', lambda *args, **kwargs: s3_client)
+    ranges = counting_get_object(s3_client)
+    cache = SourceCache(tmp_path, max_age=0)
+    extractor = extractor_class(db_connector=object(), cache=cache)
+
+    first = getattr(extractor, method)('s3://data-handling-public/products.csv', as_arrow=True)
+    # the stale copy is revalidated with a HEAD request and not downloaded again
+    second = getattr(extractor, method)('s3://data-handling-public/products.csv', as_arrow=True)
+
+    assert ranges == ['bytes=0-' + str(len(PRODUCTS_CSV) - 1)]
+    assert first.equals(second)
+    assert first.num_rows == 201
+    blob = tmp_path / 'blobs' / cache.cached_entry('s3://data-handling-public/products.csv')['sha256']
+    assert blob.read_bytes() == PRODUCTS_CSV
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+from conftest import make_star_schema
+
+from database_utils import DatabaseConnector
+from sales_queries import SalesQueries, load_queries, results_match, to_duckdb_sql
+from staging import ParquetStaging
+
+
+@pytest.fixture
+def staged_schema(tmp_path):
+    staging = ParquetStaging(tmp_path / 'staging')
+    tables = make_star_schema()
+    for table_name, table in tables.items():
+        staging.write(table_name, table)
+
+    return staging, tables
+
+
+def test_load_queries_keys_statements_by_their_comment():
+    queries = load_queries()
+
+    assert len(queries) == 9
+    assert list(queries)[0] == 'How many stores does the business have in each country?'
+    assert all(sql.upper().lstrip().startswith(('SELECT', 'WITH')) for sql in queries.values())
+
+
+def test_numeric_casts_are_widened():
+    assert to_duckdb_sql('ROUND(SUM(x)::NUMERIC, 2) / (y)::numeric') == 'ROUND(SUM(x)::DECIMAL(38, 10), 2) / (y)::DECIMAL(38, 10)'
+
+
+def test_queries_run_over_the_staged_parquet(staged_schema):
+    staging, tables = staged_schema
+    sales_queries = SalesQueries(staging.staging_dir)
+
+    results = sales_queries.run_all()
+
+    assert len(results) == 9
+    assert all(isinstance(result, pd.DataFrame) and not result.empty for result in results.values())
+
+    # the partition columns of the staged orders don't leak into the view
+    assert 'year' not in sales_queries.run_sql('SELECT * FROM orders_table LIMIT 1').columns
+
+    prices = {'A1': 9.99, 'B2': 120.50, 'C3': 0.35}
+    orders = tables['orders_table'].merge(tables['dim_store_details'], on='store_code')
+    orders['sales'] = orders['product_quantity'] * orders['product_code'].map(prices)
+    expected = orders.groupby('store_type')['sales'].sum().round(2).sort_values(ascending=False)
+
+    store_types = results['What percentage of sales come through each type of store?']
+    assert store_types['store_type'].tolist() == expected.index.tolist()
+    assert store_types['total_sales'].astype(float).tolist() == pytest.approx(expected.tolist())
+    assert float(store_types['Percentage'].astype(float).sum()) == pytest.approx(100, abs=0.05)
+
+
+def test_results_match_ignores_tie_order_and_number_types():
+    expected = pd.DataFrame({'total': [1.0, 1.0], 'name': ['a', 'b']})
+
+    assert results_match(expected, pd.DataFrame({'total': [1.004, 0.999], 'name': ['b', 'a']}))
+    assert not results_match(expected, pd.DataFrame({'total': [1.0, 2.0], 'name': ['a', 'b']}))
+
+
+def test_parity_with_postgres(staged_schema, postgres_creds):
+    staging, tables = staged_schema
+    connector = DatabaseConnector(target_creds_file=postgres_creds)
+    staging.publish(connector)
+
+    sales_queries = SalesQueries(staging.staging_dir)
+    sales_queries.refresh_aggregates()
+    parity = sales_queries.check_parity(connector)
+    connector.close()
+
+    assert len(parity) == 9
+    assert all(parity.values()), [title for title, matches in parity.items() if not matches]
@@ -0,0 +1,176 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from conftest import make_orders, make_uuid
+from sqlalchemy import text
+
+from data_cleaning import DataCleaning
+from database_utils import DatabaseConnector
+from duckdb_database_utils import DatabaseConnector as DuckDBDatabaseConnector
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+from local_store_api import make_store
+from schema_registry import conform_frame, duckdb_select, postgres_enum_statements
+
+PRODUCTS_CSV = os.path.join(os.path.dirname(__file__), '..', 'products.csv')
+
+
+def column_types(engine, table_name):
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            'SELECT column_name, data_type, character_maximum_length, udt_name FROM information_schema.columns WHERE table_name = :table_name'
+        ), {'table_name': table_name}).all()
+
+    return {column: udt_name if data_type == 'USER-DEFINED' else (data_type, length) for column, data_type, length, udt_name in rows}
+
+
+def test_products_are_cleaned_to_their_final_types():
+    products = pd.read_csv(PRODUCTS_CSV, index_col=0).head(200)
+
+    table = DataCleaning(db_connector=object()).clean_products_frame(products.copy())
+
+    assert 'removed' not in table.columns
+    assert table['product_price'].dtype == 'float64'
+    assert table['product_price'].iloc[0] == 39.99
+    assert table['still_available'].dtype == bool
+    assert table['still_available'].tolist() == (products.loc[table.index - 1, 'removed'] == 'Still_avaliable').tolist()
+
+    expected_classes = pd.Series('Truck_Required', index=table.index)
+    expected_classes[table['weight'] < 140] = 'Heavy'
+    expected_classes[table['weight'] < 40] = 'Mid_Sized'
+    expected_classes[table['weight'] < 2] = 'Light'
+    assert table['weight_class'].astype(str).tolist() == expected_classes.tolist()
+
+
+def test_conform_frame():
+    table = pd.DataFrame({
+        'card_number': [4000000000000000.0, None],
+        'expiry_date': ['09/26', '10/23'],
+        'staff_numbers': ['12', None],
+        'longitude': ['-0.12', 'N/A']
+    })
+
+    conform_frame('dim_card_details', table)
+    conform_frame('dim_store_details', table)
+
+    assert table['card_number'].tolist() == ['4000000000000000', None]
+    assert table['staff_numbers'].dtype == 'Int16'
+    assert table['longitude'].isna().tolist() == [False, True]
+
+
+def test_duckdb_select_casts_registered_columns():
+    select = duckdb_select('orders_table', ['index', 'date_uuid', 'card_number', 'product_quantity'], 'temp_df')
+
+    assert select == 'SELECT "index", CAST("date_uuid" AS UUID) AS "date_uuid", CAST("card_number" AS VARCHAR) AS "card_number", ' \
+                     'CAST("product_quantity" AS SMALLINT) AS "product_quantity" FROM temp_df'
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_tables_are_created_with_their_final_types(postgres_creds, bulk):
+    orders = DataCleaning(db_connector=object()).clean_orders_frame(make_orders(0, 20))
+    products = DataCleaning(db_connector=object()).clean_products_frame(pd.read_csv(PRODUCTS_CSV, index_col=0).head(50))
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        connector.upload_to_db(orders, 'orders_table', bulk=bulk)
+        connector.upload_to_db(products, 'dim_products', bulk=bulk)
+        engine = connector.get_engine(postgres_creds)
+
+        orders_types = column_types(engine, 'orders_table')
+        products_types = column_types(engine, 'dim_products')
+
+    assert orders_types['date_uuid'] == ('uuid', None)
+    assert orders_types['card_number'] == ('character varying', 22)
+    assert orders_types['product_quantity'] == ('smallint', None)
+    assert products_types['product_price'][0] in ('double precision', 'real')
+    assert products_types['still_available'] == ('boolean', None)
+    assert products_types['weight_class'] == 'weight_class_enum'
+    assert products_types['category'] == 'category_enum'
+    assert products_types['date_added'] == ('date', None)
+
+
+def test_low_cardinality_columns_stay_categorical():
+    table = pd.DataFrame({'store_type': ['Local', 'Web Portal', None], 'country_code': ['GB', 'DE', 'US']})
+
+    conform_frame('dim_store_details', table)
+
+    assert list(table['store_type'].cat.categories) == ['Web Portal', 'Local', 'Super Store', 'Mall Kiosk', 'Outlet']
+    assert table['country_code'].cat.codes.dtype == 'int8'
+    with pytest.raises(ValueError, match='Pop-up'):
+        conform_frame('dim_store_details', pd.DataFrame({'store_type': ['Local', 'Pop-up']}))
+
+
+def test_duckdb_cleaner_emits_dictionary_arrays():
+    stores = pa.Table.from_pylist([make_store(i) for i in range(10)])
+
+    table = DuckDBDataCleaning(db_connector=object()).clean_store_frame(stores, as_arrow=True)
+
+    for column in ['country_code', 'continent', 'store_type']:
+        assert pa.types.is_dictionary(table.schema.field(column).type)
+
+
+def test_enum_types_are_shared_and_survive_reloads(postgres_creds):
+    users = pd.DataFrame({'user_uuid': [make_uuid(0)], 'country_code': pd.Categorical(['GB'])})
+    stores = pd.DataFrame({'store_code': ['WEB-1'], 'country_code': pd.Categorical(['DE']), 'store_type': pd.Categorical(['Web Portal'])})
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        connector.upload_to_db(conform_frame('dim_users', users), 'dim_users')
+        connector.upload_to_db(conform_frame('dim_store_details', stores), 'dim_store_details')
+        connector.upload_to_db(conform_frame('dim_store_details', stores), 'dim_store_details', bulk=True)
+        engine = connector.get_engine(postgres_creds)
+
+        with engine.connect() as connection:
+            stored = connection.execute(text("SELECT store_type FROM dim_store_details")).scalar()
+            enum_types = connection.execute(text("SELECT typname FROM pg_type WHERE typtype = 'e' ORDER BY typname")).scalars().all()
+
+    assert column_types(engine, 'dim_users')['country_code'] == column_types(engine, 'dim_store_details')['country_code'] == 'country_code_enum'
+    assert stored == 'Web Portal'
+    assert enum_types == ['country_code_enum', 'store_type_enum']
+
+
+def test_enum_statements_convert_varchar_columns_to_shared_types(postgres_creds):
+    users = pd.DataFrame({'user_uuid': [make_uuid(0)], 'country_code': ['GB']})
+    stores = pd.DataFrame({'store_code': ['WEB-1'], 'country_code': ['DE'], 'store_type': ['Web Portal']})
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        engine = connector.get_engine(postgres_creds)
+        # the columns are created as text, as the DuckDB connector creates them, and converted as it converts them
+        for table_name, table in [('dim_users', users), ('dim_store_details', stores), ('dim_store_details', stores)]:
+            table.to_sql(table_name, engine, if_exists='replace', index=False)
+            with engine.begin() as connection:
+                for statement in postgres_enum_statements(table_name, table.columns):
+                    connection.exec_driver_sql(statement)
+
+        with engine.connect() as connection:
+            stored = connection.execute(text("SELECT store_type FROM dim_store_details")).scalar()
+            enum_types = connection.execute(text("SELECT typname FROM pg_type WHERE typtype = 'e' ORDER BY typname")).scalars().all()
+
+    assert column_types(engine, 'dim_users')['country_code'] == column_types(engine, 'dim_store_details')['country_code'] == 'country_code_enum'
+    assert stored == 'Web Portal'
+    assert enum_types == ['country_code_enum', 'store_type_enum']
+
+
+def test_duckdb_connector_loads_enum_columns_as_shared_types(postgres_creds):
+    duckdb = pytest.importorskip('duckdb')
+    try:
+        duckdb.connect().execute('INSTALL postgres; LOAD postgres')
+    except duckdb.Error:
+        pytest.skip("DuckDB's postgres extension isn't available")
+
+    users = pa.table({'user_uuid': [make_uuid(0)], 'country_code': pa.array(['GB']).dictionary_encode()})
+    stores = pa.table({'store_code': ['WEB-1'], 'country_code': pa.array(['DE']).dictionary_encode(), 'store_type': pa.array(['Web Portal']).dictionary_encode()})
+
+    with DuckDBDatabaseConnector(target_creds_file=postgres_creds) as connector:
+        connector.upload_to_db(users, 'dim_users')
+        connector.upload_to_db(stores, 'dim_store_details')
+        connector.upload_to_db(stores, 'dim_store_details')
+
+    with DatabaseConnector(target_creds_file=postgres_creds) as connector:
+        engine = connector.get_engine(postgres_creds)
+        with engine.connect() as connection:
+            stored = connection.execute(text("SELECT store_type FROM dim_store_details")).scalar()
+            enum_types = connection.execute(text("SELECT typname FROM pg_type WHERE typtype = 'e' ORDER BY typname")).scalars().all()
+
+    assert column_types(engine, 'dim_users')['country_code'] == column_types(engine, 'dim_store_details')['country_code'] == 'country_code_enum'
+    assert stored == 'Web Portal'
+    assert enum_types == ['country_code_enum', 'store_type_enum']
@@ -0,0 +1,186 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from local_store_api import LocalStoreAPI
+from source_cache import SourceCache
+from store_api import fetch_store_details
+
+
+class FileServer:
+    """Serves one mutable file with an ETag and answers If-None-Match with 304, counting requests and full downloads"""
+
+    def __init__(self, content=b'date_uuid,timestamp\n1,12:00:00\n', etag=True):
+        self.content = content
+        self.etag = etag
+        self.requests = 0
+        self.downloads = 0
+
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                owner.requests += 1
+                tag = '"' + hashlib.md5(owner.content).hexdigest() + '"'
+
+                if owner.etag and self.headers.get('If-None-Match') == tag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                owner.downloads += 1
+                self.send_response(200)
+                if owner.etag:
+                    self.send_header('ETag', tag)
+                self.send_header('Content-Length', str(len(owner.content)))
+                self.end_headers()
+                self.wfile.write(owner.content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, name='date_details.json'):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/{name}'
+
+
+@pytest.fixture
+def file_server():
+    server = FileServer()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def test_fresh_entries_skip_the_network(tmp_path, file_server):
+    first = SourceCache(tmp_path, max_age=3600).get_url(file_server.url())
+    # a new instance reads the index written by the first one, as on the next run of the pipeline
+    second = SourceCache(tmp_path, max_age=3600).get_url(file_server.url())
+
+    assert first == second == file_server.content
+    assert file_server.requests == 1
+
+
+def test_stale_entries_are_revalidated(tmp_path, file_server):
+    cache = SourceCache(tmp_path, max_age=0)
+
+    cache.get_url(file_server.url())
+    assert cache.get_url(file_server.url()) == file_server.content
+    assert (file_server.requests, file_server.downloads) == (2, 1)
+
+    file_server.content = b'date_uuid,timestamp\n2,13:00:00\n'
+    assert cache.get_url(file_server.url()) == file_server.content
+    assert (file_server.requests, file_server.downloads) == (3, 2)
+
+
+def test_unchanged_content_without_validators_shares_a_blob(tmp_path, file_server):
+    file_server.etag = False
+    cache = SourceCache(tmp_path, max_age=0)
+
+    cache.get_url(file_server.url('a.json'))
+    cache.get_url(file_server.url('a.json'))
+    cache.get_url(file_server.url('b.json'))
+
+    assert file_server.downloads == 3
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SourceCache(tmp_path, max_bytes=250)
+    contents = {key: key.encode() * 100 for key in ['a', 'b', 'c']}
+    fetch = lambda key: lambda entry: (contents[key], {})
+
+    cache.get('a', fetch('a'))
+    cache.get('b', fetch('b'))
+    cache.get('a', fetch('a'))
+    cache.get('c', fetch('c'))
+
+    assert cache.cached_entry('a') is not None
+    assert cache.cached_entry('b') is None
+    assert cache.cached_entry('c') is not None
+    assert len(list((tmp_path / 'blobs').iterdir())) == 2
+
+
+def test_bypass_neither_reads_nor_writes(tmp_path, file_server):
+    SourceCache(tmp_path).get_url(file_server.url())
+    SourceCache(tmp_path, bypass=True).get_url(file_server.url())
+    SourceCache(tmp_path / 'other', bypass=True).get_url(file_server.url())
+
+    assert file_server.requests == 3
+    assert not (tmp_path / 'other').exists()
+
+
+def test_s3_objects_are_revalidated_with_their_etag(tmp_path):
+    boto3 = pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+
+    with moto.mock_aws():
+        s3 = boto3.client('s3', region_name='eu-west-1')
+        s3.create_bucket(Bucket='data-handling-public', CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+        s3.put_object(Bucket='data-handling-public', Key='products.csv', Body=b',product_name\n0,Mug\n')
+
+        calls = []
+        original_get_object = s3.get_object
+
+        def get_object(**kwargs):
+            calls.append(kwargs)
+            return original_get_object(**kwargs)
+
+        s3.get_object = get_object
+        cache = SourceCache(tmp_path, max_age=0)
+
+        assert cache.get_s3_object('data-handling-public', 'products.csv', s3) == b',product_name\n0,Mug\n'
+        assert cache.get_s3_object('data-handling-public', 'products.csv', s3) == b',product_name\n0,Mug\n'
+        assert 'IfNoneMatch' in calls[1]
+
+        s3.put_object(Bucket='data-handling-public', Key='products.csv', Body=b',product_name\n0,Cup\n')
+        assert cache.get_s3_object('data-handling-public', 'products.csv', s3) == b',product_name\n0,Cup\n'
+
+
+def test_store_details_are_served_from_the_cache(tmp_path):
+    with LocalStoreAPI(number_of_stores=20) as api:
+        first = fetch_store_details(api.store_details_url, {}, 20, max_workers=8, cache=SourceCache(tmp_path))
+        second = fetch_store_details(api.store_details_url, {}, 20, max_workers=8, cache=SourceCache(tmp_path))
+
+        assert first == second == api.stores
+        assert api.request_count == 20
+
+
+def test_store_details_write_the_index_once_per_batch(tmp_path, monkeypatch):
+    with LocalStoreAPI(number_of_stores=20) as api:
+        fetch_store_details(api.store_details_url, {}, 20, max_workers=8, cache=SourceCache(tmp_path))
+        cache = SourceCache(tmp_path)
+        last_used = {key: entry['last_used'] for key, entry in cache._read_index().items()}
+
+        writes = []
+        write_index = SourceCache._write_index
+        monkeypatch.setattr(SourceCache, '_write_index', lambda self: writes.append(self._batch_depth) or write_index(self))
+
+        fetch_store_details(api.store_details_url, {}, 20, max_workers=8, cache=cache)
+
+        assert api.request_count == 20
+        # every cached hit is deferred and the index is written once, when the batch ends
+        assert writes.count(0) == 1
+        assert all(entry['last_used'] > last_used[key] for key, entry in SourceCache(tmp_path)._read_index().items())
+
+
+def test_an_entry_evicted_while_it_is_revalidated_is_downloaded_again(tmp_path):
+    cache = SourceCache(tmp_path, max_age=0)
+    cache.get('a', lambda entry: (b'a' * 100, {'etag': '"a"'}))
+    entries = []
+
+    def fetch(entry):
+        entries.append(entry)
+        if entry is not None:
+            # another thread evicts the cached copy while the source answers that it is still current
+            cache.clear()
+            return None, {}
+        return b'a' * 100, {'etag': '"a"'}
+
+    assert cache.get('a', fetch) == b'a' * 100
+    assert [entry is not None for entry in entries] == [True, False]
+    assert cache.cached_entry('a') is not None
@@ -0,0 +1,79 @@
+import datetime
+
+import pandas as pd
+import pytest
+from conftest import make_orders
+
+from data_cleaning import DataCleaning
+from staging import ParquetStaging
+
+
+def make_date_times(orders):
+    """One dim_date_times row per order, spread over two years and three months"""
+    return pd.DataFrame({
+        'timestamp': [datetime.time(12, 0)] * len(orders),
+        'month': [1 + i % 3 for i in range(len(orders))],
+        'year': [2021 + i % 2 for i in range(len(orders))],
+        'day': 1,
+        'time_period': 'Midday',
+        'date_uuid': orders['date_uuid'].tolist()
+    })
+
+
+def test_orders_are_partitioned_by_year_and_month(tmp_path, sqlite_connector):
+    staging = ParquetStaging(tmp_path)
+    orders = DataCleaning(db_connector=object()).clean_orders_frame(make_orders(0, 30))
+
+    with pytest.raises(ValueError):
+        staging.write('orders_table', orders)
+
+    staging.write('dim_date_times', make_date_times(orders))
+    staging.write('orders_table', orders)
+
+    partitions = sorted(path.relative_to(tmp_path / 'orders_table').as_posix() for path in (tmp_path / 'orders_table').glob('year=*/month=*'))
+    assert partitions == [f'year={year}/month={month}' for year in (2021, 2022) for month in (1, 2, 3)]
+    assert all(path.suffix == '.parquet' for path in (tmp_path / 'orders_table').rglob('*') if path.is_file())
+
+    staged = staging.read('orders_table').sort_values('date_uuid').reset_index(drop=True)
+    pd.testing.assert_frame_equal(staged, orders.reset_index(drop=True), check_dtype=False)
+
+
+def test_append_and_replace(tmp_path):
+    staging = ParquetStaging(tmp_path)
+    users = pd.DataFrame({'user_uuid': ['a', 'b'], 'country_code': pd.Categorical(['GB', 'US'])})
+
+    staging.write('dim_users', users)
+    staging.write('dim_users', users.assign(user_uuid=['c', 'd']), if_exists='append')
+    assert sorted(staging.read('dim_users')['user_uuid']) == ['a', 'b', 'c', 'd']
+    assert staging._read_manifest()['dim_users']['rows'] == 4
+
+    staging.write('dim_users', users)
+    assert sorted(staging.read('dim_users')['user_uuid']) == ['a', 'b']
+    assert [path.name for path in tmp_path.iterdir() if path.is_dir()] == ['dim_users']
+
+
+def test_publish_loads_staged_tables_without_partition_columns(tmp_path, sqlite_connector):
+    staging = ParquetStaging(tmp_path)
+    orders = DataCleaning(db_connector=object()).clean_orders_frame(make_orders(0, 12))
+    staging.write('dim_date_times', make_date_times(orders))
+    staging.write('orders_table', orders)
+
+    published = staging.publish(sqlite_connector)
+
+    assert published == {'dim_date_times': 12, 'orders_table': 12}
+    loaded = pd.read_sql_table('orders_table', sqlite_connector.target_engine)
+    assert sorted(loaded.columns) == sorted(orders.columns)
+    assert sorted(loaded['date_uuid']) == sorted(orders['date_uuid'])
+
+
+def test_cleaner_stages_what_it_uploads(tmp_path, sqlite_connector):
+    make_orders(0, 20).to_sql('orders_table', sqlite_connector.source_engine, index=False)
+    staging = ParquetStaging(tmp_path)
+    cleaner = DataCleaning(sqlite_connector, staging=staging)
+    staging.write('dim_date_times', make_date_times(make_orders(0, 20)))
+
+    cleaner.clean_orders_data(chunksize=7)
+
+    uploaded = pd.read_sql_table('orders_table', sqlite_connector.target_engine)
+    assert staging._read_manifest()['orders_table']['rows'] == len(uploaded) == 20
+    assert sorted(staging.read('orders_table')['date_uuid']) == sorted(uploaded['date_uuid'])
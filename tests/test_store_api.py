@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+import requests
+import yaml
+from local_store_api import LocalStoreAPI
+from source_cache import SourceCache
+from store_api import fetch_store_details
+from data_extraction import DataExtractor as PandasDataExtractor
+from duckdb_data_extraction import DataExtractor as DuckDBDataExtractor
+
+
+def test_fetch_store_details_keeps_index_order():
+    """Concurrent responses are reassembled in store index order"""
+    with LocalStoreAPI(number_of_stores=40, latency=0.01) as api:
+        stores = fetch_store_details(api.store_details_url, {}, 40, max_workers=8)
+
+    assert [store['index'] for store in stores] == list(range(40))
+    assert stores == api.stores
+
+
+def test_fetch_store_details_retries_transient_errors():
+    """503 responses are retried until the store details come back"""
+    with LocalStoreAPI(number_of_stores=5, transient_failures=2) as api:
+        stores = fetch_store_details(api.store_details_url, {}, 5, max_workers=5, backoff=0.01)
+
+        assert stores == api.stores
+        assert api.request_count == 15
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_fetch_store_details_raises_on_error_responses(tmp_path, cached):
+    """A store that doesn't exist raises, with or without the cache, rather than being decoded into the stores"""
+    with LocalStoreAPI(number_of_stores=5) as api:
+        with pytest.raises(requests.HTTPError, match='404'):
+            fetch_store_details(api.store_details_url, {}, 6, max_workers=3, cache=SourceCache(tmp_path) if cached else None)
+
+def test_retrieve_stores_data_from_local_api(tmp_path, monkeypatch):
+    """Both extractors build the same stores DataFrame from the stand-in API"""
+    monkeypatch.chdir(tmp_path)
+    with open('api_key.yaml', 'w') as f:
+        yaml.dump({'x-api-key': 'test-key'}, f)
+
+    with LocalStoreAPI(number_of_stores=25, api_key='test-key') as api:
+        pandas_df = PandasDataExtractor().retrieve_stores_data(api.store_details_url, number_stores_endpoint=api.number_stores_url)
+        duckdb_df = DuckDBDataExtractor().retrieve_stores_data(api.store_details_url, max_workers=4, number_stores_endpoint=api.number_stores_url)
+
+    assert pandas_df.shape == (25, 12)
+    assert pandas_df['index'].tolist() == list(range(25))
+    pd.testing.assert_frame_equal(pandas_df, duckdb_df, check_dtype=False)
@@ -0,0 +1,96 @@
+import duckdb
+import pandas as pd
+import pytest
+from conftest import make_users
+
+import synthetic_data
+from data_cleaning import DataCleaning
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+from validation import RULES, AllowedValues, Matches, NotNull, Rule, RuleSet
+
+VALID_UUID = '00000000-0000-4000-8000-000000000000'
+
+RULE_SET = RuleSet([NotNull('code'), AllowedValues('code', ['GB', 'US']), Matches('uuid', r'[0-9a-f-]{36}')])
+ROWS = pd.DataFrame({
+    'code': ['GB', 'NULL', None, 'XX', 'US', 'GB', 'XX'],
+    'uuid': [VALID_UUID, VALID_UUID, VALID_UUID, VALID_UUID, 'not-a-uuid', None, 'not-a-uuid']
+})
+REASONS = [None, 'code_missing', 'code_missing', 'code_not_allowed', 'uuid_malformed', None, 'code_not_allowed']
+
+
+def test_rules_give_the_first_broken_rule():
+    clean, rejected = RULE_SET.split(ROWS)
+
+    assert RULE_SET.reasons(ROWS).tolist() == REASONS
+    assert clean.index.tolist() == [0, 5]
+    assert rejected['rejection_reason'].tolist() == [reason for reason in REASONS if reason]
+    assert rejected.drop(columns='rejection_reason').equals(ROWS.drop(index=[0, 5]))
+
+
+def test_sql_rules_match_the_pandas_rules():
+    conn = duckdb.connect()
+    conn.register('rows', ROWS)
+
+    reasons = conn.execute(f'SELECT {RULE_SET.reason(ROWS.columns)} FROM rows').df().iloc[:, 0]
+    valid = conn.execute(f'SELECT count(*) FROM rows WHERE {RULE_SET.condition(ROWS.columns)}').fetchone()[0]
+
+    assert reasons.where(reasons.notna(), None).tolist() == REASONS
+    assert valid == 2
+
+
+def test_rejected_rows_are_loaded_to_a_side_table(sqlite_connector):
+    make_users(0, 100).to_sql('legacy_users', sqlite_connector.source_engine, index=False)
+
+    DataCleaning(sqlite_connector).clean_user_data()
+
+    rejected = pd.read_sql_table('dim_users_rejected', sqlite_connector.target_engine)
+    assert len(pd.read_sql_table('dim_users', sqlite_connector.target_engine)) == 90
+    assert rejected['index'].tolist() == list(range(9, 100, 10))
+    assert set(rejected['rejection_reason']) == {'country_code_not_allowed'}
+
+
+def test_both_cleaners_reject_the_same_rows():
+    products = synthetic_data.make_products(3000)
+
+    pandas_cleaner = DataCleaning(db_connector=object())
+    duckdb_cleaner = DuckDBDataCleaning(db_connector=object())
+    pandas_clean = pandas_cleaner.clean_products_frame(products.copy())
+    duckdb_clean = duckdb_cleaner.clean_products_frame(products.copy())
+
+    pandas_rejected = pandas_cleaner.rejected['dim_products']
+    duckdb_rejected = duckdb_cleaner.rejected['dim_products'].to_pandas()
+    assert len(pandas_clean) + len(pandas_rejected) == len(duckdb_clean) + len(duckdb_rejected) == 3000
+    assert len(pandas_rejected) > 0 and set(pandas_rejected['rejection_reason']) <= {'category_missing', 'category_not_allowed'}
+    assert pandas_rejected.index.tolist() == (duckdb_rejected['product_index'] + 1).tolist()
+    assert pandas_rejected['rejection_reason'].tolist() == duckdb_rejected['rejection_reason'].tolist()
+
+
+def test_every_table_declares_its_rules():
+    assert set(RULES) == {'dim_users', 'dim_card_details', 'dim_store_details', 'dim_products', 'dim_date_times'}
+
+
+def test_a_rule_must_implement_both_checks():
+    class PandasOnly(Rule):
+        def failed(self, values):
+            return values.isna().to_numpy()
+
+    with pytest.raises(TypeError):
+        PandasOnly('code', 'code_missing')
+
+
+
+def test_duckdb_cleaner_splits_valid_and_rejected_rows_on_their_reason_codes():
+    cleaner = DuckDBDataCleaning(db_connector=object())
+    products = synthetic_data.make_products(3000)
+    cleaner.conn.register('products', products)
+
+    valid = cleaner.conn.execute(f"SELECT * FROM {cleaner.valid_rows('dim_products', 'products', products)}").df()
+    rejected = cleaner.rejected['dim_products']
+
+    assert list(valid.columns) == list(products.columns)
+    assert len(valid) + rejected.num_rows == 3000
+    assert rejected.num_rows > 0 and None not in rejected['rejection_reason'].to_pylist()
+
+    # the temporary table the rows were split in goes with the relation
+    cleaner.release('products')
+    assert cleaner.conn.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'products_checked'").fetchone()[0] == 0
@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+from benchmark_weight_conversion import convert_product_weights_apply, load_products
+from data_cleaning import DataCleaning as PandasDataCleaning
+from duckdb_data_cleaning import DataCleaning as DuckDBDataCleaning
+
+PRODUCTS_CSV = os.path.join(os.path.dirname(__file__), '..', 'products.csv')
+
+
+def test_vectorised_weights_match_apply_on_products_csv():
+    """Both vectorised engines give the same kg weights as the original apply version, except for ounces"""
+    products = load_products(PRODUCTS_CSV)
+    expected = convert_product_weights_apply(products.copy())['weight']
+    ounces = products['weight'] == '16oz'
+
+    for cleaner in (PandasDataCleaning(db_connector=object()), DuckDBDataCleaning(db_connector=object())):
+        weights = cleaner.convert_product_weights(products.copy())['weight']
+
+        pd.testing.assert_series_equal(weights[~ounces], expected[~ounces])
+        assert weights[ounces].round(4).tolist() == [0.4536]
+
+
+def test_weight_formats():
+    """Multipacks, ml, stray characters and unparseable entries"""
+    table = pd.DataFrame({'weight': ['12 x 100g', '100ml', '77g .', '1.6kg', 'Z8ZTDGUZVU', None, 'abc']})
+
+    for cleaner in (PandasDataCleaning(db_connector=object()), DuckDBDataCleaning(db_connector=object())):
+        weights = cleaner.convert_product_weights(table.copy())['weight']
+
+        assert weights.iloc[:5].tolist() == [1.2, 0.1, 0.077, 1.6, 8.0]
+        assert weights.iloc[5:].isna().all()
@@ -0,0 +1,173 @@
+"""
+The validity rules of every cleaned table, declared once and shared by the pandas and DuckDB cleaners.
+
+Each table has a RuleSet of allowed-value, regex and not-null rules. RuleSet.split evaluates all of a table's
+rules over a DataFrame in one vectorised pass. It returns the rows that pass and a quarantine frame of the rows that
+don't, with a rejection_reason column. The DuckDB cleaner computes RuleSet.reason once per row and splits the valid and
+rejected rows on it. A rejected row gets the reason code of the first rule it breaks, in declaration order.
+
+The cleaners load the rejected rows of a table into <table>_rejected next to it, instead of dropping them.
+
+The sources write missing values as NULL or as the text 'NULL', and NotNull rejects both. AllowedValues rejects
+missing values as well, since they aren't allowed values. Matches lets them through, so pair it with NotNull when a
+value is required. A rule whose column isn't in the table is skipped.
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from schema_registry import ENUMS
+
+UUID_PATTERN = r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+
+
+def sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class Rule(ABC):
+    """
+    A check on one column. failed() returns a mask of the rows of a DataFrame that break it and condition() the SQL
+    expression that is true for the rows that pass, never NULL
+    """
+
+    def __init__(self, column, reason):
+        self.column = column
+        self.reason = reason
+
+    @property
+    def sql_column(self):
+        return f'"{self.column}"'
+
+    @abstractmethod
+    def failed(self, values):
+        pass
+
+    @abstractmethod
+    def condition(self):
+        pass
+
+
+class NotNull(Rule):
+    """
+    Rejects missing values, including the text 'NULL'
+    """
+
+    def __init__(self, column, reason=None):
+        super().__init__(column, reason or f'{column}_missing')
+
+    def failed(self, values):
+        return values.isna().to_numpy() | (values.astype(object) == 'NULL').to_numpy()
+
+    def condition(self):
+        return f"({self.sql_column} IS NOT NULL AND CAST({self.sql_column} AS VARCHAR) <> 'NULL')"
+
+
+class AllowedValues(Rule):
+    """
+    Rejects values that aren't one of the allowed values, missing values included
+    """
+
+    def __init__(self, column, values, reason=None):
+        super().__init__(column, reason or f'{column}_not_allowed')
+        self.values = list(values)
+
+    def failed(self, values):
+        return ~values.isin(self.values).to_numpy()
+
+    def condition(self):
+        return f"COALESCE(CAST({self.sql_column} AS VARCHAR) IN ({', '.join(sql_string(value) for value in self.values)}), FALSE)"
+
+
+class Matches(Rule):
+    """
+    Rejects values that don't match the whole of a regular expression
+    """
+
+    def __init__(self, column, pattern, reason=None):
+        super().__init__(column, reason or f'{column}_malformed')
+        self.pattern = pattern
+
+    def failed(self, values):
+        # Arrow's vectorised regex, anchored so the whole value has to match
+        text = pa.array(values.astype(str).where(values.notna(), None), type=pa.string(), from_pandas=True)
+        matched = pc.match_substring_regex(text, f'^(?:{self.pattern})$').fill_null(True)
+
+        return ~matched.to_numpy(zero_copy_only=False)
+
+    def condition(self):
+        return f"COALESCE(regexp_full_match(CAST({self.sql_column} AS VARCHAR), {sql_string(self.pattern)}), TRUE)"
+
+
+class RuleSet:
+    """
+    The rules a table's rows must pass, evaluated together
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    def __add__(self, other):
+        return RuleSet(self.rules + list(other.rules if isinstance(other, RuleSet) else other))
+
+    def applicable(self, columns):
+        return [rule for rule in self.rules if rule.column in columns]
+
+    def reasons(self, table):
+        """
+        Returns the reason code of the first rule each row of a DataFrame breaks, None for the rows that pass
+        """
+        rules = self.applicable(table.columns)
+        if not rules:
+            return np.full(len(table), None, dtype=object)
+
+        return np.select([rule.failed(table[rule.column]) for rule in rules], [np.array(rule.reason, dtype=object) for rule in rules], default=None)
+
+    def split(self, table):
+        """
+        Returns the rows of a DataFrame that pass every rule and a quarantine frame of the rest, with their rejection_reason
+        """
+        reasons = self.reasons(table)
+        rejected_rows = pd.notna(reasons)
+
+        rejected = table[rejected_rows].copy()
+        rejected['rejection_reason'] = reasons[rejected_rows]
+
+        return table[~rejected_rows].copy(), rejected
+
+    def condition(self, columns):
+        """
+        Returns the SQL condition the rows that pass every rule meet, for a relation with the given columns
+        """
+        conditions = [rule.condition() for rule in self.applicable(columns)]
+
+        return ' AND '.join(conditions) if conditions else 'TRUE'
+
+    def reason(self, columns):
+        """
+        Returns the SQL expression giving the reason code of the first rule a row breaks, NULL for the rows that pass
+        """
+        rules = self.applicable(columns)
+        if not rules:
+            return 'NULL'
+
+        return 'CASE ' + ' '.join(f'WHEN NOT {rule.condition()} THEN {sql_string(rule.reason)}' for rule in rules) + ' END'
+
+
+def allowed_values(column):
+    """
+    The rules of an enumerated column: present, and one of its labels in schema_registry.ENUMS
+    """
+    return RuleSet([NotNull(column), AllowedValues(column, ENUMS[column])])
+
+
+RULES = {
+    'dim_users': allowed_values('country_code') + [Matches('user_uuid', UUID_PATTERN)],
+    'dim_card_details': allowed_values('card_provider'),
+    'dim_store_details': allowed_values('country_code'),
+    'dim_products': allowed_values('category') + [Matches('uuid', UUID_PATTERN)],
+    'dim_date_times': allowed_values('time_period') + [Matches('date_uuid', UUID_PATTERN)]
+}
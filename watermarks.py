@@ -0,0 +1,58 @@
+import json
+import os
+
+
+class WatermarkStore:
+    """
+    Persists the high-water mark of each incrementally extracted table in a JSON file.
+
+    A mark is stored together with the key column it was taken from, so changing the key for a table starts it again
+    from a full extraction rather than comparing against a value from a different column.
+    """
+
+    def __init__(self, path='watermarks.json'):
+        self.path = path
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def get(self, table, key='index'):
+        """
+        Returns the high-water mark for a table, or None if the table has not been extracted with this key before
+        """
+        entry = self._read().get(table)
+        if entry is None or entry['key'] != key:
+            return None
+
+        return entry['value']
+
+    def _write(self, watermarks):
+        # written to a temporary file and swapped in so an interrupted run never leaves the file half written
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(watermarks, f, indent=4, default=str)
+        os.replace(temp_path, self.path)
+
+    def set(self, table, value, key='index'):
+        """
+        Records a new high-water mark for a table
+        """
+        # numpy scalars are not JSON serialisable, .item() converts them to the matching python type
+        if hasattr(value, 'item'):
+            value = value.item()
+
+        watermarks = self._read()
+        watermarks[table] = {'key': key, 'value': value}
+        self._write(watermarks)
+
+    def reset(self, table):
+        """
+        Forgets the high-water mark for a table so the next run performs a full extraction
+        """
+        watermarks = self._read()
+        if watermarks.pop(table, None) is not None:
+            self._write(watermarks)